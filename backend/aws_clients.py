@@ -0,0 +1,69 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+# HTTP connections per client; S3 work fans out from the io pool and render threads
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+# botocore retry mode ("adaptive" adds client-side rate limiting on throttling) and total attempts
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "60"))
+# TCP keep-alive on pooled connections so idle ones are not silently dropped by NAT/LBs
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "1").lower() in ("1", "true", "yes")
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+    tcp_keepalive=AWS_TCP_KEEPALIVE,
+)
+
+_session: Optional[boto3.session.Session] = None
+_clients: Dict[Tuple[str, Optional[str]], object] = {}
+# boto3 sessions are not thread-safe, so client creation is serialized; clients are thread-safe once created
+_lock = threading.Lock()
+_stats = {"created": 0, "reused": 0}
+
+
+def client(service: str, region: Optional[str] = None):
+    """Shared botocore client for ``service`` in ``region`` (default: the session's region).
+
+    Clients are created once per process with CLIENT_CONFIG and reused, so
+    their connection pools and credential caches survive across requests.
+    """
+    cache_key = (service, region)
+    global _session
+    with _lock:
+        found = _clients.get(cache_key)
+        if found is not None:
+            _stats["reused"] += 1
+            return found
+        if _session is None:
+            _session = boto3.session.Session()
+        found = _clients[cache_key] = _session.client(service, region_name=region, config=CLIENT_CONFIG)
+        _stats["created"] += 1
+        return found
+
+
+def s3_client(region: Optional[str] = None):
+    return client("s3", region)
+
+
+def s3fs_config_kwargs() -> dict:
+    """botocore config for s3fs (aiobotocore), matching CLIENT_CONFIG where it applies."""
+    return {
+        "max_pool_connections": AWS_MAX_POOL_CONNECTIONS,
+        "retries": {"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+        "connect_timeout": AWS_CONNECT_TIMEOUT,
+        "read_timeout": AWS_READ_TIMEOUT,
+    }
+
+
+def aws_client_stats() -> dict:
+    with _lock:
+        return dict(_stats, clients=[f"{s}:{r or 'default'}" for s, r in _clients])
@@ -0,0 +1,80 @@
+"""Benchmark GPS point serialization for /api/gps/load and /api/local/load.
+
+Writes a synthetic trip parquet (lat/lon/timestamp plus IMU-like filler columns),
+then times the old DataFrame.iterrows() path against the columnar path in each
+output format. Run from backend/:
+
+    python benchmarks/gps_serialization.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gps_points import gps_payload, read_gps_table  # noqa: E402
+
+
+def make_trip(path: str, rows: int) -> None:
+    rng = np.random.default_rng(0)
+    start = 1_714_564_800.0
+    df = pd.DataFrame({
+        "timestamp": start + np.arange(rows) * 0.1,
+        "lat": 37.0 + np.cumsum(rng.normal(0, 1e-5, rows)),
+        "lon": -122.0 + np.cumsum(rng.normal(0, 1e-5, rows)),
+    })
+    # Columns the GPS endpoints never need; projection should skip them
+    for name in ("acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z", "speed", "heading"):
+        df[name] = rng.normal(0, 1, rows)
+    df.to_parquet(path, index=False)
+
+
+def legacy(path: str) -> bytes:
+    df = pd.read_parquet(path)
+    points = [
+        {"lat": float(row["lat"]), "lon": float(row["lon"]), "timestamp": row["timestamp"]}
+        for _, row in df.iterrows()
+    ]
+    return json.dumps({"points": points, "total_points": len(points)}).encode()
+
+
+def columnar(path: str, fmt: str) -> bytes:
+    return gps_payload(read_gps_table(path), fmt).body
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    body = fn(*args)
+    return time.perf_counter() - started, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=100_000,
+                        help="rows for the iterrows baseline (it is too slow to run at full size)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trip = os.path.join(tmp, "trip.parquet")
+        make_trip(trip, args.rows)
+        small = os.path.join(tmp, "trip_small.parquet")
+        make_trip(small, min(args.rows, args.legacy_rows))
+
+        results = [("iterrows (old)", min(args.rows, args.legacy_rows), *timed(legacy, small))]
+        for fmt in ("points", "columns", "arrow"):
+            results.append((f"columnar {fmt}", args.rows, *timed(columnar, trip, fmt)))
+
+    print(f"{'path':<18} {'rows':>10} {'seconds':>9} {'rows/s':>12} {'MB':>8}")
+    for name, rows, seconds, size in results:
+        print(f"{name:<18} {rows:>10} {seconds:>9.3f} {rows / seconds:>12,.0f} {size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
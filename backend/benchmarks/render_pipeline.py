@@ -0,0 +1,112 @@
+"""Benchmark the visualization render path on a synthetic clip.
+
+Generates a 60 s test clip with ffmpeg's testsrc2, then renders an ego-lane
+style mask overlay two ways: the old JPEG round trip (ffmpeg -> images/*.jpg ->
+cv2.imread/imwrite -> annotated/*.jpg -> ffmpeg) and the rawvideo pipe engine
+in visualization/frame_pipeline.py, serially and with --workers overlay
+threads. Needs ffmpeg/ffprobe on PATH. Run from backend/:
+
+    python benchmarks/render_pipeline.py --seconds 60 --fps 3 --size 1280x720 --workers 4
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visualization.frame_pipeline import render_overlay  # noqa: E402
+
+COLOR = np.array((0, 165, 255), dtype=np.float32)
+ALPHA = 0.5
+
+
+def make_clip(path: str, seconds: int, size: str) -> None:
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def lane_mask(height: int, width: int) -> np.ndarray:
+    mask = np.zeros((height // 4, width // 4), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.array([[width // 10, height // 4], [width // 8 * 1, height // 8],
+                                  [width // 8 * 1 + 20, height // 8], [width // 5, height // 4]])], 1)
+    return mask
+
+
+def blend(img: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    m = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+    img[m] = (img[m] * (1 - ALPHA) + COLOR * ALPHA).astype(img.dtype)
+    return img
+
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _d, files in os.walk(path) for f in files)
+
+
+def legacy(src: str, work: str, fps: int, mask: np.ndarray) -> int:
+    """The pre-pipeline renderers: returns bytes written to intermediate JPEGs."""
+    images_dir = os.path.join(work, "images")
+    ann_dir = os.path.join(work, "annotated")
+    os.makedirs(images_dir)
+    os.makedirs(ann_dir)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", src, "-vf", f"fps={fps}",
+                    os.path.join(images_dir, "%d.jpg")], check=True)
+    for name in sorted(os.listdir(images_dir), key=lambda x: int(os.path.splitext(x)[0])):
+        img = cv2.imread(os.path.join(images_dir, name))
+        cv2.imwrite(os.path.join(ann_dir, name), blend(img, mask))
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-framerate", str(fps), "-start_number", "1",
+                    "-i", os.path.join(ann_dir, "%d.jpg"), "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                    os.path.join(work, "out.mp4")], check=True)
+    return dir_bytes(images_dir) + dir_bytes(ann_dir)
+
+
+def pipeline(src: str, work: str, fps: int, mask: np.ndarray, workers: int = 1) -> int:
+    os.makedirs(work)
+    render_overlay(src, os.path.join(work, "out.mp4"), fps, lambda i, img, total: blend(img, mask), workers=workers)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--fps", type=int, default=3)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    mask = lane_mask(height, width)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = os.path.join(tmp, "clip.mp4")
+        make_clip(clip, args.seconds, args.size)
+        results = []
+        runs = [
+            ("jpeg round trip (old)", legacy, {}),
+            ("rawvideo pipe", pipeline, {}),
+            (f"pipe, {args.workers} workers", pipeline, {"workers": args.workers}),
+        ]
+        for i, (name, fn, kwargs) in enumerate(runs):
+            work = os.path.join(tmp, f"run{i}")
+            started = time.perf_counter()
+            scratch = fn(clip, work, args.fps, mask, **kwargs)
+            results.append((name, time.perf_counter() - started, scratch))
+            shutil.rmtree(work)
+
+    frames = args.seconds * args.fps
+    print(f"{args.seconds}s {args.size} clip, {frames} frames at {args.fps} fps")
+    print(f"{'path':<22} {'seconds':>8} {'frames/s':>9} {'scratch MB':>11}")
+    for name, seconds, scratch in results:
+        print(f"{name:<22} {seconds:>8.2f} {frames / seconds:>9.1f} {scratch / 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
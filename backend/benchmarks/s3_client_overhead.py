@@ -0,0 +1,90 @@
+"""Per-request overhead of a fresh boto3.client("s3") vs the shared aws_clients.s3_client().
+
+Each request is one HEAD object, made the old way (construct a client, then
+call) or through the shared client. By default requests go to a local stub
+S3 endpoint (HTTP/1.1 keep-alive, empty 200 responses), so the numbers are
+client-side cost plus loopback round trips and no AWS account is needed;
+the stub counts accepted TCP connections. Pass --bucket/--key to hit real S3
+with the ambient credentials instead. Run from backend/:
+
+    python benchmarks/s3_client_overhead.py --requests 200 --threads 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _StubS3(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _StubS3._lock:
+            _StubS3.connections += 1
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.send_header("ETag", '"stub"')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label: str, head, requests: int, threads: int) -> None:
+    before = _StubS3.connections
+    started = time.perf_counter()
+    if threads <= 1:
+        for i in range(requests):
+            head(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(head, range(requests)))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed * 1000 / requests:>8.2f} ms/request  {requests / elapsed:>8.1f} req/s  "
+          f"{_StubS3.connections - before:>4} TCP connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--bucket", default="")
+    parser.add_argument("--key", default="")
+    args = parser.parse_args()
+
+    if not args.bucket:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubS3)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["AWS_ENDPOINT_URL_S3"] = f"http://127.0.0.1:{server.server_port}"
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    bucket, key = args.bucket or "bench", args.key or "object"
+
+    import boto3
+    from aws_clients import s3_client
+
+    def per_request(_):
+        boto3.client("s3").head_object(Bucket=bucket, Key=key)
+
+    def shared(_):
+        s3_client().head_object(Bucket=bucket, Key=key)
+
+    s3_client()  # first construction is a one-off cost, not per request
+    for threads in sorted({1, args.threads}):
+        run(f"boto3.client per request x{threads}", per_request, args.requests, threads)
+        run(f"shared s3_client() x{threads}", shared, args.requests, threads)
+
+
+if __name__ == "__main__":
+    main()
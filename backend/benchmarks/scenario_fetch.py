@@ -0,0 +1,67 @@
+"""Time the /api/scenarios/fetch query with jsonb scans vs the scenario_events index.
+
+Runs EXPLAIN (ANALYZE, BUFFERS) of the fetch query both ways against the
+database in DB_* env vars (the index must have been built with
+scenario_events.refresh_index or POST /api/scenarios/events-index/refresh).
+Read-only. Run from backend/:
+
+    python benchmarks/scenario_fetch.py --events fcw,harsh-brake --days 30 --limit 50
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import db_connection  # noqa: E402
+from scenario_events import index_watermark, known_event_types, scenario_filter_sql  # noqa: E402
+
+
+def fetch_sql(event_sql: str, date_sql: str) -> str:
+    return f"""
+    SELECT d.id FROM public.dmp d
+    WHERE d.dmp_status = 'SUCCESS'
+      AND jsonb_path_exists(d.data_links, '$.trip.console_trip ? (@ != null && @ != "null")')
+      AND {event_sql}
+      {date_sql.format(col="d.created_at")}
+    ORDER BY d.id DESC
+    LIMIT %s
+    """
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", default="fcw")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--plans", action="store_true", help="print the full plans")
+    args = parser.parse_args()
+
+    event_types = known_event_types(args.events.split(","))
+    if not event_types:
+        sys.exit("no known event types given")
+    date_sql = "AND {col} >= NOW() - %s * INTERVAL '1 day'"
+    date_params = [args.days]
+    with db_connection() as conn:
+        if conn is None:
+            sys.exit("database unavailable")
+        cur = conn.cursor()
+        watermark = index_watermark(cur)
+        if watermark is None:
+            sys.exit("scenario_events index not built")
+        for name, wm in (("jsonb scan (old)", None), ("scenario_events", watermark)):
+            event_sql, event_params = scenario_filter_sql(event_types, wm, date_sql, date_params)
+            params = [*event_params, *date_params, args.limit]
+            started = time.perf_counter()
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + fetch_sql(event_sql, date_sql), params)
+            plan = [row[0] for row in cur.fetchall()]
+            elapsed = time.perf_counter() - started
+            print(f"{name:<18} {elapsed * 1000:>9.1f} ms  {plan[-1].strip()}")
+            if args.plans:
+                print("\n".join(plan))
+        cur.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark /api/v2e/detect end to end, minus the model, on a synthetic clip.
+
+Compares the old path (ffmpeg -> frames/*.jpg -> PIL -> det_frames/*.jpg ->
+three ffmpeg runs for the previews and hstack) with the streaming pipeline in
+v2e_detection._detect_on_video, with and without the separate previews. The
+detector is a stub returning one box per frame so the numbers isolate the I/O
+and encode cost; pass --yolo to use the real model instead. Needs
+ffmpeg/ffprobe on PATH. Run from backend/:
+
+    python benchmarks/v2e_detect_pipeline.py --seconds 60 --fps 5 --size 1280x720
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_registry  # noqa: E402
+import v2e_detection  # noqa: E402
+
+
+class _Scalar(list):
+    def tolist(self):
+        return list(self)
+
+    def item(self):
+        return self[0]
+
+
+class _Box:
+    xyxy = [_Scalar([40, 40, 200, 160])]
+    conf = [_Scalar([0.9])]
+    cls = [_Scalar([2])]
+
+
+class _Result:
+    boxes = [_Box()]
+
+
+class StubDetector(model_registry.YoloDetector):
+    def load(self):
+        return self
+
+    def predict(self, images, conf, batch_size=None):
+        return [_Result() for _ in images]
+
+
+def make_clip(path: str, seconds: int, size: str) -> None:
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def legacy(src: str, work: str, fps: int, detector) -> None:
+    """The pre-streaming /detect: JPEG frames on disk and three extra ffmpeg runs."""
+    from PIL import Image, ImageDraw
+    import numpy as np
+
+    frames_dir = os.path.join(work, "frames")
+    out_dir = os.path.join(work, "det_frames")
+    os.makedirs(frames_dir)
+    os.makedirs(out_dir)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", src, "-vf", f"fps={fps}",
+                    os.path.join(frames_dir, "frame_%05d.jpg")], check=True)
+    for fname in sorted(os.listdir(frames_dir)):
+        image = Image.open(os.path.join(frames_dir, fname)).convert("RGB")
+        r0 = detector.predict([np.array(image)], 0.3)[0]
+        draw = ImageDraw.Draw(image)
+        for b in r0.boxes:
+            x1, y1, x2, y2 = [int(v) for v in b.xyxy[0].tolist()]
+            draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=3)
+            draw.text((x1 + 4, y1 + 4), "2 0.90", fill=(0, 255, 0))
+        image.save(os.path.join(out_dir, fname))
+    for d, name in ((frames_dir, "orig.mp4"), (out_dir, "det.mp4")):
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-framerate", str(fps), "-i", os.path.join(d, "frame_%05d.jpg"),
+                        "-c:v", "libx264", "-pix_fmt", "yuv420p", os.path.join(work, name)], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", os.path.join(work, "orig.mp4"), "-i", os.path.join(work, "det.mp4"),
+                    "-filter_complex", "hstack=inputs=2", os.path.join(work, "sbs.mp4")], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--fps", type=int, default=5)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--yolo", action="store_true", help="use the real YOLO model instead of the stub")
+    args = parser.parse_args()
+
+    detector = model_registry.get_detector() if args.yolo else StubDetector()
+    detector.load()
+    model_registry.get_detector = lambda weights=None, backend=None: detector
+    v2e_detection.get_detector = model_registry.get_detector
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = os.path.join(tmp, "clip.mp4")
+        make_clip(clip, args.seconds, args.size)
+        runs = [
+            ("jpeg + 3 encodes (old)", lambda work: legacy(clip, work, args.fps, detector)),
+            ("streaming, previews", lambda work: v2e_detection._detect_on_video(clip, work, args.fps, 0.3, True)),
+            ("streaming, sbs only", lambda work: v2e_detection._detect_on_video(clip, work, args.fps, 0.3, False)),
+        ]
+        results = []
+        for i, (name, fn) in enumerate(runs):
+            work = os.path.join(tmp, f"run{i}")
+            os.makedirs(work)
+            started = time.perf_counter()
+            fn(work)
+            results.append((name, time.perf_counter() - started))
+            shutil.rmtree(work)
+
+    frames = args.seconds * args.fps
+    print(f"{args.seconds}s {args.size} clip, {frames} frames at {args.fps} fps, "
+          f"{'yolo' if args.yolo else 'stub'} detector")
+    print(f"{'path':<24} {'seconds':>8} {'frames/s':>9}")
+    for name, seconds in results:
+        print(f"{name:<24} {seconds:>8.2f} {frames / seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
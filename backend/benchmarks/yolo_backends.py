@@ -0,0 +1,114 @@
+"""Compare YOLO inference backends on CPU: ultralytics/PyTorch vs ONNX Runtime FP32 and INT8.
+
+Latency is ms per image at --batch; accuracy is agreement with the PyTorch
+detections (same class, IoU >= 0.5): recall = torch boxes matched, precision =
+backend boxes matched, plus mean IoU of matches. Images come from --images
+(a directory of JPEG/PNG) or, by default, ultralytics' bundled sample images
+repeated to --frames. Needs ultralytics, torch and onnxruntime. Run from
+backend/:
+
+    python benchmarks/yolo_backends.py --weights yolov8n.pt --frames 32 --batch 8 --threads 0
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import OnnxYoloDetector, YoloDetector  # noqa: E402
+
+
+def load_images(directory: str, frames: int):
+    if directory:
+        names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+        paths = [os.path.join(directory, n) for n in names]
+    else:
+        from ultralytics.utils import ASSETS
+
+        paths = [str(p) for p in sorted(ASSETS.glob("*.jpg"))]
+    images = [cv2.imread(p) for p in paths]
+    images = [im for im in images if im is not None]
+    if not images:
+        sys.exit("no images found")
+    return [images[i % len(images)] for i in range(max(frames, len(images)))]
+
+
+def boxes_of(result):
+    return [(int(b.cls[0].item()), np.asarray(b.xyxy[0].tolist(), dtype=np.float32)) for b in result.boxes]
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference, results):
+    """(recall, precision, mean IoU) of ``results`` against ``reference``, greedy matching per image."""
+    ref_total = got_total = matched = 0
+    ious = []
+    for ref, got in zip(reference, results):
+        ref_boxes, got_boxes = boxes_of(ref), boxes_of(got)
+        ref_total += len(ref_boxes)
+        got_total += len(got_boxes)
+        used = set()
+        for cls, box in ref_boxes:
+            best, best_j = 0.5, None
+            for j, (other_cls, other) in enumerate(got_boxes):
+                if j in used or other_cls != cls:
+                    continue
+                score = iou(box, other)
+                if score >= best:
+                    best, best_j = score, j
+            if best_j is not None:
+                used.add(best_j)
+                matched += 1
+                ious.append(best)
+    return matched / max(1, ref_total), matched / max(1, got_total), float(np.mean(ious)) if ious else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--images", default="")
+    parser.add_argument("--frames", type=int, default=32)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = all cores)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.frames)
+    detectors = [
+        ("torch", YoloDetector(args.weights, args.batch)),
+        ("onnx fp32", OnnxYoloDetector(args.weights, args.batch, threads=args.threads, int8=False)),
+        ("onnx int8", OnnxYoloDetector(args.weights, args.batch, threads=args.threads, int8=True)),
+    ]
+    rows, reference = [], None
+    for name, detector in detectors:
+        started = time.perf_counter()
+        detector.load()
+        load_s = time.perf_counter() - started
+        # Warm-up batch: first call allocates arenas / builds the predictor
+        detector.predict(images[:args.batch], args.conf)
+        started = time.perf_counter()
+        results = detector.predict(images, args.conf)
+        seconds = time.perf_counter() - started
+        if reference is None:
+            reference = results
+        recall, precision, mean_iou = agreement(reference, results)
+        rows.append((name, load_s, seconds / len(images) * 1e3, len(images) / seconds, recall, precision, mean_iou))
+
+    print(f"{len(images)} images, batch {args.batch}, conf {args.conf}, onnx threads {args.threads or 'all'}")
+    print(f"{'backend':<10} {'load s':>7} {'ms/img':>7} {'img/s':>6} {'recall':>7} {'prec':>6} {'IoU':>5}")
+    for name, load_s, ms, ips, recall, precision, mean_iou in rows:
+        print(f"{name:<10} {load_s:>7.2f} {ms:>7.1f} {ips:>6.1f} {recall:>7.3f} {precision:>6.3f} {mean_iou:>5.3f}")
+
+
+if __name__ == "__main__":
+    main()
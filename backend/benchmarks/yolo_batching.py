@@ -0,0 +1,48 @@
+"""Benchmark YOLO predict latency and throughput by batch size on CPU.
+
+Loads the shared detector from model_registry once (load time reported
+separately), then predicts synthetic 640x640 frames in batches of 1..32.
+Needs ultralytics/torch and the YOLO weights. Run from backend/:
+
+    python benchmarks/yolo_batching.py --frames 64 --weights yolov8n.pt
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import YoloDetector  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (args.size, args.size, 3), dtype=np.uint8) for _ in range(args.frames)]
+    detector = YoloDetector(args.weights)
+    started = time.perf_counter()
+    detector.load()
+    print(f"load: {time.perf_counter() - started:.2f}s")
+    # Warm-up: first predict builds the predictor and fuses layers
+    detector.predict(frames[:1], 0.25, batch_size=1)
+
+    print(f"{'batch':>5} {'ms/batch':>9} {'ms/image':>9} {'images/s':>9}")
+    for size in (int(v) for v in args.batch_sizes.split(",")):
+        started = time.perf_counter()
+        detector.predict(frames, 0.25, batch_size=size)
+        seconds = time.perf_counter() - started
+        batches = -(-len(frames) // size)
+        print(f"{size:>5} {seconds / batches * 1e3:>9.1f} {seconds / len(frames) * 1e3:>9.1f} {len(frames) / seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
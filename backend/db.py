@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions as pg_extensions
+from psycopg2 import pool as pg_pool
+
+# Database configuration for MCDB
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "matt3r-aurora-catalog-cluster.cluster-ro-cbbarg1ot9rc.us-west-2.rds.amazonaws.com"),
+    "port": os.getenv("DB_PORT", "5432"),
+    "database": os.getenv("DB_NAME", "postgres"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "2gDaUYCNIt2kpMOWlRQi")
+}
+
+# Pool sizing / timeouts (all overridable via env)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "8"))
+# How long a request may wait for a free connection before giving up (seconds)
+DB_POOL_WAIT_TIMEOUT = float(os.getenv("DB_POOL_WAIT_TIMEOUT", "10"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+# Server-side cap for any single statement (milliseconds, 0 disables)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Connections idle longer than this are pinged with SELECT 1 before reuse (seconds)
+DB_HEALTHCHECK_IDLE = float(os.getenv("DB_HEALTHCHECK_IDLE", "30"))
+
+
+class DatabasePool:
+    """Bounded, thread-safe psycopg2 connection pool with health checks and metrics.
+
+    psycopg2's ThreadedConnectionPool raises as soon as it is exhausted; a
+    semaphore in front of it makes callers wait (up to ``wait_timeout``) for a
+    free slot instead, so bursts queue up rather than opening new connections.
+    """
+
+    def __init__(self, config: dict, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE,
+                 wait_timeout: float = DB_POOL_WAIT_TIMEOUT):
+        self.config = config
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.wait_timeout = wait_timeout
+        self._pool: Optional[pg_pool.ThreadedConnectionPool] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._last_used = {}
+        self._checked_out = set()
+        self._stats = {
+            "acquired": 0,
+            "waiting": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "discarded": 0,
+            "healthcheck_failures": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    def _connect_kwargs(self) -> dict:
+        kwargs = dict(self.config)
+        kwargs["connect_timeout"] = DB_CONNECT_TIMEOUT
+        kwargs["application_name"] = "annotation-platform"
+        # TCP keepalives so dead replica connections are noticed quickly
+        kwargs["keepalives"] = 1
+        kwargs["keepalives_idle"] = 30
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            kwargs["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+        return kwargs
+
+    def _ensure_pool(self) -> pg_pool.ThreadedConnectionPool:
+        if self._pool is not None:
+            return self._pool
+        with self._lock:
+            if self._pool is None:
+                print(f"Creating database pool: host={self.config['host']} db={self.config['database']} "
+                      f"user={self.config['user']} size={self.min_size}..{self.max_size}")
+                self._pool = pg_pool.ThreadedConnectionPool(self.min_size, self.max_size, **self._connect_kwargs())
+                print("✅ Database pool ready")
+        return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < DB_HEALTHCHECK_IDLE:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _record_wait(self, waited_ms: float) -> None:
+        with self._lock:
+            self._stats["wait_ms_total"] += waited_ms
+            if waited_ms > self._stats["wait_ms_max"]:
+                self._stats["wait_ms_max"] = waited_ms
+
+    def _bump(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += delta
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Check out a healthy connection, or return None if none is available in time."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        started = time.monotonic()
+        self._bump("waiting")
+        got_slot = self._slots.acquire(timeout=timeout)
+        self._bump("waiting", -1)
+        self._record_wait((time.monotonic() - started) * 1000.0)
+        if not got_slot:
+            self._bump("timeouts")
+            print(f"❌ Database pool exhausted: no connection within {timeout}s")
+            return None
+
+        try:
+            pool = self._ensure_pool()
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                self._bump("healthcheck_failures")
+                self._discard(pool, conn)
+                conn = pool.getconn()
+            with self._lock:
+                self._checked_out.add(id(conn))
+                self._stats["acquired"] += 1
+            return conn
+        except Exception as e:
+            self._bump("errors")
+            self._slots.release()
+            print(f"❌ Database connection error: {e}")
+            print("Please check your database credentials and network connection.")
+            return None
+
+    def _discard(self, pool, conn) -> None:
+        self._last_used.pop(id(conn), None)
+        self._bump("discarded")
+        try:
+            pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def release(self, conn) -> None:
+        """Return a connection to the pool, rolling back any open transaction."""
+        if conn is None:
+            return
+        with self._lock:
+            if id(conn) not in self._checked_out:
+                return
+            self._checked_out.discard(id(conn))
+        pool = self._pool
+        try:
+            if pool is None:
+                conn.close()
+                return
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    if conn.info.transaction_status != pg_extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    broken = True
+            if broken:
+                self._discard(pool, conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        pool = self._pool
+        with self._lock:
+            snapshot = dict(self._stats)
+            in_use = len(self._checked_out)
+        idle = len(getattr(pool, "_pool", [])) if pool is not None else 0
+        acquired = snapshot["acquired"] or 1
+        snapshot.update({
+            "initialized": pool is not None,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": in_use,
+            "idle": idle,
+            "size": in_use + idle,
+            "wait_ms_avg": round(snapshot["wait_ms_total"] / acquired, 3),
+            "wait_ms_total": round(snapshot["wait_ms_total"], 3),
+            "wait_ms_max": round(snapshot["wait_ms_max"], 3),
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        })
+        return snapshot
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._last_used.clear()
+        if pool is not None:
+            pool.closeall()
+
+
+db_pool = DatabasePool(DB_CONFIG)
+
+
+@contextmanager
+def db_connection(timeout: Optional[float] = None):
+    """Borrow a pooled connection for the duration of a ``with`` block.
+
+    Yields None when the database is unreachable or the pool is exhausted so
+    callers can keep their existing fallback behaviour.
+    """
+    conn = db_pool.acquire(timeout=timeout)
+    try:
+        yield conn
+    except Exception:
+        if conn is not None and not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        raise
+    finally:
+        db_pool.release(conn)
+
+
+def db_pool_stats() -> dict:
+    return db_pool.stats()
@@ -0,0 +1,160 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from db import DB_POOL_MAX_SIZE
+
+
+def _pool_setting(name: str, setting: str, default: int) -> int:
+    return int(os.getenv(f"EXECUTOR_{name.upper()}_{setting}", str(default)))
+
+
+# Named pools for blocking work. Each pool caps its own concurrency so a burst of
+# renders cannot starve DB lookups, and the event loop only ever awaits futures.
+#   db    - psycopg2 queries (sized to the connection pool)
+#   io    - boto3 / s3fs / HTTP calls and parquet reads
+#   media - ffmpeg, OpenCV and model inference (CPU bound, keep small on 1-CPU nodes)
+POOL_CONFIG = {
+    "db": {
+        "workers": _pool_setting("db", "WORKERS", DB_POOL_MAX_SIZE),
+        "max_queue": _pool_setting("db", "MAX_QUEUE", 256),
+    },
+    "io": {
+        "workers": _pool_setting("io", "WORKERS", 16),
+        "max_queue": _pool_setting("io", "MAX_QUEUE", 256),
+    },
+    "media": {
+        "workers": _pool_setting("media", "WORKERS", 2),
+        "max_queue": _pool_setting("media", "MAX_QUEUE", 16),
+    },
+}
+
+
+class BlockingPool:
+    """Thread pool with a bounded backlog and queue-depth / latency counters."""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        # Submitted and not yet finished (running or waiting); settled by the future's done callback,
+        # which also fires when a job is cancelled before a worker picks it up
+        self._pending = 0
+        self._active = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "queue_ms_total": 0.0,
+            "queue_ms_max": 0.0,
+            "run_ms_total": 0.0,
+            "run_ms_max": 0.0,
+        }
+
+    def _call(self, enqueued_at: float, fn, args, kwargs):
+        started = time.monotonic()
+        queue_ms = (started - enqueued_at) * 1000.0
+        with self._lock:
+            self._active += 1
+            self._stats["queue_ms_total"] += queue_ms
+            self._stats["queue_ms_max"] = max(self._stats["queue_ms_max"], queue_ms)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            run_ms = (time.monotonic() - started) * 1000.0
+            with self._lock:
+                self._active -= 1
+                self._stats["completed" if ok else "failed"] += 1
+                self._stats["run_ms_total"] += run_ms
+                self._stats["run_ms_max"] = max(self._stats["run_ms_max"], run_ms)
+
+    def _settle(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.max_queue and self._pending - self._active >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise HTTPException(status_code=503, detail=f"{self.name} pool is busy, please retry")
+            self._pending += 1
+            self._stats["submitted"] += 1
+        try:
+            future = self._executor.submit(self._call, time.monotonic(), fn, args, kwargs)
+        except BaseException:
+            self._settle(None)
+            raise
+        future.add_done_callback(self._settle)
+        # Cancelling the awaiting request cancels a job that has not started yet
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            queued, active = self._pending - self._active, self._active
+        finished = (snapshot["completed"] + snapshot["failed"]) or 1
+        started = finished + active
+        snapshot.update({
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queued": queued,
+            "queue_ms_avg": round(snapshot["queue_ms_total"] / started, 3),
+            "run_ms_avg": round(snapshot["run_ms_total"] / finished, 3),
+        })
+        for k in ("queue_ms_total", "queue_ms_max", "run_ms_total", "run_ms_max"):
+            snapshot[k] = round(snapshot[k], 3)
+        return snapshot
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_pools = {name: BlockingPool(name, cfg["workers"], cfg["max_queue"]) for name, cfg in POOL_CONFIG.items()}
+
+
+def get_pool(name: str) -> BlockingPool:
+    try:
+        return _pools[name]
+    except KeyError:
+        raise ValueError(f"unknown executor pool: {name}")
+
+
+async def run_blocking(pool: str, fn, *args, **kwargs):
+    """Run a blocking callable on the named pool and await its result."""
+    return await get_pool(pool).run(fn, *args, **kwargs)
+
+
+def offload(pool: str):
+    """Decorator turning a blocking route function into an async one running on ``pool``.
+
+    FastAPI reads the wrapped signature (functools.wraps), so request parsing is unchanged.
+    """
+    get_pool(pool)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await run_blocking(pool, fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def executor_stats() -> dict:
+    return {name: p.stats() for name, p in _pools.items()}
+
+
+def shutdown_executors() -> None:
+    for p in _pools.values():
+        p.shutdown()
@@ -0,0 +1,82 @@
+import io
+import json
+import string
+from typing import Optional
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException, Response
+
+GPS_COLUMNS = ["lat", "lon", "timestamp"]
+# points  - [{"lat", "lon", "timestamp"}, ...] (what the map view has always consumed)
+# columns - {"lat": [...], "lon": [...], "timestamp": [...]}, ~3x smaller on the wire
+# arrow   - Arrow IPC stream (application/vnd.apache.arrow.stream), metadata in the schema
+#           metadata and in X- headers (UTF-8 percent-encoded; decodeURIComponent reads them)
+GPS_FORMATS = ("points", "columns", "arrow")
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Printable ASCII other than "%" passes through header values unescaped
+_HEADER_SAFE = "".join(c for c in string.printable if c not in string.whitespace and c != "%") + " "
+
+
+def check_gps_format(fmt: Optional[str]) -> str:
+    fmt = (fmt or "points").lower()
+    if fmt not in GPS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(GPS_FORMATS)}")
+    return fmt
+
+
+def read_gps_table(source) -> pa.Table:
+    """Read only the lat/lon/timestamp columns of a parquet file (path or file object).
+
+    Returns an empty table when any of the three columns is missing, matching
+    the old per-row ``'lat' in row`` checks.
+    """
+    pf = pq.ParquetFile(source)
+    if not all(name in pf.schema_arrow.names for name in GPS_COLUMNS):
+        return pa.table({name: pa.array([], type=pa.float64()) for name in GPS_COLUMNS})
+    return pf.read(columns=GPS_COLUMNS)
+
+
+def _gps_frame(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas()
+    for name in ("lat", "lon"):
+        if not pd.api.types.is_float_dtype(df[name]):
+            df[name] = df[name].astype("float64")
+    if pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        # Keep the previous JSON rendering of datetimes (isoformat strings)
+        df["timestamp"] = [None if pd.isna(ts) else ts.isoformat() for ts in df["timestamp"]]
+    return df
+
+
+def gps_payload(table: pa.Table, fmt: str, **meta):
+    """Serialize a GPS table in the requested format; ``meta`` is merged into the response.
+
+    Columns are encoded whole instead of iterating DataFrame rows.
+    """
+    total = table.num_rows
+    if fmt == "arrow":
+        if meta:
+            table = table.replace_schema_metadata({key: str(value) for key, value in meta.items()})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        headers = {"X-Total-Points": str(total)}
+        for key, value in meta.items():
+            # Header values must be Latin-1; file names and messages can be anything
+            headers["X-" + key.replace("_", "-").title()] = quote(str(value), safe=_HEADER_SAFE)
+        return Response(content=sink.getvalue(), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+
+    # pandas' C JSON encoder instead of building one dict per point; 10 decimal
+    # places is ~0.01 mm of latitude. NaN is written as null (valid JSON).
+    df = _gps_frame(table)
+    if fmt == "columns":
+        columns = ",".join(
+            f'"{name}":' + df[name].to_json(orient="values", double_precision=10) for name in GPS_COLUMNS
+        )
+        data = '"columns":{' + columns + "}"
+    else:
+        data = '"points":' + df[GPS_COLUMNS].to_json(orient="records", double_precision=10)
+    body = {"total_points": total, **meta}
+    return Response(content="{" + data + "," + json.dumps(body, default=str)[1:], media_type="application/json")
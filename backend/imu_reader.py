@@ -0,0 +1,108 @@
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from parquet_window import epoch_seconds, find_timestamp_column, parse_s3_url, read_window, schema_fingerprint
+
+# Axis column aliases: standard names first, then the vehicle frame
+# (lr = left-right, bf = back-front, vert = vertical)
+IMU_AXIS_ALIASES = {
+    "x": ("x", "gyro_x", "accel_x", "lr_w", "lr_acc", "lr"),
+    "y": ("y", "gyro_y", "accel_y", "bf_w", "bf_acc", "bf"),
+    "z": ("z", "gyro_z", "accel_z", "vert_w", "vert_acc", "vert"),
+}
+
+
+class ImuColumns(NamedTuple):
+    timestamp: Optional[str]
+    x: Optional[str]
+    y: Optional[str]
+    z: Optional[str]
+
+
+class ImuArrays(NamedTuple):
+    """Epoch-second timestamps and the three axes as float64 arrays of equal length."""
+    timestamp: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+
+    def __len__(self) -> int:
+        return self.timestamp.size
+
+
+_column_cache: Dict[str, ImuColumns] = {}
+_column_cache_lock = threading.Lock()
+
+
+def resolve_imu_columns(schema: pa.Schema) -> ImuColumns:
+    """Map a parquet schema to its timestamp/x/y/z columns, cached per schema fingerprint.
+
+    Every IMU file of a given firmware shares one schema, so the name heuristics
+    run once per layout rather than once per request.
+    """
+    fingerprint = schema_fingerprint(schema)
+    with _column_cache_lock:
+        cached = _column_cache.get(fingerprint)
+    if cached is not None:
+        return cached
+
+    names = list(schema.names)
+    lowered = {name: name.lower() for name in names}
+    axes = {}
+    for axis, aliases in IMU_AXIS_ALIASES.items():
+        axes[axis] = next((name for alias in aliases for name in names if lowered[name] == alias), None)
+    columns = ImuColumns(find_timestamp_column(schema), axes["x"], axes["y"], axes["z"])
+    print(f"📊 IMU schema {fingerprint[:8]}: timestamp={columns.timestamp}, x={columns.x}, y={columns.y}, z={columns.z}")
+
+    with _column_cache_lock:
+        _column_cache[fingerprint] = columns
+    return columns
+
+
+def read_imu_table(s3_url: str, start: Optional[float] = None,
+                   end: Optional[float] = None) -> Tuple[pa.Table, Optional[str]]:
+    """Every column of an IMU parquet, limited to start <= timestamp <= end.
+
+    Returns the table and its timestamp column (None if the schema has none).
+    """
+    return read_window(s3_url, start, end)
+
+
+def load_imu_arrays(s3_url: str, start: Optional[float] = None, end: Optional[float] = None) -> ImuArrays:
+    """Project timestamp/x/y/z from an IMU parquet into NumPy arrays (missing columns read as 0)."""
+    if parse_s3_url(s3_url) is None:
+        return ImuArrays(*(np.array([], dtype=np.float64) for _ in range(4)))
+    resolved = {}
+
+    def select(schema: pa.Schema) -> List[str]:
+        resolved["columns"] = resolve_imu_columns(schema)
+        return [c for c in resolved["columns"] if c]
+
+    table, _ = read_window(s3_url, start, end, columns=select)
+    imu_columns = resolved["columns"]
+    n = table.num_rows
+
+    def values(name: Optional[str], as_epoch: bool = False) -> np.ndarray:
+        if not name:
+            return np.zeros(n, dtype=np.float64)
+        column = table.column(name)
+        return epoch_seconds(column) if as_epoch else pc.cast(column, pa.float64()).to_numpy()
+
+    return ImuArrays(
+        values(imu_columns.timestamp, as_epoch=True),
+        values(imu_columns.x),
+        values(imu_columns.y),
+        values(imu_columns.z),
+    )
+
+
+def imu_points(arrays: ImuArrays) -> List[dict]:
+    """[{timestamp, x, y, z}, ...] as consumed by the IMU charts."""
+    return [
+        {"timestamp": t, "x": x, "y": y, "z": z}
+        for t, x, y, z in zip(arrays.timestamp.tolist(), arrays.x.tolist(), arrays.y.tolist(), arrays.z.tolist())
+    ]
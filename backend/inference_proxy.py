@@ -0,0 +1,146 @@
+import asyncio
+import bisect
+import os
+import random
+import time
+from typing import Dict, Optional
+
+import httpx
+from fastapi import APIRouter, Body, HTTPException
+
+# External inference server the browser cannot reach directly (CORS)
+INFERENCE_BASE = os.getenv("INFERENCE_BASE", "http://localhost:18085").rstrip("/")
+# Whole-request timeout and connect timeout (seconds)
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))
+INFERENCE_CONNECT_TIMEOUT = float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "5"))
+# Keep-alive pool shared by every model
+INFERENCE_MAX_CONNECTIONS = int(os.getenv("INFERENCE_MAX_CONNECTIONS", "32"))
+# Requests in flight per model; more wait here instead of queueing on the upstream
+INFERENCE_MAX_CONCURRENT = int(os.getenv("INFERENCE_MAX_CONCURRENT", "8"))
+# Extra attempts on connection errors and 5xx, with full-jitter exponential backoff
+INFERENCE_RETRIES = int(os.getenv("INFERENCE_RETRIES", "2"))
+INFERENCE_RETRY_BACKOFF = float(os.getenv("INFERENCE_RETRY_BACKOFF", "0.5"))
+
+# Proxied model name -> path on the inference server
+INFERENCE_MODELS = {
+    "yolov10": "/serve/yolov10/1",
+    "ego_lane_plus": "/serve/ego_lane_plus/1",
+    "depth_anything_v2": "/serve/depth_anything_v2/1",
+}
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+router = APIRouter(prefix="/api/proxy", tags=["inference_proxy"])
+
+_client: Optional[httpx.AsyncClient] = None
+_slots: Dict[str, asyncio.Semaphore] = {}
+_stats: Dict[str, dict] = {}
+
+
+def _model_stats(model: str) -> dict:
+    stats = _stats.get(model)
+    if stats is None:
+        stats = _stats[model] = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "in_flight": 0,
+            "status": {},
+            "latency_ms_sum": 0.0,
+            "latency_ms_buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        }
+    return stats
+
+
+def get_client() -> httpx.AsyncClient:
+    """Process-wide keep-alive client (created on first use, inside the event loop)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(INFERENCE_TIMEOUT, connect=INFERENCE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=INFERENCE_MAX_CONNECTIONS,
+                                max_keepalive_connections=INFERENCE_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retryable(response: Optional[httpx.Response], error: Optional[Exception]) -> bool:
+    if error is not None:
+        # Connection-level failures only; a read timeout means the model is busy, retrying adds load
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError,
+                                  httpx.PoolTimeout))
+    return response.status_code >= 500
+
+
+async def post_json(model: str, payload: dict) -> httpx.Response:
+    """POST ``payload`` to ``model`` on the inference server with pooling, limits and retries."""
+    url = INFERENCE_BASE + INFERENCE_MODELS[model]
+    slots = _slots.setdefault(model, asyncio.Semaphore(max(1, INFERENCE_MAX_CONCURRENT)))
+    stats = _model_stats(model)
+    async with slots:
+        stats["in_flight"] += 1
+        started = time.monotonic()
+        try:
+            for attempt in range(INFERENCE_RETRIES + 1):
+                response, error = None, None
+                try:
+                    response = await get_client().post(url, json=payload)
+                except httpx.HTTPError as e:
+                    error = e
+                if attempt == INFERENCE_RETRIES or not _retryable(response, error):
+                    break
+                stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, INFERENCE_RETRY_BACKOFF * 2 ** attempt))
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+            stats["in_flight"] -= 1
+            stats["requests"] += 1
+            stats["latency_ms_sum"] += elapsed_ms
+            stats["latency_ms_buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        if error is not None:
+            stats["errors"] += 1
+            raise error
+        status = str(response.status_code)
+        stats["status"][status] = stats["status"].get(status, 0) + 1
+        if response.status_code >= 500:
+            stats["errors"] += 1
+        return response
+
+
+@router.post("/infer/{model}")
+async def proxy_infer(model: str, req: dict = Body(...)):
+    """Forward a JSON inference request to INFERENCE_BASE/serve/<model>/1 (avoids browser CORS)."""
+    if model not in INFERENCE_MODELS:
+        raise HTTPException(status_code=404, detail=f"unknown model: {model}")
+    try:
+        r = await post_json(model, req)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"proxy_error: {e!r}")
+    content_type = r.headers.get("content-type", "application/json")
+    try:
+        data = r.json() if "application/json" in content_type else {"detail": r.text}
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=f"proxy_error: invalid JSON from upstream: {e}")
+    if not r.is_success:
+        raise HTTPException(status_code=r.status_code, detail=data)
+    return data
+
+
+def proxy_stats() -> dict:
+    out = {}
+    for model, stats in list(_stats.items()):
+        snapshot = dict(stats, status=dict(stats["status"]))
+        snapshot["latency_ms_avg"] = round(stats["latency_ms_sum"] / max(1, stats["requests"]), 3)
+        snapshot["latency_ms_sum"] = round(stats["latency_ms_sum"], 3)
+        snapshot["latency_ms_buckets"] = dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ["+Inf"],
+                                                  stats["latency_ms_buckets"]))
+        out[model] = snapshot
+    return out
@@ -0,0 +1,356 @@
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+# Jobs live on the shared data volume so a backend restart picks them back up
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "/app/data/jobs/jobs.sqlite3")
+# Number of worker processes; keep at 1 on the 1-CPU Nomad allocation
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# kind -> "module:function". Targets take (payload: dict, progress) and return a JSON-able dict.
+# They are resolved by name inside the worker process, so only plain data crosses the process boundary.
+JOB_TARGETS = {
+    "render_yolo": "visualization.yolov10_visualization:run_render_job",
+    "render_ego_lane": "visualization.ego_lane_visualization:run_render_job",
+    "render_depth": "visualization.depth_anything_visualization:run_render_job",
+    "crop_data": "scenario_analysis:run_crop_data_job",
+    "crop_data_multi": "scenario_analysis:run_crop_data_multi_job",
+    "process_scenario": "scenario_analysis:run_process_scenario_job",
+    "v2e_detect": "v2e_detection:run_detect_job",
+    "refresh_scenario_events": "scenario_events:run_refresh_job",
+}
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    scenario_id INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_scenario_idx ON jobs (scenario_id, created_at);
+"""
+
+
+# Databases whose schema / WAL mode this process has already set up
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _connect(db_path: str = JOBS_DB_PATH, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path if db_path in _schema_ready else _prepare(db_path), timeout=30,
+                           check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _prepare(db_path: str) -> str:
+    """Create the schema (and switch to WAL) once per process and database."""
+    with _schema_lock:
+        if db_path not in _schema_ready:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+            finally:
+                conn.close()
+            _schema_ready.add(db_path)
+    return db_path
+
+
+def _update(db_path: str, job_id: str, conn: Optional[sqlite3.Connection] = None, **fields) -> None:
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    own = conn is None
+    if own:
+        conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        if own:
+            conn.close()
+
+
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    result = json.loads(row["result"]) if row["result"] else None
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "stage": row["stage"],
+        "progress": round(row["progress"] or 0, 1),
+        "scenario_id": row["scenario_id"],
+        "attempts": row["attempts"],
+        "outputs": _output_urls(result),
+        "result": result,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "completed_at": row["finished_at"],
+    }
+
+
+def _output_urls(result) -> list:
+    """Collect every *_url value from a job result (recursing into lists/dicts)."""
+    urls = []
+    if isinstance(result, dict):
+        for k, v in result.items():
+            if isinstance(v, str) and (k == "url" or k.endswith("_url")) and v.startswith("/"):
+                urls.append(v)
+            elif isinstance(v, (dict, list)):
+                urls.extend(_output_urls(v))
+    elif isinstance(result, list):
+        for item in result:
+            urls.extend(_output_urls(item))
+    return urls
+
+
+class JobProgress:
+    """Progress callback handed to job targets: progress(stage, percent=None).
+
+    Writes go through one connection kept for the job's lifetime (callable
+    from render threads too); ``close()`` releases it.
+    """
+
+    def __init__(self, db_path: str, job_id: str, min_interval: float = 0.5):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._stage = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, percent: Optional[float] = None) -> None:
+        now = time.monotonic()
+        # Always record stage changes; throttle pure percentage updates
+        if stage == self._stage and now - self._last_write < self.min_interval:
+            return
+        self._stage = stage
+        self._last_write = now
+        fields = {"stage": stage}
+        if percent is not None:
+            fields["progress"] = max(0.0, min(100.0, float(percent)))
+        try:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = _connect(self.db_path, check_same_thread=False)
+                _update(self.db_path, self.job_id, self._conn, **fields)
+        except Exception as e:
+            print(f"⚠️ Could not record progress for job {self.job_id}: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def no_progress(stage: str, percent: Optional[float] = None) -> None:
+    """Default progress callback for synchronous (non-job) calls."""
+    return None
+
+
+def _resolve_target(kind: str):
+    target = JOB_TARGETS[kind]
+    module_name, func_name = target.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _execute_job(db_path: str, job_id: str, kind: str, payload: dict) -> None:
+    """Worker-process entry point. Never raises: failures are written to the job row."""
+    _update(db_path, job_id, status="running", stage="starting", started_at=time.time())
+    progress = JobProgress(db_path, job_id)
+    try:
+        fn = _resolve_target(kind)
+        result = fn(payload, progress)
+        _update(db_path, job_id, status="succeeded", stage="done", progress=100.0,
+                result=json.dumps(result, default=str), error=None, finished_at=time.time())
+    except Exception as e:
+        # HTTPException carries its message in .detail
+        message = getattr(e, "detail", None) or str(e) or e.__class__.__name__
+        print(f"❌ Job {job_id} ({kind}) failed: {message}")
+        traceback.print_exc()
+        _update(db_path, job_id, status="failed", error=str(message), finished_at=time.time())
+    finally:
+        progress.close()
+
+
+class JobManager:
+    def __init__(self, db_path: str = JOBS_DB_PATH, workers: int = JOB_WORKERS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process that already runs uvicorn + thread pools
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _dispatch(self, job_id: str, kind: str, payload: dict) -> None:
+        future = self._get_executor().submit(_execute_job, self.db_path, job_id, kind, payload)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+
+    def _on_done(self, job_id: str, future) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is None:
+            return
+        print(f"❌ Job worker crashed while running {job_id}: {exc}")
+        _update(self.db_path, job_id, status="failed", error=f"worker crashed: {exc}", finished_at=time.time())
+        if isinstance(exc, BrokenProcessPool):
+            with self._lock:
+                self._executor = None
+
+    def submit(self, kind: str, payload: dict, scenario_id: Optional[int] = None) -> dict:
+        if kind not in JOB_TARGETS:
+            raise HTTPException(status_code=400, detail=f"unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        conn = _connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, stage, progress, payload, scenario_id, attempts, created_at) "
+                    "VALUES (?, ?, 'queued', 'queued', 0, ?, ?, 1, ?)",
+                    (job_id, kind, json.dumps(payload, default=str), scenario_id, time.time()),
+                )
+        finally:
+            conn.close()
+        self._dispatch(job_id, kind, payload)
+        return {"job_id": job_id, "kind": kind, "status": "queued", "status_url": f"/api/jobs/status/{job_id}"}
+
+    def get(self, job_id: str) -> Optional[dict]:
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return _row_to_dict(row) if row else None
+
+    def latest_for_scenario(self, scenario_id: int) -> Optional[dict]:
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE scenario_id = ? ORDER BY created_at DESC LIMIT 1", (scenario_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return _row_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> list:
+        conn = _connect(self.db_path)
+        try:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [_row_to_dict(r) for r in rows]
+
+    def counts(self) -> dict:
+        conn = _connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {r["status"]: r["n"] for r in rows}
+
+    def start(self) -> None:
+        """Prune old jobs and re-dispatch anything left queued/running by a previous process."""
+        conn = _connect(self.db_path)
+        try:
+            with conn:
+                cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+                conn.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND created_at < ?", (cutoff,))
+                pending = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+                ).fetchall()
+                for row in pending:
+                    if row["attempts"] >= JOB_MAX_ATTEMPTS or row["kind"] not in JOB_TARGETS:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = 'interrupted by restart', finished_at = ? WHERE id = ?",
+                            (time.time(), row["id"]),
+                        )
+                    else:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'queued', stage = 'requeued', progress = 0, attempts = attempts + 1 WHERE id = ?",
+                            (row["id"],),
+                        )
+        finally:
+            conn.close()
+        resumed = 0
+        for row in pending:
+            if row["attempts"] < JOB_MAX_ATTEMPTS and row["kind"] in JOB_TARGETS:
+                self._dispatch(row["id"], row["kind"], json.loads(row["payload"]))
+                resumed += 1
+        print(f"✅ Job workers ready ({self.workers} process(es)); resumed {resumed} job(s)")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager()
+
+
+def submit_job(kind: str, payload: dict, scenario_id: Optional[int] = None) -> dict:
+    return job_manager.submit(kind, payload, scenario_id=scenario_id)
+
+
+def job_stats() -> dict:
+    try:
+        counts = job_manager.counts()
+    except Exception as e:
+        counts = {"error": str(e)}
+    return {"workers": job_manager.workers, "jobs": counts}
+
+
+@router.get("/status/{job_id}")
+def get_job_status(job_id: str):
+    """Report stage, percent and output URLs of a submitted job."""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    return {"status": "success", "data": job}
+
+
+@router.get("")
+def list_jobs(status: Optional[str] = None, limit: int = 50):
+    """List recent jobs, newest first."""
+    return {"status": "success", "jobs": job_manager.list(status=status, limit=max(1, min(limit, 500)))}
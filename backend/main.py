@@ -1,23 +1,23 @@
-from fastapi import FastAPI, Body, UploadFile, File, HTTPException, Response
+from fastapi import FastAPI, Body, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from s3_utils import S3ParquetManager
 from s3_video_utils import S3VideoManager
 from typing import Optional
 import os
-import boto3
+from aws_clients import aws_client_stats, s3_client
 import pandas as pd
 from datetime import timedelta
 import subprocess
 from typing import List
 import tempfile
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
 from urllib.parse import unquote
 import uuid
 from dotenv import load_dotenv
-import requests
 import json
-import shutil
+import threading
 load_dotenv()
 from scenario_analysis import router as scenario_router
 from v2e_detection import router as v2e_router
@@ -25,12 +25,25 @@ from vlm_tool import router as vlm_router
 from visualization.yolov10_visualization import router as yolov10_vis_router
 from visualization.ego_lane_visualization import router as ego_lane_vis_router
 from visualization.depth_anything_visualization import router as depth_vis_router
+from db import db_pool, db_pool_stats
+from executors import executor_stats, offload, run_blocking, shutdown_executors
+from jobs import router as jobs_router, job_manager, job_stats
+from s3_catalog import catalog_stats
+from video_index import find_segments
+from gps_points import check_gps_format, gps_payload, read_gps_table
+from s3_object_cache import parquet_cache_stats, video_cache, video_cache_stats
+from visualization.render_cache import render_cache_stats
+from model_registry import model_stats, warm_models
+from uploads import UPLOAD_MAX_PARQUET_BYTES, UploadLimitMiddleware, save_upload, upload_stats
+from scenario_events import scenario_events_stats, start_refresher, stop_refresher
+from s3_presign import presign_stats
+from s3_download import download_stats, head_object, stream_object
+from inference_proxy import close_client as close_inference_client, proxy_stats, router as inference_proxy_router
 from dotenv import load_dotenv
 load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Unified volume directory for saved videos (container-friendly path)
 STATIC_DIR = "/app/data/saved_video"
-INFERENCE_BASE = os.getenv("INFERENCE_BASE", "http://localhost:18085").rstrip("/")
 app = FastAPI(title="Annotation Platform API")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
@@ -41,10 +54,16 @@ app.include_router(vlm_router)
 app.include_router(yolov10_vis_router)
 app.include_router(ego_lane_vis_router)
 app.include_router(depth_vis_router)
+app.include_router(jobs_router)
+# Proxy to the external inference server to avoid browser CORS
+app.include_router(inference_proxy_router)
 
 s3_manager = S3ParquetManager()
 s3_video_manager = S3VideoManager()
 
+# Added before CORS so 413 responses still carry CORS headers
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -63,70 +82,45 @@ async def root():
     return {"message": "Annotation Platform API", "status": "running"}
 
 
-# Simple proxy to the external inference server to avoid browser CORS
-@app.post("/api/proxy/infer/yolov10")
-async def proxy_yolov10(req: dict):
-    try:
-        url = f"{INFERENCE_BASE}/serve/yolov10/1"
-        r = requests.post(url, json=req, timeout=60)
-        content_type = r.headers.get("content-type", "application/json")
-        if "application/json" in content_type:
-            data = r.json()
-        else:
-            data = {"detail": r.text}
-        if not r.ok:
-            raise HTTPException(status_code=r.status_code, detail=data)
-        return data
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"proxy_error: {e}")
-
-# Proxy for ego_lane_plus inference
-@app.post("/api/proxy/infer/ego_lane_plus")
-async def proxy_ego_lane_plus(req: dict):
-    try:
-        url = f"{INFERENCE_BASE}/serve/ego_lane_plus/1"
-        r = requests.post(url, json=req, timeout=60)
-        content_type = r.headers.get("content-type", "application/json")
-        if "application/json" in content_type:
-            data = r.json()
-        else:
-            data = {"detail": r.text}
-        if not r.ok:
-            raise HTTPException(status_code=r.status_code, detail=data)
-        return data
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"proxy_error: {e}")
-
-# Proxy for depth_anything_v2 inference
-@app.post("/api/proxy/infer/depth_anything_v2")
-async def proxy_depth_anything(req: dict):
-    try:
-        url = f"{INFERENCE_BASE}/serve/depth_anything_v2/1"
-        r = requests.post(url, json=req, timeout=60)
-        content_type = r.headers.get("content-type", "application/json")
-        if "application/json" in content_type:
-            data = r.json()
-        else:
-            data = {"detail": r.text}
-        if not r.ok:
-            raise HTTPException(status_code=r.status_code, detail=data)
-        return data
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"proxy_error: {e}")
-
 @app.get("/api/health")
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """Runtime metrics for pools and caches (JSON, scraped by ops dashboards)."""
+    return {"db_pool": db_pool_stats(), "executors": executor_stats(), "jobs": job_stats(), "s3_catalog": catalog_stats(), "parquet_cache": parquet_cache_stats(), "video_cache": video_cache_stats(), "render_cache": render_cache_stats(), "models": model_stats(), "uploads": upload_stats(), "inference_proxy": proxy_stats(), "scenario_events": scenario_events_stats(), "presign": presign_stats(), "aws_clients": aws_client_stats(), "s3_downloads": download_stats()}
+
+@app.on_event("startup")
+def start_job_workers():
+    job_manager.start()
+    # Weights load off the event loop; requests arriving meanwhile wait on the same load
+    threading.Thread(target=warm_models, name="warm-models", daemon=True).start()
+    start_refresher()
+
+@app.on_event("shutdown")
+def close_pools():
+    job_manager.shutdown()
+    stop_refresher()
+    shutdown_executors()
+    db_pool.close()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_inference_client()
+
 @app.get("/api/s3/orgs")
+@offload("io")
 def get_org_ids():
     return {"org_ids": s3_manager.list_org_ids()}
 
 @app.get("/api/s3/orgs/{org_id}/keys")
+@offload("io")
 def get_key_ids(org_id: str):
     return {"key_ids": s3_manager.list_key_ids_by_org(org_id)}
 
 @app.get("/api/s3/orgs/{org_id}/keys/{key_id}/files")
+@offload("io")
 def get_parquet_files(org_id: str, key_id: str):
     files = s3_manager.list_parquet_keys(org_id, key_id)
     return {"files": files}
@@ -135,28 +129,27 @@ class GPSLoadRequest(BaseModel):
     org_id: str
     key_id: str
     file_index: Optional[int] = 0
+    format: Optional[str] = "points"  # points | columns | arrow
 
 @app.post("/api/gps/load")
+@offload("io")
 def load_gps_data(req: GPSLoadRequest):
     org_id = req.org_id
     key_id = req.key_id
     file_index = req.file_index or 0
+    fmt = check_gps_format(req.format)
     parquet_keys = s3_manager.list_parquet_keys(org_id, key_id)
     if not parquet_keys or file_index >= len(parquet_keys):
         return {"points": [], "total_points": 0, "message": "No data file found", "file_index": file_index, "file_count": len(parquet_keys) if parquet_keys else 0}
-    df = s3_manager.load_parquet(parquet_keys[file_index])
-    points = [
-        {"lat": float(row["lat"]), "lon": float(row["lon"]), "timestamp": row["timestamp"]}
-        for _, row in df.iterrows()
-    ]
-    return {
-        "points": points,
-        "total_points": len(points),
-        "file_index": file_index,
-        "file_count": len(parquet_keys),
-        "file_name": parquet_keys[file_index],
-        "message": f"Successfully loaded {len(points)} points"
-    }
+    table = s3_manager.load_gps_table(parquet_keys[file_index])
+    return gps_payload(
+        table,
+        fmt,
+        file_index=file_index,
+        file_count=len(parquet_keys),
+        file_name=parquet_keys[file_index],
+        message=f"Successfully loaded {table.num_rows} points",
+    )
 
 class VideoClipRequest(BaseModel):
     org_id: str
@@ -165,20 +158,6 @@ class VideoClipRequest(BaseModel):
     end_ts: float
     preview_mode: bool = False  # New preview mode parameter
 
-# Helper to parse video start time from filename (assume format: ..._%Y-%m-%d_%H-%M-%S-front.mp4)
-from datetime import datetime
-import re
-
-def parse_video_start_time(filename):
-    # Example: 2024-05-01_12-00-00-front.mp4
-    match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front.mp4", filename)
-    if match:
-        try:
-            return pd.to_datetime(match.group(1), format="%Y-%m-%d_%H-%M-%S", utc=True)
-        except Exception:
-            return None
-    return None
-
 def download_and_clip_videos_by_ranges(
     timestamp_ranges,
     s3_bucket,
@@ -188,33 +167,7 @@ def download_and_clip_videos_by_ranges(
     preview_mode=False
 ):
     os.makedirs(save_dir, exist_ok=True)
-    s3 = boto3.client("s3")
-    prefix = f"{org_id}/{key_id}/"
-    paginator = s3.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=s3_bucket, Prefix=prefix)
-    video_index = []
-    for page in pages:
-
-        for obj in page.get("Contents", []):
-            key = obj["Key"]
-            if key.endswith("-front.mp4") and key.startswith(prefix):
-                start_time = parse_video_start_time(os.path.basename(key))
-                if start_time is not None:
-                    # Ensure start_time is a pandas.Timestamp and not NaTType
-                    try:
-                        ts = pd.to_datetime(start_time, utc=True)
-                        if isinstance(ts, pd.Timestamp) and not pd.isna(ts):
-                            end_time = ts + pd.Timedelta(seconds=60)
-                            if not pd.isna(end_time):
-                                video_index.append({
-                                "key": key,
-                                "start_time": ts,
-                                "end_time": end_time
-                            })
-                        else:
-                            continue
-                    except Exception:
-                        continue
+    s3 = s3_client()
     results = []
     for file_entry in timestamp_ranges:
         try:
@@ -226,19 +179,17 @@ def download_and_clip_videos_by_ranges(
         duration = (dt_end - dt_start).total_seconds()
         # if duration < 5 or duration > 20:
         #     continue
-        matched_video = None
-        for video in video_index:
-            if video["start_time"] <= dt_start and dt_end <= video["end_time"]:
-                matched_video = video
-                break
-        if not matched_video:
+        segments = find_segments(s3, s3_bucket, org_id, key_id, dt_start.timestamp(), dt_end.timestamp())
+        if not segments:
             continue
-        offset_sec = (dt_start - matched_video["start_time"]).total_seconds()
-        presigned_url = s3.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={'Bucket': s3_bucket, 'Key': matched_video["key"]},
-            ExpiresIn=3600
-        )
+        offset_sec = dt_start.timestamp() - segments[0]["start"]
+        for segment in segments:
+            segment["url"] = s3.generate_presigned_url(
+                ClientMethod='get_object',
+                Params={'Bucket': s3_bucket, 'Key': segment["key"]},
+                ExpiresIn=3600
+            )
+        presigned_url = segments[0]["url"]
         output_name = f"{dt_start:%Y-%m-%d_%H-%M-%S}_to_{dt_end:%H-%M-%S}.mp4"
         local_filename = os.path.join(save_dir, output_name)
         
@@ -250,28 +201,49 @@ def download_and_clip_videos_by_ranges(
                 "start_offset": offset_sec,
                 "duration": duration,
                 "success": True,
-                "preview_mode": True
+                "preview_mode": True,
+                # Ranges crossing a file boundary play the segments back to back
+                "segments": [
+                    {"url": seg["url"], "start_offset": max(0.0, dt_start.timestamp() - seg["start"]),
+                     "duration": min(dt_end.timestamp(), seg["end"]) - max(dt_start.timestamp(), seg["start"])}
+                    for seg in segments
+                ],
             })
             continue  # Skip subsequent ffmpeg processing
         
         # Save mode: actually clip and save file
+        concat_list = None
+        if len(segments) == 1:
+            input_args = ["-i", presigned_url]
+        else:
+            # Range spans adjacent files: stitch them with the concat demuxer, then cut
+            concat_list = local_filename + ".txt"
+            with open(concat_list, "w") as f:
+                for seg in segments:
+                    f.write(f"file '{seg['url']}'\n")
+            input_args = ["-f", "concat", "-safe", "0",
+                          "-protocol_whitelist", "file,http,https,tcp,tls,crypto", "-i", concat_list]
         cmd = [
             "ffmpeg",
             "-y",  # Auto overwrite output file
             "-ss", str(offset_sec),
-            "-i", presigned_url,
+            *input_args,
             "-t", str(duration),
             "-c", "copy",
             local_filename
         ]
         try:
             subprocess.run(cmd, check=True)
-            results.append({"file": local_filename, "success": True})
+            results.append({"file": local_filename, "success": True, "segments": len(segments)})
         except subprocess.CalledProcessError as e:
             results.append({"file": local_filename, "success": False, "error": str(e)})
+        finally:
+            if concat_list and os.path.exists(concat_list):
+                os.remove(concat_list)
     return results
 
 @app.post("/api/video/clip")
+@offload("media")
 def clip_video(req: VideoClipRequest):
     print(f"Received request - preview_mode: {req.preview_mode}")  # Debug info
     # Only one range, as per frontend usage
@@ -293,6 +265,7 @@ def clip_video(req: VideoClipRequest):
                 "preview_url": results[0]["preview_url"],
                 "start_offset": results[0]["start_offset"],
                 "duration": results[0]["duration"],
+                "segments": results[0]["segments"],
                 "preview_mode": True
             }
         else:
@@ -301,40 +274,26 @@ def clip_video(req: VideoClipRequest):
         return {"status": "error", "error": results[0].get("error", "Unknown error") if results else "No result"}
 
 @app.post("/api/local/load")
-async def load_local_parquet(file: UploadFile = File(...)):
-    """Handle local parquet file upload"""
+async def load_local_parquet(file: UploadFile = File(...), format: str = Form("points")):
+    """Handle local parquet file upload (format: points | columns | arrow)"""
+    fmt = check_gps_format(format)
     try:
         # Check file type
         if not file.filename or not file.filename.endswith('.parquet'):
             return {"error": "Only parquet files are supported"}
         
-        # Save uploaded file to temporary directory
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
-        # Read parquet file
-        df = pd.read_parquet(tmp_file_path)
-        
-        # Clean up temporary file
-        os.unlink(tmp_file_path)
-        
-        # Extract GPS point data
-        points = []
-        for _, row in df.iterrows():
-            if 'lat' in row and 'lon' in row and 'timestamp' in row:
-                points.append({
-                    "lat": float(row["lat"]),
-                    "lon": float(row["lon"]),
-                    "timestamp": row["timestamp"]
-                })
+        # Stream the upload to a temporary file in chunks
+        fd, tmp_file_path = tempfile.mkstemp(suffix='.parquet')
+        os.close(fd)
+        try:
+            await save_upload(file, tmp_file_path, UPLOAD_MAX_PARQUET_BYTES)
+            # Read only the GPS columns of the parquet file
+            table = await run_blocking("io", read_gps_table, tmp_file_path)
+        finally:
+            # Clean up temporary file
+            os.unlink(tmp_file_path)
         
-        return {
-            "points": points,
-            "total_points": len(points),
-            "message": f"Successfully loaded {len(points)} points from local file"
-        }
+        return gps_payload(table, fmt, message=f"Successfully loaded {table.num_rows} points from local file")
         
     except Exception as e:
         return {"error": f"Failed to process file: {str(e)}"}
@@ -346,6 +305,7 @@ class LocalVideoClipRequest(BaseModel):
     preview_mode: bool = False
 
 @app.post("/api/local/clip")
+@offload("media")
 def clip_local_video(req: LocalVideoClipRequest):
     """Handle local file video clipping"""
     print(f"Local clip request - preview_mode: {req.preview_mode}")
@@ -387,6 +347,7 @@ def clip_local_video(req: LocalVideoClipRequest):
                 "preview_url": results[0]["preview_url"],
                 "start_offset": results[0]["start_offset"],
                 "duration": results[0]["duration"],
+                "segments": results[0]["segments"],
                 "preview_mode": True,
                 "org_id": org_id,
                 "key_id": key_id
@@ -418,28 +379,33 @@ def get_local_file_info():
 
 # Video-related API endpoints
 @app.get("/api/video/orgs")
+@offload("io")
 def get_video_org_ids():
     """Get org_ids for video data"""
     return {"org_ids": s3_video_manager.list_org_ids()}
 
 @app.get("/api/video/orgs/{org_id}/keys")
+@offload("io")
 def get_video_key_ids(org_id: str):
     """Get key_ids under specified org_id"""
     return {"key_ids": s3_video_manager.list_key_ids_by_org(org_id)}
 
 @app.get("/api/video/orgs/{org_id}/keys/{key_id}/videos")
+@offload("io")
 def get_front_videos(org_id: str, key_id: str):
     """Get all front video files under specified org_id and key_id"""
     videos = s3_video_manager.list_front_videos(org_id, key_id)
     return {"videos": videos}
 
 @app.get("/api/video/orgs/{org_id}/keys/{key_id}/videos/all")
+@offload("io")
 def get_all_videos(org_id: str, key_id: str):
     """Get all video files under specified org_id and key_id, categorized by type"""
     videos = s3_video_manager.list_all_videos_by_org_key(org_id, key_id)
     return {"videos": videos}
 
 @app.get("/api/video/url/{key:path}")
+@offload("io")
 def get_video_url(key: str):
     """Get presigned URL for video file"""
     url = s3_video_manager.get_video_url(key)
@@ -449,26 +415,32 @@ def get_video_url(key: str):
         return {"success": False, "error": "Failed to generate URL"}
 
 @app.post("/api/video/download-to-local")
+@offload("io")
 def download_video_to_local(data: dict):
     """Download S3 video to local and return local static URL"""
     key = data.get("key")
     if not key:
         return {"success": False, "error": "Missing key"}
     key = unquote(key)
-    local_dir = "/app/data/saved_video"  # Unified volume directory
-    os.makedirs(local_dir, exist_ok=True)
-    filename = os.path.basename(key)
-    local_path = os.path.join(local_dir, filename)
-    # Skip download if file already exists locally
-    if not os.path.exists(local_path):
-        s3 = boto3.client("s3")
-        try:
-            s3.download_file("matt3r-driving-footage-us-west-2", key, local_path)
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    return {"success": True, "local_url": f"/static/{filename}"}
+    try:
+        # Content-addressed: a re-uploaded object gets a new file, same-named keys never collide
+        local_path = video_cache.get_path("matt3r-driving-footage-us-west-2", key)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    # Served from the cache itself: no untracked copies, and the URL lapses when the entry is evicted
+    return {"success": True, "local_url": f"/api/video/cached/{os.path.basename(local_path)}"}
+
+@app.get("/api/video/cached/{name}")
+@offload("io")
+def get_cached_video(name: str):
+    """Serve a video cache entry handed out by /api/video/download-to-local"""
+    path = video_cache.entry_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Video not cached; request it again via download-to-local")
+    return FileResponse(path, media_type="video/mp4")
 
 @app.post("/api/video/extract-frames")
+@offload("media")
 def extract_frames_from_s3(
     s3_key: str = Body(...),
     filename: str = Body(...),
@@ -500,6 +472,7 @@ def extract_frames_from_s3(
 
 # --- Generic S3 JSON proxy ---
 @app.post("/api/s3/get-json")
+@offload("io")
 def get_json_from_s3(req: dict):
     """Proxy-read a JSON object from S3.
 
@@ -526,7 +499,7 @@ def get_json_from_s3(req: dict):
         if not b or not k:
             raise HTTPException(status_code=400, detail="missing bucket/key")
 
-        s3 = boto3.client("s3")
+        s3 = s3_client()
         obj = s3.get_object(Bucket=b, Key=k)
         text = obj["Body"].read().decode("utf-8")
         try:
@@ -538,31 +511,32 @@ def get_json_from_s3(req: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"s3_read_failed: {e}")
 
-# --- Generic S3 download proxy (binary) ---
+# --- Generic S3 download proxy (binary, streamed) ---
 @app.post("/api/s3/download-object")
-def download_object_from_s3(req: dict):
+async def download_object_from_s3(request: Request, req: dict = Body(...)):
     """Download any S3 object via backend proxy.
 
     Body: { bucket: str, key: str, filename?: str }
-    Returns file bytes with attachment headers.
+    Streams the file with attachment headers; Range / If-None-Match are honoured.
     """
     bucket = (req or {}).get("bucket")
     key = (req or {}).get("key")
-    filename = (req or {}).get("filename")
     if not bucket or not key:
         raise HTTPException(status_code=400, detail="missing bucket/key")
-    if not filename:
-        filename = key.split("/")[-1] or "download.bin"
-    try:
-        s3 = boto3.client("s3")
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        data = obj["Body"].read()
-        # Best-effort content type detection
-        ctype = obj.get("ContentType") or ("application/zip" if filename.lower().endswith(".zip") else "application/octet-stream")
-        headers = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-        return Response(content=data, media_type=ctype, headers=headers)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"s3_download_failed: {e}")
+    filename = (req or {}).get("filename") or key.split("/")[-1] or "download.bin"
+    return await stream_object(bucket, key, filename, request.headers)
+
+
+@app.get("/api/s3/download-object")
+async def download_object_link(request: Request, bucket: str, key: str, filename: Optional[str] = None):
+    """Same as the POST form, as a plain link browsers can download, seek and resume."""
+    return await stream_object(bucket, key, filename or key.split("/")[-1] or "download.bin", request.headers)
+
+
+@app.head("/api/s3/download-object")
+async def check_object_link(bucket: str, key: str, filename: Optional[str] = None):
+    """Headers of the GET form without the body (the frontend checks the object before linking to it)."""
+    return await head_object(bucket, key, filename or key.split("/")[-1] or "download.bin")
 
 if __name__ == "__main__":
     import uvicorn
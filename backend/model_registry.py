@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Detection weights shared by /api/v2e/detect and /api/v2e/detect-images
+YOLO_WEIGHTS = os.getenv("YOLO_WEIGHTS", "yolov8n.pt")
+# Frames per predict() call; larger batches amortize per-call overhead on CPU
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+# Load weights at startup instead of on the first detection request
+YOLO_PRELOAD = os.getenv("YOLO_PRELOAD", "0").lower() in ("1", "true", "yes")
+# Default inference backend: "torch" (ultralytics) or "onnx" (ONNX Runtime, CPU)
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "torch").lower()
+# ONNX Runtime intra-op threads; 0 lets ONNX Runtime use every core
+YOLO_ONNX_THREADS = int(os.getenv("YOLO_ONNX_THREADS", "0"))
+# Run a dynamically INT8-quantized copy of the ONNX model
+YOLO_ONNX_INT8 = os.getenv("YOLO_ONNX_INT8", "0").lower() in ("1", "true", "yes")
+# Network input size used when exporting and letterboxing for ONNX
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+
+BACKENDS = ("torch", "onnx")
+
+
+class YoloDetector:
+    """One YOLO model per process, loaded once and shared by every request.
+
+    ultralytics predictors keep per-call state, so ``predict`` calls are
+    serialized with a lock; throughput comes from batching frames instead.
+    """
+
+    backend = "torch"
+
+    def __init__(self, weights: str = YOLO_WEIGHTS, batch_size: int = YOLO_BATCH_SIZE):
+        self.weights = weights
+        self.batch_size = max(1, batch_size)
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+        self._stats = {
+            "loaded": False,
+            "load_seconds": None,
+            "calls": 0,
+            "batches": 0,
+            "images": 0,
+            "predict_seconds": 0.0,
+        }
+
+    def _load_model(self):
+        from ultralytics import YOLO
+
+        return YOLO(self.weights)
+
+    def _predict_batch(self, model, batch: List[np.ndarray], conf: float) -> List:
+        return model.predict(batch, verbose=False, conf=float(conf))
+
+    def load(self):
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                started = time.perf_counter()
+                self._model = self._load_model()
+                self._stats["load_seconds"] = round(time.perf_counter() - started, 3)
+                self._stats["loaded"] = True
+                print(f"✅ YOLO model {self.weights} ({self.backend}) loaded in {self._stats['load_seconds']}s")
+        return self._model
+
+    def predict(self, images: Sequence, conf: float, batch_size: Optional[int] = None) -> List:
+        """One result per image (HWC BGR arrays), predicted ``batch_size`` at a time.
+
+        Results expose ``.boxes``, each box with ``xyxy[0]``, ``conf[0]`` and
+        ``cls[0]`` as in ultralytics, whatever the backend.
+        """
+        model = self.load()
+        size = max(1, batch_size or self.batch_size)
+        results: List = []
+        for start in range(0, len(images), size):
+            batch = list(images[start:start + size])
+            with self._predict_lock:
+                started = time.perf_counter()
+                results.extend(self._predict_batch(model, batch, conf))
+                elapsed = time.perf_counter() - started
+                self._stats["batches"] += 1
+                self._stats["images"] += len(batch)
+                self._stats["predict_seconds"] += elapsed
+        with self._predict_lock:
+            self._stats["calls"] += 1
+        return results
+
+    def stats(self) -> dict:
+        snapshot = dict(self._stats, weights=self.weights, backend=self.backend, batch_size=self.batch_size)
+        snapshot["predict_seconds"] = round(snapshot["predict_seconds"], 3)
+        return snapshot
+
+
+class _Box(NamedTuple):
+    xyxy: np.ndarray  # (1, 4)
+    conf: np.ndarray  # (1,)
+    cls: np.ndarray  # (1,)
+
+
+class _Result(NamedTuple):
+    boxes: List[_Box]
+
+
+def _letterbox(image: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Resize keeping aspect ratio and pad to size x size with gray, as ultralytics does."""
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (pad_x, pad_y)
+
+
+def _postprocess(pred: np.ndarray, conf: float, scale: float, pad: Tuple[int, int], shape: Tuple[int, int],
+                 iou: float = 0.7, max_det: int = 300) -> _Result:
+    """(4 + classes, anchors) YOLOv8 head output -> boxes in original image pixels, class-aware NMS."""
+    import cv2
+
+    pred = pred.T
+    class_scores = pred[:, 4:]
+    cls = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(cls)), cls]
+    keep = scores >= conf
+    if not keep.any():
+        return _Result([])
+    pred, cls, scores = pred[keep], cls[keep], scores[keep]
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    # Offset boxes per class so one NMS call never suppresses across classes
+    offset = cls[:, None].astype(np.float32) * 4096.0
+    shifted = xyxy + offset
+    rects = np.concatenate([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]], axis=1)
+    picked = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), float(conf), float(iou), top_k=max_det)
+    picked = np.asarray(picked, dtype=np.int64).reshape(-1)[:max_det]
+    xyxy = (xyxy[picked] - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / scale
+    height, width = shape
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+    return _Result([
+        _Box(xyxy[i:i + 1], scores[picked[i]:picked[i] + 1], cls[picked[i]:picked[i] + 1].astype(np.float32))
+        for i in range(len(picked))
+    ])
+
+
+class OnnxYoloDetector(YoloDetector):
+    """YOLOv8 exported to ONNX and run by ONNX Runtime on CPU, without importing torch.
+
+    ``weights`` may be a .onnx file or the .pt it was exported from; a missing
+    .onnx is exported once with ultralytics (dynamic batch). With ``int8`` a
+    dynamically quantized copy (``*.int8.onnx``) is created and used.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, weights: str = YOLO_WEIGHTS, batch_size: int = YOLO_BATCH_SIZE,
+                 threads: int = YOLO_ONNX_THREADS, int8: bool = YOLO_ONNX_INT8, imgsz: int = YOLO_IMGSZ):
+        super().__init__(weights, batch_size)
+        self.threads = threads
+        self.int8 = int8
+        self.imgsz = imgsz
+        if int8:
+            self.backend = "onnx-int8"
+        self._dynamic_batch = True
+
+    def _onnx_path(self) -> str:
+        root, ext = os.path.splitext(self.weights)
+        if ext.lower() == ".onnx":
+            return self.weights
+        path = root + ".onnx"
+        if not os.path.exists(path):
+            from ultralytics import YOLO
+
+            exported = YOLO(self.weights).export(format="onnx", imgsz=self.imgsz, dynamic=True)
+            if exported and os.path.abspath(exported) != os.path.abspath(path):
+                os.replace(exported, path)
+        return path
+
+    def _load_model(self):
+        import onnxruntime as ort
+
+        path = self._onnx_path()
+        if self.int8:
+            quantized = os.path.splitext(path)[0] + ".int8.onnx"
+            if not os.path.exists(quantized):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                tmp = f"{quantized}.{os.getpid()}.tmp"
+                quantize_dynamic(path, tmp, weight_type=QuantType.QUInt8)
+                os.replace(tmp, quantized)
+            path = quantized
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        batch_dim = session.get_inputs()[0].shape[0]
+        self._dynamic_batch = not isinstance(batch_dim, int)
+        return session
+
+    def _predict_batch(self, session, batch: List[np.ndarray], conf: float) -> List:
+        prepared = [_letterbox(image, self.imgsz) for image in batch]
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        blob = np.stack([canvas[:, :, ::-1] for canvas, _s, _p in prepared]).transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        name = session.get_inputs()[0].name
+        if self._dynamic_batch:
+            outputs = session.run(None, {name: blob})[0]
+        else:
+            outputs = np.concatenate([session.run(None, {name: blob[i:i + 1]})[0] for i in range(len(batch))])
+        return [
+            _postprocess(outputs[i], conf, scale, pad, image.shape[:2])
+            for i, (image, (_c, scale, pad)) in enumerate(zip(batch, prepared))
+        ]
+
+    def stats(self) -> dict:
+        return dict(super().stats(), threads=self.threads, int8=self.int8)
+
+
+_detectors: Dict[Tuple[str, str], YoloDetector] = {}
+_registry_lock = threading.Lock()
+
+
+def check_backend(backend: Optional[str]) -> str:
+    backend = (backend or YOLO_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown YOLO backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def get_detector(weights: str = YOLO_WEIGHTS, backend: Optional[str] = None) -> YoloDetector:
+    """Shared detector for ``weights`` on ``backend`` (default YOLO_BACKEND)."""
+    backend = check_backend(backend)
+    with _registry_lock:
+        detector = _detectors.get((backend, weights))
+        if detector is None:
+            cls = OnnxYoloDetector if backend == "onnx" else YoloDetector
+            detector = _detectors[(backend, weights)] = cls(weights)
+        return detector
+
+
+def warm_models() -> None:
+    """Startup hook: load the detector ahead of the first request when YOLO_PRELOAD is set."""
+    if not YOLO_PRELOAD:
+        return
+    try:
+        get_detector().load()
+    except Exception as e:
+        # Detection endpoints report the error themselves; the API still starts
+        print(f"⚠️ YOLO preload failed: {e}")
+
+
+def model_stats() -> dict:
+    with _registry_lock:
+        items = list(_detectors.items())
+    return {f"{backend}:{weights}": d.stats() for (backend, weights), d in items}
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import s3fs
+
+from aws_clients import s3fs_config_kwargs
+from s3_object_cache import parquet_cache
+
+TIMESTAMP_KEYWORDS = ("timestamp", "time", "ts")
+
+# columns: None (all), a list of names, or a callable picking names from the schema
+ColumnSelector = Union[None, Sequence[str], Callable[[pa.Schema], Optional[List[str]]]]
+
+_fs: Optional[s3fs.S3FileSystem] = None
+_fs_lock = threading.Lock()
+_timestamp_cache: Dict[str, Optional[str]] = {}
+_cache_lock = threading.Lock()
+
+
+def filesystem() -> s3fs.S3FileSystem:
+    global _fs
+    with _fs_lock:
+        if _fs is None:
+            _fs = s3fs.S3FileSystem(config_kwargs=s3fs_config_kwargs())
+        return _fs
+
+
+def parse_s3_url(s3_url: str) -> Optional[Tuple[str, str]]:
+    if not s3_url or not s3_url.startswith("s3://"):
+        return None
+    parts = s3_url[len("s3://"):].split("/", 1)
+    if len(parts) != 2 or not parts[1]:
+        return None
+    return parts[0], parts[1]
+
+
+@contextmanager
+def open_s3_parquet(bucket: str, key: str):
+    """Readable file for an S3 parquet: via the local ETag-validated cache, else s3fs range reads."""
+    if parquet_cache.enabled:
+        with parquet_cache.open(bucket, key) as f:
+            yield f
+    else:
+        with filesystem().open(f"{bucket}/{key}", "rb") as f:
+            yield f
+
+
+def schema_fingerprint(schema: pa.Schema) -> str:
+    text = "|".join(f"{field.name}:{field.type}" for field in schema)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def first_column(names: Iterable[str], keywords: Sequence[str]) -> Optional[str]:
+    """First column whose lower-cased name contains any of ``keywords``."""
+    return next((name for name in names if any(k in str(name).lower() for k in keywords)), None)
+
+
+def find_timestamp_column(schema: pa.Schema) -> Optional[str]:
+    """The timestamp column of a trip/IMU schema, resolved once per schema fingerprint."""
+    fingerprint = schema_fingerprint(schema)
+    with _cache_lock:
+        if fingerprint in _timestamp_cache:
+            return _timestamp_cache[fingerprint]
+    names = list(schema.names)
+    ts_col = "timestamp" if "timestamp" in names else first_column(names, TIMESTAMP_KEYWORDS)
+    with _cache_lock:
+        _timestamp_cache[fingerprint] = ts_col
+    return ts_col
+
+
+def _stat_to_epoch(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+def row_groups_in_range(pf: pq.ParquetFile, ts_col: str, start: Optional[float], end: Optional[float]) -> List[int]:
+    """Row groups whose timestamp min/max statistics overlap [start, end]."""
+    metadata = pf.metadata
+    groups = list(range(metadata.num_row_groups))
+    if start is None and end is None:
+        return groups
+    col_index = pf.schema_arrow.get_field_index(ts_col)
+    # Nested schemas do not map 1:1 onto parquet leaf columns; read everything then
+    if col_index < 0 or metadata.num_columns != len(pf.schema_arrow):
+        return groups
+    selected = []
+    for i in groups:
+        stats = metadata.row_group(i).column(col_index).statistics
+        lo = hi = None
+        if stats is not None and stats.has_min_max:
+            lo, hi = _stat_to_epoch(stats.min), _stat_to_epoch(stats.max)
+        # No usable statistics (e.g. string timestamps): keep the group and filter its rows
+        if lo is None or hi is None:
+            selected.append(i)
+        elif (end is None or lo <= end) and (start is None or hi >= start):
+            selected.append(i)
+    return selected
+
+
+def epoch_seconds(column) -> np.ndarray:
+    """Timestamp column (numeric, timestamp or numeric strings) as float64 epoch seconds."""
+    if pa.types.is_timestamp(column.type):
+        ns = pc.cast(pc.cast(column, pa.timestamp("ns")), pa.int64()).to_numpy()
+        return ns.astype(np.float64) / 1e9
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        return pc.cast(column, pa.float64()).to_numpy()
+    return pd.to_numeric(column.to_pandas(), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def read_window(s3_url: str, start: Optional[float] = None, end: Optional[float] = None,
+                columns: ColumnSelector = None) -> Tuple[pa.Table, Optional[str]]:
+    """Read the rows of an S3 parquet with start <= timestamp <= end.
+
+    Only the row groups whose timestamp statistics overlap the window are read
+    (from the local object cache, or by s3fs range reads when it is disabled),
+    and only the selected columns (plus the timestamp column) are decoded, so a
+    10 s window costs a few row groups rather than the whole trip. Returns the
+    table and the timestamp column name (None when the schema has no
+    recognisable timestamp; rows are then unfiltered).
+    """
+    location = parse_s3_url(s3_url)
+    if location is None:
+        raise ValueError(f"not an s3:// url: {s3_url}")
+    with open_s3_parquet(*location) as f:
+        pf = pq.ParquetFile(f)
+        schema = pf.schema_arrow
+        ts_col = find_timestamp_column(schema)
+        read_columns = columns(schema) if callable(columns) else columns
+        if read_columns is not None:
+            read_columns = list(dict.fromkeys(([ts_col] if ts_col else []) + [c for c in read_columns if c]))
+        if ts_col:
+            groups = row_groups_in_range(pf, ts_col, start, end)
+        else:
+            groups = list(range(pf.metadata.num_row_groups))
+        if groups:
+            table = pf.read_row_groups(groups, columns=read_columns)
+        else:
+            table = schema.empty_table()
+            if read_columns is not None:
+                table = table.select(read_columns)
+
+    if ts_col and (start is not None or end is not None) and table.num_rows:
+        ts = epoch_seconds(table.column(ts_col))
+        mask = np.ones(ts.size, dtype=bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts <= end
+        table = table.filter(pa.array(mask))
+    return table, ts_col
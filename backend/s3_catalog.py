@@ -0,0 +1,306 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Listings younger than this are served without touching S3 (seconds)
+S3_CATALOG_TTL = float(os.getenv("S3_CATALOG_TTL", "300"))
+# Incremental refreshes only see keys that sort after the last-seen key, so deleted
+# or back-dated objects are picked up by a periodic full re-list (seconds)
+S3_CATALOG_FULL_REFRESH = float(os.getenv("S3_CATALOG_FULL_REFRESH", "3600"))
+# On-disk snapshot so a restarted backend serves dropdowns immediately ("" disables)
+S3_CATALOG_DB_PATH = os.getenv("S3_CATALOG_DB_PATH", "/app/data/catalog/s3_catalog.sqlite3")
+# Forced refreshes of a listing younger than this are answered from memory (seconds)
+S3_CATALOG_MIN_REFRESH = float(os.getenv("S3_CATALOG_MIN_REFRESH", "10"))
+S3_CATALOG_REFRESH_WORKERS = int(os.getenv("S3_CATALOG_REFRESH_WORKERS", "2"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS s3_listings (
+    bucket TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    items TEXT NOT NULL,
+    last_key TEXT,
+    fetched_at REAL NOT NULL,
+    full_at REAL NOT NULL,
+    PRIMARY KEY (bucket, kind, prefix)
+);
+"""
+
+# Listing kinds: delimited "folders" under a prefix, or every object under a prefix
+PREFIXES = "prefixes"
+OBJECTS = "objects"
+
+
+class _Listing:
+    __slots__ = ("items", "last_key", "fetched_at", "full_at")
+
+    def __init__(self, items: list, last_key: Optional[str], fetched_at: float, full_at: float):
+        self.items = items
+        self.last_key = last_key
+        self.fetched_at = fetched_at
+        self.full_at = full_at
+
+
+class S3PrefixCatalog:
+    """In-memory, TTL-cached view of S3 prefix listings for one bucket.
+
+    Fresh listings are served from memory. Stale listings are still served
+    immediately while a background refresh runs; object listings refresh
+    incrementally with ``StartAfter`` on the last-seen key (the footage and
+    trip keys are timestamped, so new uploads sort last). Listings are
+    snapshotted to SQLite so they survive restarts.
+    """
+
+    def __init__(self, s3_client, bucket: str, ttl: float = S3_CATALOG_TTL,
+                 full_refresh: float = S3_CATALOG_FULL_REFRESH, snapshot_path: str = S3_CATALOG_DB_PATH):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.ttl = ttl
+        self.full_refresh = full_refresh
+        self.snapshot_path = snapshot_path
+        self._listings: Dict[tuple, _Listing] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=max(1, S3_CATALOG_REFRESH_WORKERS),
+                                             thread_name_prefix="s3-catalog")
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "snapshot_loads": 0,
+            "full_refreshes": 0,
+            "incremental_refreshes": 0,
+            "throttled_refreshes": 0,
+            "refresh_errors": 0,
+            "s3_pages": 0,
+        }
+
+    # ----- public API -----
+
+    def common_prefixes(self, prefix: str = "") -> List[str]:
+        """Child "folder" names directly under ``prefix`` (Delimiter='/')."""
+        return list(self._get(PREFIXES, prefix))
+
+    def objects(self, prefix: str) -> List[dict]:
+        """All objects under ``prefix`` as {"key", "size", "last_modified"} dicts, in key order."""
+        return [{"key": k, "size": size, "last_modified": modified} for k, size, modified in self._get(OBJECTS, prefix)]
+
+    def object_rows(self, prefix: str) -> List[list]:
+        """Shared [key, size, last_modified] rows under ``prefix``; treat as read-only.
+
+        Refreshes replace the list rather than mutating it (incremental ones keep the
+        old rows as a prefix), so callers can cheaply detect what changed.
+        """
+        return self._get(OBJECTS, prefix)
+
+    def refresh_objects(self, prefix: str, min_age: float = S3_CATALOG_MIN_REFRESH) -> List[list]:
+        """Synchronously pick up new objects under ``prefix`` (incremental when possible).
+
+        A listing fetched less than ``min_age`` seconds ago is returned as-is, and
+        concurrent callers share one LIST, so misses cannot turn every request into
+        an S3 round trip.
+        """
+        cache_key = (OBJECTS, prefix)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                current = self._listings.get(cache_key)
+            if current is not None and time.time() - current.fetched_at < min_age:
+                self._bump("throttled_refreshes")
+                return current.items
+            return self._refresh(OBJECTS, prefix).items
+
+    def invalidate(self, prefix: Optional[str] = None) -> None:
+        """Drop cached listings (all, or those covering ``prefix``) so the next read re-lists."""
+        with self._lock:
+            for cache_key in list(self._listings):
+                if prefix is None or prefix.startswith(cache_key[1]):
+                    del self._listings[cache_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["listings"] = len(self._listings)
+            snapshot["refreshing"] = len(self._refreshing)
+        snapshot["ttl_s"] = self.ttl
+        return snapshot
+
+    # ----- cache logic -----
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get(self, kind: str, prefix: str) -> list:
+        cache_key = (kind, prefix)
+        with self._lock:
+            listing = self._listings.get(cache_key)
+        if listing is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+            # Single flight: concurrent first requests for a prefix share one listing
+            with key_lock:
+                with self._lock:
+                    listing = self._listings.get(cache_key)
+                if listing is None:
+                    listing = self._load_snapshot(kind, prefix)
+                    if listing is not None:
+                        self._bump("snapshot_loads")
+                        with self._lock:
+                            self._listings[cache_key] = listing
+                if listing is None:
+                    self._bump("misses")
+                    return self._refresh(kind, prefix, force_full=True).items
+
+        if time.time() - listing.fetched_at < self.ttl:
+            self._bump("hits")
+        else:
+            self._bump("stale_hits")
+            self._schedule_refresh(kind, prefix)
+        return listing.items
+
+    def _schedule_refresh(self, kind: str, prefix: str) -> None:
+        cache_key = (kind, prefix)
+        with self._lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def run():
+            try:
+                self._refresh(kind, prefix)
+            except Exception as e:
+                self._bump("refresh_errors")
+                print(f"⚠️ S3 catalog refresh failed for s3://{self.bucket}/{prefix}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        self._refresher.submit(run)
+
+    def _refresh(self, kind: str, prefix: str, force_full: bool = False) -> _Listing:
+        cache_key = (kind, prefix)
+        now = time.time()
+        with self._lock:
+            current = self._listings.get(cache_key)
+        incremental = (
+            kind == OBJECTS
+            and not force_full
+            and current is not None
+            and current.last_key is not None
+            and now - current.full_at < self.full_refresh
+        )
+        if incremental:
+            new_items = self._list_objects(prefix, start_after=current.last_key)
+            items = current.items + new_items if new_items else current.items
+            listing = _Listing(items, items[-1][0] if items else None, now, current.full_at)
+            self._bump("incremental_refreshes")
+        else:
+            if kind == PREFIXES:
+                items = self._list_prefixes(prefix)
+                last_key = None
+            else:
+                items = self._list_objects(prefix)
+                last_key = items[-1][0] if items else None
+            listing = _Listing(items, last_key, now, now)
+            self._bump("full_refreshes")
+        with self._lock:
+            self._listings[cache_key] = listing
+        self._save_snapshot(kind, prefix, listing)
+        return listing
+
+    # ----- S3 -----
+
+    def _list_prefixes(self, prefix: str) -> List[str]:
+        params = {"Bucket": self.bucket, "Delimiter": "/"}
+        if prefix:
+            params["Prefix"] = prefix
+        names = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(**params):
+            self._bump("s3_pages")
+            for prefix_obj in page.get("CommonPrefixes", []):
+                names.append(prefix_obj["Prefix"][len(prefix):].rstrip("/"))
+        return names
+
+    def _list_objects(self, prefix: str, start_after: Optional[str] = None) -> List[list]:
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+        items = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(**params):
+            self._bump("s3_pages")
+            for obj in page.get("Contents", []):
+                items.append([obj["Key"], obj["Size"], obj["LastModified"].isoformat()])
+        return items
+
+    # ----- SQLite snapshot -----
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.snapshot_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _load_snapshot(self, kind: str, prefix: str) -> Optional[_Listing]:
+        if not self.snapshot_path:
+            return None
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT items, last_key, fetched_at, full_at FROM s3_listings "
+                    "WHERE bucket = ? AND kind = ? AND prefix = ?",
+                    (self.bucket, kind, prefix),
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ Could not read S3 catalog snapshot: {e}")
+            return None
+        if row is None:
+            return None
+        return _Listing(json.loads(row[0]), row[1], row[2], row[3])
+
+    def _save_snapshot(self, kind: str, prefix: str, listing: _Listing) -> None:
+        if not self.snapshot_path:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO s3_listings (bucket, kind, prefix, items, last_key, fetched_at, full_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (self.bucket, kind, prefix, json.dumps(listing.items), listing.last_key,
+                         listing.fetched_at, listing.full_at),
+                    )
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ Could not write S3 catalog snapshot: {e}")
+
+
+_catalogs: Dict[str, S3PrefixCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(bucket: str, s3_client) -> S3PrefixCatalog:
+    """Process-wide catalog per bucket, so managers created per request share one cache."""
+    with _catalogs_lock:
+        catalog = _catalogs.get(bucket)
+        if catalog is None:
+            catalog = _catalogs[bucket] = S3PrefixCatalog(s3_client, bucket)
+        return catalog
+
+
+def catalog_stats() -> dict:
+    with _catalogs_lock:
+        catalogs = dict(_catalogs)
+    return {bucket: c.stats() for bucket, c in catalogs.items()}
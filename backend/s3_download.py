@@ -0,0 +1,137 @@
+import os
+import threading
+from typing import Mapping, Optional
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from aws_clients import s3_client
+from executors import run_blocking
+
+# Bytes read from S3 per chunk; memory per download stays at about one chunk
+S3_DOWNLOAD_CHUNK_BYTES = int(os.getenv("S3_DOWNLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# S3 response metadata passed through to the client as-is
+_PASSTHROUGH = (
+    ("ETag", "ETag"),
+    ("ContentRange", "Content-Range"),
+    ("CacheControl", "Cache-Control"),
+    ("ContentEncoding", "Content-Encoding"),
+)
+
+_lock = threading.Lock()
+_stats = {"downloads": 0, "partial": 0, "not_modified": 0, "errors": 0, "in_flight": 0, "bytes_streamed": 0}
+
+
+def _bump(name: str, delta: int = 1) -> None:
+    with _lock:
+        _stats[name] += delta
+
+
+def _get_object(bucket: str, key: str, range_header: Optional[str], if_none_match: Optional[str],
+                if_range: Optional[str]) -> dict:
+    params = {"Bucket": bucket, "Key": key}
+    if range_header:
+        params["Range"] = range_header
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+    obj = s3_client().get_object(**params)
+    # If-Range (resume): a range only applies to the version the client already has, else send it whole
+    if range_header and if_range and if_range != obj.get("ETag"):
+        obj["Body"].close()
+        params.pop("Range")
+        obj = s3_client().get_object(**params)
+    return obj
+
+
+def _body_chunks(body, size: int):
+    """Yield the object body chunk by chunk.
+
+    A plain generator: StreamingResponse pulls it on Starlette's threadpool,
+    which waits for a free thread instead of rejecting, so a download is
+    never cut off mid-stream by io pool backpressure (run_blocking's 503).
+    """
+    _bump("in_flight")
+    try:
+        while True:
+            chunk = body.read(size)
+            if not chunk:
+                break
+            _bump("bytes_streamed", len(chunk))
+            yield chunk
+    finally:
+        _bump("in_flight", -1)
+        body.close()
+
+
+def _object_headers(obj: dict, filename: str):
+    """(content type, response headers) for a get_object/head_object result."""
+    # Best-effort content type detection
+    ctype = obj.get("ContentType") or ("application/zip" if filename.lower().endswith(".zip") else "application/octet-stream")
+    headers = {
+        "Content-Disposition": f"attachment; filename=\"{filename}\"",
+        "Content-Length": str(obj["ContentLength"]),
+        "Accept-Ranges": "bytes",
+    }
+    for field, header in _PASSTHROUGH:
+        if obj.get(field):
+            headers[header] = obj[field]
+    if obj.get("LastModified"):
+        headers["Last-Modified"] = obj["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT")
+    return ctype, headers
+
+
+async def head_object(bucket: str, key: str, filename: str) -> Response:
+    """Headers the download would have, without a body: lets clients check an object before linking to it."""
+    try:
+        obj = await run_blocking("io", s3_client().head_object, Bucket=bucket, Key=key)
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return Response(status_code=status if status in (403, 404) else 500)
+    except Exception:
+        return Response(status_code=500)
+    ctype, headers = _object_headers(obj, filename)
+    return Response(status_code=200, media_type=ctype, headers=headers)
+
+
+async def stream_object(bucket: str, key: str, filename: str, request_headers: Mapping[str, str]) -> Response:
+    """Stream s3://bucket/key to the client as an attachment, in constant memory.
+
+    Range, If-Range and If-None-Match from ``request_headers`` are forwarded
+    to S3, so the response is 200, 206 (partial), 304 (not modified) or 416,
+    with Content-Length, ETag and Accept-Ranges set, and browsers can seek and
+    resume downloads.
+    """
+    range_header = request_headers.get("range")
+    try:
+        obj = await run_blocking("io", _get_object, bucket, key, range_header,
+                                 request_headers.get("if-none-match"), request_headers.get("if-range"))
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 304:
+            _bump("not_modified")
+            etag = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get("etag")
+            return Response(status_code=304, headers={"ETag": etag} if etag else None)
+        _bump("errors")
+        if status == 416:
+            return Response(status_code=416, headers={"Accept-Ranges": "bytes"})
+        raise HTTPException(status_code=status if status in (403, 404) else 500, detail=f"s3_download_failed: {e}")
+    except Exception as e:
+        _bump("errors")
+        raise HTTPException(status_code=500, detail=f"s3_download_failed: {e}")
+
+    ctype, headers = _object_headers(obj, filename)
+    partial = "ContentRange" in obj
+    _bump("downloads")
+    if partial:
+        _bump("partial")
+    # The background close also releases the S3 connection when the client disconnects mid-stream
+    return StreamingResponse(_body_chunks(obj["Body"], S3_DOWNLOAD_CHUNK_BYTES), status_code=206 if partial else 200,
+                             media_type=ctype, headers=headers, background=BackgroundTask(obj["Body"].close))
+
+
+def download_stats() -> dict:
+    with _lock:
+        return dict(_stats, chunk_bytes=S3_DOWNLOAD_CHUNK_BYTES)
@@ -0,0 +1,397 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from aws_clients import s3_client
+
+
+# On-disk budget for cached parquet objects (bytes, 0 disables the cache entirely)
+PARQUET_CACHE_DIR = os.getenv("PARQUET_CACHE_DIR", "/app/data/cache/parquet")
+PARQUET_CACHE_DISK_BYTES = int(os.getenv("PARQUET_CACHE_DISK_BYTES", str(2 * 1024 ** 3)))
+# Hot objects are also kept in memory up to this many bytes
+PARQUET_CACHE_MEMORY_BYTES = int(os.getenv("PARQUET_CACHE_MEMORY_BYTES", str(256 * 1024 ** 2)))
+# Objects larger than this are only cached on disk
+PARQUET_CACHE_MEMORY_MAX_OBJECT = int(os.getenv("PARQUET_CACHE_MEMORY_MAX_OBJECT", str(64 * 1024 ** 2)))
+# A cached ETag is trusted this long before the next HEAD revalidation (seconds)
+PARQUET_CACHE_REVALIDATE = float(os.getenv("PARQUET_CACHE_REVALIDATE", "60"))
+
+# Source footage shared by clipping, auto-describe and the renderers. Kept outside the
+# static mount: clients get entries through /api/video/cached/{name} while they are cached.
+VIDEO_CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", "/app/data/cache/video")
+# Budget for the whole directory, shared by the API process and job workers
+VIDEO_CACHE_DISK_BYTES = int(os.getenv("VIDEO_CACHE_DISK_BYTES", str(20 * 1024 ** 3)))
+# Files used within this window are never evicted (protects readers in other processes)
+VIDEO_CACHE_MIN_AGE = float(os.getenv("VIDEO_CACHE_MIN_AGE", "600"))
+
+# Partial downloads untouched this long are treated as abandoned by a dead process (seconds)
+_STALE_TMP_SECONDS = 3600.0
+
+
+def _entry_name(bucket: str, key: str, etag: str, suffix: str) -> str:
+    return hashlib.sha1(f"{bucket}\0{key}\0{etag}".encode()).hexdigest() + suffix
+
+
+class S3ObjectCache:
+    """Byte-bounded LRU cache of whole S3 objects keyed by (bucket, key, ETag).
+
+    Two tiers: an on-disk LRU under ``cache_dir`` and an in-memory LRU for
+    smaller hot objects. The current ETag of a key is revalidated with a HEAD
+    request at most every ``revalidate`` seconds; a changed ETag simply maps to
+    a new entry and the old one ages out. Concurrent misses for the same object
+    share a single download. Tools that need a real file (ffmpeg, OpenCV) use
+    ``get_path``/``local_path``; entries that are pinned or were touched within
+    ``min_age`` seconds are skipped by eviction. ``disk_bytes`` bounds the
+    directory as a whole: before evicting, the directory is re-read so entries
+    written by other processes (job workers) count against the same budget.
+    """
+
+    def __init__(self, cache_dir: str = PARQUET_CACHE_DIR, disk_bytes: int = PARQUET_CACHE_DISK_BYTES,
+                 memory_bytes: int = PARQUET_CACHE_MEMORY_BYTES, revalidate: float = PARQUET_CACHE_REVALIDATE,
+                 suffix: str = ".parquet", min_age: float = 0.0):
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self.revalidate = revalidate
+        self.suffix = suffix
+        self.min_age = min_age
+        self._pins: Dict[str, int] = {}
+        self._s3 = None
+        self._lock = threading.Lock()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # entry name -> size, LRU order
+        self._disk_used = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._etags: Dict[Tuple[str, str], Tuple[str, float]] = {}  # (bucket, key) -> (etag, validated_at)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._scanned = False
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "revalidation_errors": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "downloaded_bytes": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.disk_bytes > 0
+
+    def _client(self):
+        if self._s3 is None:
+            self._s3 = s3_client()
+        return self._s3
+
+    def _bump(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += delta
+
+    def _scan(self) -> None:
+        """Adopt entries left on disk by a previous process (least recently used first)."""
+        if self._scanned:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                # Other processes (job workers) share the directory: only reap downloads that stopped writing
+                try:
+                    if time.time() - os.stat(os.path.join(self.cache_dir, name)).st_mtime > _STALE_TMP_SECONDS:
+                        os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        self._resync_disk()
+        self._scanned = True
+        self._evict_disk()
+
+    def _current_etag(self, bucket: str, key: str) -> str:
+        cached = self._etags.get((bucket, key))
+        if cached and time.monotonic() - cached[1] < self.revalidate:
+            return cached[0]
+        self._bump("revalidations")
+        try:
+            etag = self._client().head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        except Exception:
+            if cached is None:
+                raise
+            # S3 unreachable: keep serving the copy we have
+            self._bump("revalidation_errors")
+            return cached[0]
+        with self._lock:
+            self._etags[(bucket, key)] = (etag, time.monotonic())
+        return etag
+
+    def etag(self, bucket: str, key: str) -> str:
+        """Current ETag of s3://bucket/key (HEAD at most every ``revalidate`` seconds)."""
+        return self._current_etag(bucket, key)
+
+    def _touch_memory(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                if name in self._disk:
+                    self._disk.move_to_end(name)
+            return data
+
+    def _remember(self, name: str, data: bytes) -> None:
+        if len(data) > PARQUET_CACHE_MEMORY_MAX_OBJECT or len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            if name in self._memory:
+                return
+            self._memory[name] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes and self._memory:
+                _, old = self._memory.popitem(last=False)
+                self._memory_used -= len(old)
+
+    def _recently_used(self, name: str) -> bool:
+        if self.min_age <= 0:
+            return False
+        try:
+            return time.time() - os.stat(os.path.join(self.cache_dir, name)).st_mtime < self.min_age
+        except OSError:
+            return False
+
+    def _mark_used(self, name: str) -> None:
+        # mtime is the entry's last use across every process sharing the directory
+        try:
+            os.utime(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def _resync_disk(self) -> None:
+        """Re-read the directory: adopt other processes' entries, forget deleted ones, order by last use."""
+        try:
+            with os.scandir(self.cache_dir) as it:
+                found = [(st.st_mtime, e.name, st.st_size)
+                         for e in it if e.name.endswith(self.suffix) and e.is_file() for st in (e.stat(),)]
+        except OSError:
+            return
+        with self._lock:
+            for name in set(self._disk) - {name for _, name, _ in found}:
+                self._memory_used -= len(self._memory.pop(name, b""))
+            self._disk = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._disk_used = sum(self._disk.values())
+
+    def _evict_disk(self) -> None:
+        self._resync_disk()
+        victims = []
+        with self._lock:
+            # Walk from least recently used; pinned / recently touched entries are skipped
+            for name in list(self._disk):
+                if self._disk_used <= self.disk_bytes or len(self._disk) <= 1:
+                    break
+                if self._pins.get(name) or self._recently_used(name):
+                    continue
+                self._disk_used -= self._disk.pop(name)
+                self._memory_used -= len(self._memory.pop(name, b""))
+                victims.append(name)
+                self._stats["evictions"] += 1
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _download(self, bucket: str, key: str, etag: str, name: str) -> None:
+        path = os.path.join(self.cache_dir, name)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        # IfMatch pins the body to the ETag we are caching it under
+        body = self._client().get_object(Bucket=bucket, Key=key, IfMatch=etag)["Body"]
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._disk[name] = size
+            self._disk_used += size
+            self._stats["downloaded_bytes"] += size
+        self._evict_disk()
+
+    def _ensure_local(self, bucket: str, key: str) -> str:
+        """Return the entry name for the current version of s3://bucket/key, downloading if needed."""
+        self._scan()
+        etag = self._current_etag(bucket, key)
+        name = _entry_name(bucket, key, etag, self.suffix)
+        while True:
+            with self._lock:
+                if name in self._disk:
+                    self._disk.move_to_end(name)
+                    return name
+                event = self._inflight.get(name)
+                leader = event is None
+                if leader:
+                    event = self._inflight[name] = threading.Event()
+            if not leader:
+                # Single flight: wait for the in-progress download, then re-check
+                self._bump("coalesced")
+                event.wait()
+                continue
+            try:
+                self._bump("misses")
+                self._download(bucket, key, etag, name)
+                return name
+            except Exception:
+                # e.g. 412 when the object changed after HEAD: revalidate next time
+                with self._lock:
+                    self._etags.pop((bucket, key), None)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight.pop(name, None)
+                event.set()
+
+    @contextmanager
+    def open(self, bucket: str, key: str):
+        """Binary file object with the current contents of s3://bucket/key."""
+        self._scan()
+        etag = self._current_etag(bucket, key)
+        name = _entry_name(bucket, key, etag, self.suffix)
+        data = self._touch_memory(name)
+        if data is not None:
+            self._bump("memory_hits")
+            self._mark_used(name)
+            yield io.BytesIO(data)
+            return
+        with self._lock:
+            on_disk = name in self._disk
+        if on_disk:
+            self._bump("disk_hits")
+        for attempt in range(2):
+            name = self._ensure_local(bucket, key)
+            try:
+                # An open handle stays readable even if the entry is evicted meanwhile
+                f = open(os.path.join(self.cache_dir, name), "rb")
+                self._mark_used(name)
+                break
+            except FileNotFoundError:
+                # Removed from disk behind our back: forget it and fetch again
+                with self._lock:
+                    size = self._disk.pop(name, None)
+                    if size is not None:
+                        self._disk_used -= size
+                if attempt:
+                    raise
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= min(PARQUET_CACHE_MEMORY_MAX_OBJECT, self.memory_bytes):
+                data = f.read()
+                self._remember(name, data)
+                yield io.BytesIO(data)
+            else:
+                yield f
+
+    def get_path(self, bucket: str, key: str) -> str:
+        """Local path of the current version of s3://bucket/key, downloading it on a miss.
+
+        The file is complete (written via rename) and is protected from eviction
+        for ``min_age`` seconds; use ``local_path`` to pin it for longer work.
+        """
+        if self.peek_path(bucket, key) is not None:
+            self._bump("disk_hits")
+        for attempt in range(2):
+            name = self._ensure_local(bucket, key)
+            path = os.path.join(self.cache_dir, name)
+            try:
+                # mtime marks the entry as in use for other processes sharing the directory
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                with self._lock:
+                    size = self._disk.pop(name, None)
+                    if size is not None:
+                        self._disk_used -= size
+                if attempt:
+                    raise
+
+    @contextmanager
+    def local_path(self, bucket: str, key: str):
+        """``get_path`` that also pins the entry against eviction until the block exits."""
+        path = self.get_path(bucket, key)
+        name = os.path.basename(path)
+        with self._lock:
+            self._pins[name] = self._pins.get(name, 0) + 1
+        try:
+            yield path
+        finally:
+            with self._lock:
+                if self._pins.get(name, 0) <= 1:
+                    self._pins.pop(name, None)
+                else:
+                    self._pins[name] -= 1
+
+    def entry_path(self, name: str) -> Optional[str]:
+        """Path of cache entry ``name`` (as in ``get_path``'s basename) if it is cached, else None.
+
+        Serving an entry counts as a use, so it is kept for ``min_age`` seconds.
+        """
+        self._scan()
+        with self._lock:
+            present = name in self._disk
+            if present:
+                self._disk.move_to_end(name)
+        if not present:
+            return None
+        path = os.path.join(self.cache_dir, name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                size = self._disk.pop(name, None)
+                if size is not None:
+                    self._disk_used -= size
+            return None
+        return path
+
+    def peek_path(self, bucket: str, key: str) -> Optional[str]:
+        """Local path if the current version is already cached; never downloads."""
+        self._scan()
+        try:
+            name = _entry_name(bucket, key, self._current_etag(bucket, key), self.suffix)
+        except Exception:
+            # Missing object or S3 unreachable with nothing cached: treat as not cached
+            return None
+        with self._lock:
+            present = name in self._disk
+        return os.path.join(self.cache_dir, name) if present else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_used,
+                "disk_budget": self.disk_bytes,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_budget": self.memory_bytes,
+            })
+        return snapshot
+
+
+parquet_cache = S3ObjectCache()
+video_cache = S3ObjectCache(VIDEO_CACHE_DIR, VIDEO_CACHE_DISK_BYTES, memory_bytes=0,
+                            suffix=".mp4", min_age=VIDEO_CACHE_MIN_AGE)
+
+
+def parquet_cache_stats() -> dict:
+    return parquet_cache.stats()
+
+
+def video_cache_stats() -> dict:
+    return video_cache.stats()
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from aws_clients import s3_client
+
+# Lifetime of presigned GET URLs (seconds)
+PRESIGN_EXPIRES = int(os.getenv("PRESIGN_EXPIRES", "3600"))
+# Presigned URLs kept for reuse; each stays valid for at least 3/4 of PRESIGN_EXPIRES when handed out
+PRESIGN_CACHE_SIZE = int(os.getenv("PRESIGN_CACHE_SIZE", "4096"))
+# Concurrent HEAD requests when a batch of keys is verified
+PRESIGN_VERIFY_WORKERS = int(os.getenv("PRESIGN_VERIFY_WORKERS", "8"))
+
+_pool_lock = threading.Lock()
+_cache: "OrderedDict[Tuple[str, str, int, int], str]" = OrderedDict()
+_lock = threading.Lock()
+_verify_pool: Optional[ThreadPoolExecutor] = None
+_stats = {"presigned": 0, "cache_hits": 0, "verified": 0, "missing": 0}
+
+
+def _bump(name: str, delta: int = 1) -> None:
+    with _lock:
+        _stats[name] += delta
+
+
+def presign_get(bucket: str, key: str, expires: int = PRESIGN_EXPIRES) -> str:
+    """Presigned GET URL for s3://bucket/key, signed locally (no request to S3).
+
+    URLs are cached per quarter of their lifetime, so a cached URL handed out
+    always has at least 3/4 of ``expires`` left.
+    """
+    window = int(time.time() // max(1, expires // 4))
+    cache_key = (bucket, key, expires, window)
+    with _lock:
+        url = _cache.get(cache_key)
+        if url is not None:
+            _cache.move_to_end(cache_key)
+            _stats["cache_hits"] += 1
+            return url
+    url = s3_client().generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires)
+    with _lock:
+        _stats["presigned"] += 1
+        _cache[cache_key] = url
+        while len(_cache) > PRESIGN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return url
+
+
+def _exists(bucket: str, key: str) -> bool:
+    try:
+        s3_client().head_object(Bucket=bucket, Key=key)
+        return True
+    except Exception:
+        return False
+
+
+def verify_keys(bucket: str, keys: Iterable[str]) -> Dict[str, bool]:
+    """HEAD each distinct key concurrently; ``{key: exists}``."""
+    global _verify_pool
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    if _verify_pool is None:
+        with _pool_lock:
+            if _verify_pool is None:
+                _verify_pool = ThreadPoolExecutor(max_workers=max(1, PRESIGN_VERIFY_WORKERS),
+                                                  thread_name_prefix="s3-verify")
+    found = dict(zip(keys, _verify_pool.map(lambda k: _exists(bucket, k), keys)))
+    missing = sum(1 for ok in found.values() if not ok)
+    _bump("verified", len(keys))
+    _bump("missing", missing)
+    return found
+
+
+def presign_stats() -> dict:
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["cached"] = len(_cache)
+    return snapshot
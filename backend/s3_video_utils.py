@@ -1,60 +1,45 @@
-import boto3
-import s3fs
 import re
 from typing import List, Dict, Optional
 
+from aws_clients import s3_client
+from parquet_window import filesystem
+from s3_catalog import get_catalog
+
 class S3VideoManager:
     def __init__(self, bucket_name="matt3r-driving-footage-us-west-2"):
         self.bucket = bucket_name
-        self.s3 = boto3.client("s3")
-        self.fs = s3fs.S3FileSystem()
+        self.s3 = s3_client()
+        self.fs = filesystem()
+        # Cached prefix listings shared by every manager on this bucket
+        self.catalog = get_catalog(self.bucket, self.s3)
 
     def list_org_ids(self) -> List[str]:
         """List all org_ids"""
-        paginator = self.s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=self.bucket, Delimiter="/")
-        org_ids = []
-        for page in pages:
-            for prefix_obj in page.get("CommonPrefixes", []):
-                org_id = prefix_obj["Prefix"].rstrip("/")
-                org_ids.append(org_id)
-        return org_ids
+        return self.catalog.common_prefixes("")
 
     def list_key_ids_by_org(self, org_id: str) -> List[str]:
         """List all key_ids by org_id"""
-        prefix = f"{org_id}/"
-        paginator = self.s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/")
-        key_ids = []
-        for page in pages:
-            for prefix_obj in page.get("CommonPrefixes", []):
-                key_id = prefix_obj["Prefix"].replace(prefix, "").rstrip("/")
-                key_ids.append(key_id)
-        return key_ids
+        return self.catalog.common_prefixes(f"{org_id}/")
 
     def list_front_videos(self, org_id: str, key_id: str) -> List[Dict[str, str]]:
         """List all front video files under specified org_id and key_id"""
         prefix = f"{org_id}/{key_id}/"
-        paginator = self.s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix)
-        
         front_videos = []
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                filename = key.split("/")[-1]
-                
-                # Match front video files
-                match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front\.mp4", filename)
-                if match:
-                    timestamp = match.group(1)
-                    front_videos.append({
-                        "key": key,
-                        "filename": filename,
-                        "timestamp": timestamp,
-                        "size": obj["Size"],
-                        "last_modified": obj["LastModified"].isoformat()
-                    })
+        for obj in self.catalog.objects(prefix):
+            key = obj["key"]
+            filename = key.split("/")[-1]
+            
+            # Match front video files
+            match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front\.mp4", filename)
+            if match:
+                timestamp = match.group(1)
+                front_videos.append({
+                    "key": key,
+                    "filename": filename,
+                    "timestamp": timestamp,
+                    "size": obj["size"],
+                    "last_modified": obj["last_modified"]
+                })
         
         # Sort by timestamp
         front_videos.sort(key=lambda x: x["timestamp"])
@@ -89,9 +74,6 @@ class S3VideoManager:
     def list_all_videos_by_org_key(self, org_id: str, key_id: str) -> Dict[str, List[Dict]]:
         """List all video files under specified org_id and key_id, categorized by type"""
         prefix = f"{org_id}/{key_id}/"
-        paginator = self.s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix)
-        
         videos = {
             "front": [],
             "left": [],
@@ -100,39 +82,38 @@ class S3VideoManager:
             "other": []
         }
         
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                filename = key.split("/")[-1]
-                
-                # Match different types of video files
-                front_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front\.mp4", filename)
-                left_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-left\.mp4", filename)
-                right_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-right\.mp4", filename)
-                rear_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-rear\.mp4", filename)
-                
-                video_info = {
-                    "key": key,
-                    "filename": filename,
-                    "size": obj["Size"],
-                    "last_modified": obj["LastModified"].isoformat()
-                }
-                
-                if front_match:
-                    video_info["timestamp"] = front_match.group(1)
-                    videos["front"].append(video_info)
-                elif left_match:
-                    video_info["timestamp"] = left_match.group(1)
-                    videos["left"].append(video_info)
-                elif right_match:
-                    video_info["timestamp"] = right_match.group(1)
-                    videos["right"].append(video_info)
-                elif rear_match:
-                    video_info["timestamp"] = rear_match.group(1)
-                    videos["rear"].append(video_info)
-                elif filename.endswith(".mp4"):
-                    video_info["timestamp"] = "unknown"
-                    videos["other"].append(video_info)
+        for obj in self.catalog.objects(prefix):
+            key = obj["key"]
+            filename = key.split("/")[-1]
+            
+            # Match different types of video files
+            front_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front\.mp4", filename)
+            left_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-left\.mp4", filename)
+            right_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-right\.mp4", filename)
+            rear_match = re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-rear\.mp4", filename)
+            
+            video_info = {
+                "key": key,
+                "filename": filename,
+                "size": obj["size"],
+                "last_modified": obj["last_modified"]
+            }
+            
+            if front_match:
+                video_info["timestamp"] = front_match.group(1)
+                videos["front"].append(video_info)
+            elif left_match:
+                video_info["timestamp"] = left_match.group(1)
+                videos["left"].append(video_info)
+            elif right_match:
+                video_info["timestamp"] = right_match.group(1)
+                videos["right"].append(video_info)
+            elif rear_match:
+                video_info["timestamp"] = rear_match.group(1)
+                videos["rear"].append(video_info)
+            elif filename.endswith(".mp4"):
+                video_info["timestamp"] = "unknown"
+                videos["other"].append(video_info)
         
         # Sort by timestamp
         for video_type in videos:
@@ -1,51 +1,33 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional, Tuple
+from typing import List, Literal, Optional, Tuple
 import json
 import os
-import psycopg2
 from datetime import datetime, timedelta
-import boto3
+from aws_clients import s3_client
 import tempfile
 import os
 from pathlib import Path
 import shutil
 import uuid
+import numpy as np
 import pandas as pd
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import zipfile
 from fastapi import Response
 from io import BytesIO
+from db import DB_CONFIG, db_connection, db_pool_stats
+from executors import offload, run_blocking
+from jobs import no_progress, submit_job, job_manager
+from imu_reader import imu_points, load_imu_arrays, read_imu_table
+from parquet_window import epoch_seconds, first_column, parse_s3_url, read_window
+from s3_object_cache import video_cache
+from s3_presign import presign_get, verify_keys
+from scenario_events import SCENARIO_EVENT_TYPES, SCENARIO_INDEX_DB_HOST, event_type_of, index_watermark, known_event_types, scenario_filter_sql
+import pyarrow.parquet as pq
 
 router = APIRouter(prefix="/api/scenarios", tags=["scenarios"])
 
-# Database configuration for MCDB
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "matt3r-aurora-catalog-cluster.cluster-ro-cbbarg1ot9rc.us-west-2.rds.amazonaws.com"),
-    "port": os.getenv("DB_PORT", "5432"),
-    "database": os.getenv("DB_NAME", "postgres"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", "2gDaUYCNIt2kpMOWlRQi")
-}
-
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        print(f"Attempting to connect to database:")
-        print(f"  Host: {DB_CONFIG['host']}")
-        print(f"  Port: {DB_CONFIG['port']}")
-        print(f"  Database: {DB_CONFIG['database']}")
-        print(f"  User: {DB_CONFIG['user']}")
-        print(f"  Password: {'*' * len(DB_CONFIG['password'])}")
-        
-        conn = psycopg2.connect(**DB_CONFIG)
-        print("✅ Database connection successful!")
-        return conn
-    except Exception as e:
-        print(f"❌ Database connection error: {e}")
-        print("Please check your database credentials and network connection.")
-        return None
-
 # Data models
 class ScenarioQuery(BaseModel):
     event_types: List[str]
@@ -53,6 +35,10 @@ class ScenarioQuery(BaseModel):
     end_date: Optional[str] = None
     days_back: int = 7  # Keep for backward compatibility
     limit: int = 50
+    before_id: Optional[int] = None  # keyset cursor: next_cursor of the previous page
+    slim: bool = False  # omit data_links, return event names instead
+    stream: bool = False  # NDJSON, one scenario per line
+    video_urls: Literal["presign", "verify", "defer"] = "presign"  # see _attach_video_urls
 
 class Segment(BaseModel):
     start_time: float
@@ -119,342 +105,291 @@ os.makedirs(WISEAD_ARTIFACTS_DIR, exist_ok=True)
 os.makedirs(GEMINI_FRAMES_ARTIFACTS_DIR, exist_ok=True)
 os.makedirs(GEMINI_TEXT_ARTIFACTS_DIR, exist_ok=True)
 
-def get_s3_video_url(scenario_id: int, video_key: str = None) -> str:
-    """从S3获取视频的预签名URL"""
+def get_s3_video_url(scenario_id: int, video_key: str = None, verify: bool = True) -> str:
+    """Presigned URL of a scenario video, or None when ``verify`` finds no such object.
+
+    Signing is local and cached (s3_presign); only ``verify`` costs an S3
+    round trip.
+    """
     try:
-        print(f"Attempting to get S3 URL for scenario {scenario_id}")
-        s3_client = boto3.client('s3')
-        
         # If video_key is not provided, use default path
         if not video_key:
             video_key = f"scenarios/scenario_{scenario_id}.mp4"
         
-        print(f"Using S3 bucket: {S3_BUCKET}")
-        print(f"Using video key: {video_key}")
-        
         # First check if file exists
-        try:
-            s3_client.head_object(Bucket=S3_BUCKET, Key=video_key)
-            print(f"✅ Video file exists in S3: {video_key}")
-        except Exception as e:
-            print(f"❌ Video file not found in S3: {video_key}")
-            print(f"Error: {e}")
+        if verify and not verify_keys(S3_BUCKET, [video_key])[video_key]:
+            print(f"❌ Video file not found in S3: {S3_BUCKET}/{video_key}")
             return None
         
-        # Generate presigned URL, valid for 1 hour
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': S3_BUCKET,
-                'Key': video_key
-            },
-            ExpiresIn=3600
-        )
-        
-        print(f"✅ Generated presigned URL: {url[:100]}...")
-        return url
+        return presign_get(S3_BUCKET, video_key)
         
     except Exception as e:
         print(f"❌ Error generating S3 URL for scenario {scenario_id}: {e}")
         return None
 
 def download_video_from_s3(scenario_id: int, video_key: str) -> str:
-    """Download video from S3 to local"""
+    """Download video from S3 to the shared local video cache"""
     try:
-        ensure_download_dir()
-        
-        # Create local file path
-        local_filename = f"scenario_{scenario_id}.mp4"
-        local_path = os.path.join(DOWNLOAD_DIR, local_filename)
-        
-        # If file already exists, return path directly
-        if os.path.exists(local_path):
-            return local_path
-        
-        # Download video from S3
-        s3_client = boto3.client('s3')
-        s3_client.download_file(S3_BUCKET, video_key, local_path)
-        
-        print(f"Video downloaded: {local_path}")
+        local_path = video_cache.get_path(S3_BUCKET, video_key)
+        print(f"Video cached: {local_path}")
         return local_path
         
     except Exception as e:
         print(f"Error downloading video for scenario {scenario_id}: {e}")
         return None
 
+@router.get("/event-types")
+def get_event_types():
+    """Event types scenario search can filter on."""
+    return {"event_types": list(SCENARIO_EVENT_TYPES)}
+
+@router.post("/events-index/refresh")
+def refresh_events_index(full: bool = False):
+    """Queue a refresh of the scenario_events side index (full=true rebuilds it)."""
+    if not SCENARIO_INDEX_DB_HOST:
+        raise HTTPException(status_code=503, detail="scenario_events maintenance disabled (SCENARIO_INDEX_DB_HOST unset)")
+    return submit_job("refresh_scenario_events", {"full": full})
+
+# Most rows one /fetch call may return (pages are requested with before_id); the whole
+# page is held in memory, streamed or not
+SCENARIO_FETCH_MAX_LIMIT = int(os.getenv("SCENARIO_FETCH_MAX_LIMIT", "1000"))
+# Rows per round trip of the server-side cursor
+SCENARIO_FETCH_ITERSIZE = int(os.getenv("SCENARIO_FETCH_ITERSIZE", "200"))
+
+_FULL_COLUMNS = "d.data_links"
+# Slim rows carry only what the list view needs instead of the whole data_links document
+_SLIM_COLUMNS = ("jsonb_build_object('video', d.data_links->'video', 'trip', d.data_links->'trip', "
+                 "'events', jsonb_path_query_array(d.data_links, '$.coreml.*.event'))")
+
+
+def _fetch_sql(query: ScenarioQuery, cursor) -> Tuple[str, list]:
+    """SQL and parameters for one page of /fetch, newest first, starting below ``query.before_id``."""
+    # Only known event types filter; unknown ones are ignored as before
+    event_types = known_event_types(query.event_types)
+
+    # Handle date range: created_at bounds written against {col}, bound as parameters
+    if query.start_date and query.end_date:
+        # Use specified date range
+        date_sql = "AND {col} >= %s AND {col} <= %s"
+        date_params = [query.start_date, f"{query.end_date} 23:59:59"]
+    elif query.start_date:
+        # Only start date
+        date_sql = "AND {col} >= %s"
+        date_params = [query.start_date]
+    elif query.end_date:
+        # Only end date
+        date_sql = "AND {col} <= %s"
+        date_params = [f"{query.end_date} 23:59:59"]
+    else:
+        # Use default days_back (backward compatibility)
+        date_sql = "AND {col} >= NOW() - %s * INTERVAL '1 day'"
+        date_params = [query.days_back]
+
+    event_condition, event_params = "", []
+    if event_types:
+        # AND over event types: the scenario must contain every selected one.
+        # Served from the scenario_events side index when it exists.
+        event_sql, event_params = scenario_filter_sql(event_types, index_watermark(cursor), date_sql, date_params)
+        event_condition = f"AND {event_sql}"
+    # Keyset pagination: the next page starts below the last id seen, an index range on the primary key
+    keyset_condition, keyset_params = "", []
+    if query.before_id is not None:
+        keyset_condition, keyset_params = "AND d.id < %s", [query.before_id]
+    links = _SLIM_COLUMNS if query.slim else _FULL_COLUMNS
+    sql_query = f"""
+    SELECT d.id, d.org_id, d.key_id, d.vin, d.created_at, {links}, d.dmp_status, d.start_time, d.end_time, d.data_source_status, d.updated_at, d.osm_tags
+    FROM public.dmp d
+    WHERE d.dmp_status = 'SUCCESS'
+      AND jsonb_path_exists(d.data_links, '$.trip.console_trip ? (@ != null && @ != "null")')
+      {event_condition}
+      {date_sql.format(col="d.created_at")}
+      {keyset_condition}
+    ORDER BY d.id DESC
+    LIMIT %s
+    """
+    limit = max(1, min(query.limit, SCENARIO_FETCH_MAX_LIMIT))
+    return sql_query, [*event_params, *date_params, *keyset_params, limit]
+
+
+def _front_video_path(scenario_id: int, data_links) -> Optional[str]:
+    """Key of the front video in the footage bucket, from data_links.video.front (s3:// URL)."""
+    if not data_links or not isinstance(data_links, dict):
+        return None
+    video_path = None
+    # Check if there is a direct video path
+    video_data = data_links.get('video')
+    if isinstance(video_data, dict) and isinstance(video_data.get('front'), str):
+        # Extract relative path from complete URL
+        front_video_url = video_data['front']
+        if front_video_url.startswith('s3://'):
+            parts = front_video_url.split('/')
+            if len(parts) >= 4:  # s3://bucket-name/path...
+                # Drop s3:// and the bucket name, keep the key
+                video_path = '/'.join(parts[3:])
+    # Fall back to the default path when no video path is found
+    return video_path or f"scenarios/scenario_{scenario_id}.mp4"
+
+
+def _scenario_from_row(row, slim: bool) -> dict:
+    scenario_id, org_id, key_id, vin, created_at, data_links, dmp_status, start_time, end_time, data_source_status, updated_at, osm_tags = row
+
+    if slim:
+        # Slim rows: event names come pre-extracted, data_links is not returned
+        events = [e for e in (data_links or {}).get("events") or [] if isinstance(e, str)]
+        known = set(SCENARIO_EVENT_TYPES)
+        event_type = next((e for e in events if e in known), "unknown")
+    else:
+        # Determine event type from data_links
+        event_type = event_type_of(data_links)
+    video_path = _front_video_path(scenario_id, data_links)
+
+    scenario_data = {
+        "id": scenario_id,
+        "org_id": org_id,
+        "key_id": key_id,
+        "vin": vin,
+        "event_type": event_type,
+        "timestamp": created_at.isoformat() if created_at else "unknown",
+        "status": "pending",
+        "dmp_status": dmp_status,
+        "video_path": video_path,
+        "console_trip": (data_links.get("trip") or {}).get("console_trip") if data_links else None,
+        "start_time": start_time,
+        "end_time": end_time,
+        "data_source_status": data_source_status,
+        "created_at": created_at.isoformat() if created_at else "",
+        "updated_at": updated_at.isoformat() if updated_at else "",
+        "osm_tags": osm_tags
+    }
+    if slim:
+        scenario_data["events"] = events
+    else:
+        scenario_data["data_links"] = data_links
+
+    return scenario_data
+
+
+def _attach_video_urls(scenarios: List[dict], mode: str) -> None:
+    """Add video_url/s3_key to scenarios per ``mode`` (see ScenarioQuery.video_urls).
+
+    "presign" signs locally with no S3 call; "verify" first HEADs all keys
+    concurrently and leaves missing videos without a URL, as the old per-row
+    check did; "defer" adds nothing, the client asks /video-url/{id} when a
+    scenario is opened.
+    """
+    if mode == "defer":
+        return
+    exists = verify_keys(S3_BUCKET, [s["video_path"] for s in scenarios if s.get("video_path")]) if mode == "verify" else None
+    for scenario in scenarios:
+        video_path = scenario.get("video_path")
+        if not video_path or (exists is not None and not exists.get(video_path)):
+            continue
+        try:
+            scenario["video_url"] = presign_get(S3_BUCKET, video_path)
+            scenario["s3_key"] = video_path
+        except Exception as e:
+            print(f"Error generating S3 URL for scenario {scenario['id']}: {e}")
+
+
+def _mock_response(query: ScenarioQuery, note: str) -> dict:
+    filtered_scenarios = [
+        s for s in mock_scenarios 
+        if s["event_type"] in query.event_types
+    ][:query.limit]
+    return {
+        "status": "success",
+        "scenarios": filtered_scenarios,
+        "total": len(filtered_scenarios),
+        "query": query.dict(),
+        "next_cursor": None,
+        "note": note
+    }
+
+
+def _next_cursor(query: ScenarioQuery, count: int, last_id: Optional[int]) -> Optional[int]:
+    """before_id for the next page, or None when this page was the last one."""
+    limit = max(1, min(query.limit, SCENARIO_FETCH_MAX_LIMIT))
+    return last_id if count >= limit else None
+
+
+def _stream_ndjson(rows: list, query: ScenarioQuery):
+    """NDJSON lines: one scenario per line, then {"next_cursor", "total"}.
+
+    ``rows`` is the already-fetched page (at most ``limit`` rows), so no
+    pooled connection waits on a slow reader; scenarios are built and get
+    their video URLs SCENARIO_FETCH_ITERSIZE rows at a time as lines go out.
+    Streaming only shortens time to first byte: the raw page is in memory
+    either way, bounded by SCENARIO_FETCH_MAX_LIMIT.
+    """
+    try:
+        for first in range(0, len(rows), SCENARIO_FETCH_ITERSIZE):
+            # One batch at a time, so "verify" HEADs a whole batch concurrently
+            scenarios = [_scenario_from_row(row, query.slim) for row in rows[first:first + SCENARIO_FETCH_ITERSIZE]]
+            _attach_video_urls(scenarios, query.video_urls)
+            for scenario in scenarios:
+                yield json.dumps(scenario, default=str) + "\n"
+        last_id = rows[-1][0] if rows else None
+        yield json.dumps({"next_cursor": _next_cursor(query, len(rows), last_id), "total": len(rows)}) + "\n"
+    except Exception as e:
+        print(f"Error streaming scenarios: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
 @router.post("/fetch")
-async def fetch_scenarios(query: ScenarioQuery):
-    """Get scenario data"""
+@offload("db")
+def fetch_scenarios(query: ScenarioQuery):
+    """Get scenario data, one page at a time.
+
+    Pages are newest first; pass the returned ``next_cursor`` as ``before_id``
+    for the next one (null when there are no more rows). ``slim`` drops
+    data_links in favour of the event names; ``stream`` returns NDJSON.
+    """
     try:
-        conn = get_db_connection()
-        if not conn:
-            # Fallback to mock data if database connection fails
-            print("Using mock data due to database connection failure")
-            filtered_scenarios = [
-                s for s in mock_scenarios 
-                if s["event_type"] in query.event_types
-            ][:query.limit]
-            
-            return {
-                "status": "success",
-                "scenarios": filtered_scenarios,
-                "total": len(filtered_scenarios),
-                "query": query.dict(),
-                "note": "Using mock data - database connection failed"
-            }
-        
-        # Real database query
-        cursor = conn.cursor()
-        
-        # Build the query based on event types
-        event_conditions = []
-        for event_type in query.event_types:
-            if event_type == "fcw":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"fcw\")')")
-            elif event_type == "harsh-brake":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"harsh-brake\")')")
-            elif event_type == "lane-departure":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"lane-departure\")')")
-            elif event_type == "left-turn":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"left-turn\")')")
-            elif event_type == "right-turn":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"right-turn\")')")
-            elif event_type == "u-turn":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"u-turn\")')")
-            elif event_type == "pedestrian":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"pedestrian\")')")
-            elif event_type == "traffic-light":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"traffic-light\")')")
-            elif event_type == "stop-sign":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"stop-sign\")')")
-            elif event_type == "yield-sign":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"yield-sign\")')")
-            elif event_type == "speed-limit":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"speed-limit\")')")
-            elif event_type == "construction-zone":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"construction-zone\")')")
-            elif event_type == "school-zone":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"school-zone\")')")
-            elif event_type == "emergency-vehicle":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"emergency-vehicle\")')")
-            elif event_type == "weather-condition":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"weather-condition\")')")
-            elif event_type == "road-condition":
-                event_conditions.append("jsonb_path_exists(data_links, '$.coreml.* ? (@.event == \"road-condition\")')")
-        
-        # Build SQL query
-        # Handle date range
-        date_condition = ""
-        if query.start_date and query.end_date:
-            # Use specified date range
-            date_condition = f"AND created_at >= '{query.start_date}' AND created_at <= '{query.end_date} 23:59:59'"
-        elif query.start_date:
-            # Only start date
-            date_condition = f"AND created_at >= '{query.start_date}'"
-        elif query.end_date:
-            # Only end date
-            date_condition = f"AND created_at <= '{query.end_date} 23:59:59'"
-        else:
-            # Use default days_back (backward compatibility)
-            date_condition = f"AND created_at >= NOW() - INTERVAL '{query.days_back} days'"
-        
-        if not event_conditions:
-            # If no event types selected, only check dmp_status = 'SUCCESS'
-            sql_query = f"""
-            SELECT id, org_id, key_id, vin, created_at, data_links, dmp_status, start_time, end_time, data_source_status, updated_at, osm_tags
-            FROM public.dmp
-            WHERE dmp_status = 'SUCCESS'
-              AND jsonb_path_exists(data_links, '$.trip.console_trip ? (@ != null && @ != "null")')
-              {date_condition}
-            ORDER BY id DESC
-            LIMIT {query.limit};
-            """
-        else:
-            # If event types are selected, use AND condition to ensure scenario contains all selected event types
-            event_condition = " AND ".join(event_conditions)
-            sql_query = f"""
-            SELECT id, org_id, key_id, vin, created_at, data_links, dmp_status, start_time, end_time, data_source_status, updated_at, osm_tags
-            FROM public.dmp
-            WHERE dmp_status = 'SUCCESS'
-              AND jsonb_path_exists(data_links, '$.trip.console_trip ? (@ != null && @ != "null")')
-              AND ({event_condition})
-              {date_condition}
-            ORDER BY id DESC
-            LIMIT {query.limit};
-            """
-        
-        print(f"Executing SQL query: {sql_query}")
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        
-        scenarios = []
-        for row in rows:
-            scenario_id, org_id, key_id, vin, created_at, data_links, dmp_status, start_time, end_time, data_source_status, updated_at, osm_tags = row
-            
-            # Determine event type from data_links
-            event_type = "unknown"
-            if data_links and isinstance(data_links, dict):
-                coreml_events = data_links.get("coreml", {})
-                if isinstance(coreml_events, dict):
-                    # Handle object format coreml data
-                    for event_id, event_data in coreml_events.items():
-                        if isinstance(event_data, dict) and event_data.get("event") in [
-                            "fcw", "harsh-brake", "lane-departure", "left-turn", "right-turn", 
-                            "u-turn", "pedestrian", "traffic-light", "stop-sign", "yield-sign",
-                            "speed-limit", "construction-zone", "school-zone", "emergency-vehicle",
-                            "weather-condition", "road-condition"
-                        ]:
-                            event_type = event_data["event"]
-                            break
-                elif isinstance(coreml_events, list):
-                    # Compatible with array format
-                    for event in coreml_events:
-                        if isinstance(event, dict) and event.get("event") in [
-                            "fcw", "harsh-brake", "lane-departure", "left-turn", "right-turn", 
-                            "u-turn", "pedestrian", "traffic-light", "stop-sign", "yield-sign",
-                            "speed-limit", "construction-zone", "school-zone", "emergency-vehicle",
-                            "weather-condition", "road-condition"
-                        ]:
-                            event_type = event["event"]
-                            break
-            
-            # Extract video path from data_links
-            video_path = None
-            if data_links and isinstance(data_links, dict):
-                print(f"Data links for scenario {scenario_id}:")
-                print(f"  Keys: {list(data_links.keys())}")
-                
-                # Check if there is a direct video path
-                if 'video' in data_links and data_links['video']:
-                    video_data = data_links['video']
-                    print(f"  Found video data: {video_data}")
-                    
-                    if isinstance(video_data, dict) and 'front' in video_data:
-                        # Directly use front video complete S3 URL
-                        front_video_url = video_data['front']
-                        print(f"  Front video URL: {front_video_url}")
-                        
-                        # Extract relative path from complete URL
-                        if front_video_url.startswith('s3://'):
-                            parts = front_video_url.split('/')
-                            if len(parts) >= 4:  # s3://bucket-name/path...
-                                # 移除s3://和bucket-name，只保留相对路径
-                                relative_path = '/'.join(parts[3:])
-                                video_path = relative_path
-                                print(f"  Extracted video path: {video_path}")
-                
-                # 如果没有找到视频路径，使用默认路径
-                if not video_path:
-                    print(f"  No video path found, using default")
-                    video_path = f"scenarios/scenario_{scenario_id}.mp4"
-            
-            scenario_data = {
-                "id": scenario_id,
-                "org_id": org_id,
-                "key_id": key_id,
-                "vin": vin,
-                "event_type": event_type,
-                "timestamp": created_at.isoformat() if created_at else "unknown",
-                "status": "pending",
-                "dmp_status": dmp_status,
-                "data_links": data_links,
-                "video_path": video_path,
-                "console_trip": data_links.get("trip", {}).get("console_trip") if data_links else None,
-                "start_time": start_time,
-                "end_time": end_time,
-                "data_source_status": data_source_status,
-                "created_at": created_at.isoformat() if created_at else "",
-                "updated_at": updated_at.isoformat() if updated_at else "",
-                "osm_tags": osm_tags
-            }
-            
-            # 如果有video_path，生成S3 URL
-            if video_path:
-                try:
-                    s3_url = get_s3_video_url(scenario_id, video_path)
-                    if s3_url:
-                        scenario_data["video_url"] = s3_url
-                        scenario_data["s3_key"] = video_path
-                except Exception as e:
-                    print(f"Error generating S3 URL for scenario {scenario_id}: {e}")
-            
-            scenarios.append(scenario_data)
-        
-        cursor.close()
-        conn.close()
-        
-        print(f"Found {len(scenarios)} scenarios")
-        print("=" * 50)
-        print("📊 FETCH RESULTS SUMMARY:")
-        print("=" * 50)
-        
-        for i, scenario in enumerate(scenarios[:5]):  # 只显示前5个场景
-            print(f"\n🔍 Scenario {i+1}: ID={scenario['id']}")
-            print(f"   Event Type: {scenario['event_type']}")
-            print(f"   Console Trip: {scenario['console_trip']}")
-            print(f"   Video URL: {'✅' if 'video_url' in scenario else '❌'}")
-            
-            # 显示data_links的关键信息
-            if scenario.get('data_links'):
-                data_links = scenario['data_links']
-                print(f"   Data Links Keys: {list(data_links.keys())}")
-                
-                # 显示coreml events数量
-                coreml_events = data_links.get("coreml", {})
-                if isinstance(coreml_events, dict):
-                    print(f"   CoreML Events: {len(coreml_events)} events")
-                    if len(coreml_events) > 0:
-                        print(f"   First 3 events:")
-                        for j, (event_id, event_data) in enumerate(list(coreml_events.items())[:3]):
-                            if isinstance(event_data, dict):
-                                event_type = event_data.get("event", "unknown")
-                                timestamp = event_data.get("timestamp", "no timestamp")
-                                print(f"     {j+1}. {event_type} @ {timestamp}")
-                            else:
-                                print(f"     {j+1}. Invalid format: {event_data}")
-                elif isinstance(coreml_events, list):
-                    print(f"   CoreML Events: {len(coreml_events)} events (array format)")
-                    if len(coreml_events) > 0:
-                        print(f"   First 3 events:")
-                        for j, event in enumerate(coreml_events[:3]):
-                            if isinstance(event, dict):
-                                event_type = event.get("event", "unknown")
-                                timestamp = event.get("timestamp", "no timestamp")
-                                print(f"     {j+1}. {event_type} @ {timestamp}")
-                            else:
-                                print(f"     {j+1}. Invalid format: {event}")
-                else:
-                    print(f"   CoreML Events: ❌ Not found or invalid format")
-            else:
-                print(f"   Data Links: ❌ Not found")
-        
+        # Real database query (connection is returned to the pool before S3 work below)
+        with db_connection() as conn:
+            if not conn:
+                # Fallback to mock data if database connection fails
+                print("Using mock data due to database connection failure")
+                return _mock_response(query, "Using mock data - database connection failed")
+
+            cursor = conn.cursor()
+            sql_query, params = _fetch_sql(query, cursor)
+            cursor.close()
+            print(f"Executing SQL query: {sql_query} params={params}")
+            # Server-side cursor: rows arrive SCENARIO_FETCH_ITERSIZE at a time instead of one big buffer
+            named = conn.cursor(name=f"scenario_fetch_{uuid.uuid4().hex[:12]}")
+            named.itersize = SCENARIO_FETCH_ITERSIZE
+            named.execute(sql_query, params)
+            rows = list(named)
+            named.close()
+
+        if query.stream:
+            # The page is read and the connection released before streaming; slow readers hold no pool slot
+            return StreamingResponse(_stream_ndjson(rows, query), media_type="application/x-ndjson")
+
+        scenarios = [_scenario_from_row(row, query.slim) for row in rows]
+        _attach_video_urls(scenarios, query.video_urls)
+        next_cursor = _next_cursor(query, len(scenarios), scenarios[-1]["id"] if scenarios else None)
+
+        print(f"Found {len(scenarios)} scenarios (next_cursor={next_cursor})")
+        for i, scenario in enumerate(scenarios[:5]):  # Only the first 5 scenarios
+            print(f"🔍 Scenario {i+1}: ID={scenario['id']} event={scenario['event_type']} "
+                  f"video={'✅' if 'video_url' in scenario else '❌'}")
         if len(scenarios) > 5:
-            print(f"\n... and {len(scenarios) - 5} more scenarios")
-        
-        print("=" * 50)
-        
+            print(f"... and {len(scenarios) - 5} more scenarios")
+
         return {
             "status": "success",
             "scenarios": scenarios,
             "total": len(scenarios),
-            "query": query.dict()
+            "query": query.dict(),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
         print(f"Error fetching scenarios: {e}")
         # Fallback to mock data
-        filtered_scenarios = [
-            s for s in mock_scenarios 
-            if s["event_type"] in query.event_types
-        ][:query.limit]
-        
-        return {
-            "status": "success",
-            "scenarios": filtered_scenarios,
-            "total": len(filtered_scenarios),
-            "query": query.dict(),
-            "note": f"Using mock data - error: {str(e)}"
-        }
+        return _mock_response(query, f"Using mock data - error: {str(e)}")
 
 @router.post("/review")
 async def save_review_data(review_data: ReviewData):
@@ -483,58 +418,61 @@ async def save_review_data(review_data: ReviewData):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/process")
-async def process_scenarios(process_params: ProcessParams, background_tasks: BackgroundTasks):
-    """处理场景数据"""
+async def process_scenarios(process_params: ProcessParams):
+    """处理场景数据 - queue one background job per scenario"""
     try:
-        # Simulate processing
         processing_results = []
         
         for scenario_id in process_params.scenario_ids:
-            result = {
+            payload = {
                 "scenario_id": scenario_id,
-                "status": "processing",
+                "generate_videos": process_params.generate_videos,
+                "extract_data": process_params.extract_data,
+                "create_visualizations": process_params.create_visualizations,
+            }
+            job = submit_job("process_scenario", payload, scenario_id=scenario_id)
+            processing_results.append({
+                "scenario_id": scenario_id,
+                "job_id": job["job_id"],
+                "status": "queued",
                 "progress": 0,
                 "outputs": []
-            }
-            
-            if process_params.generate_videos:
-                result["outputs"].append("cropped_video.mp4")
-            
-            if process_params.extract_data:
-                result["outputs"].append("trip_data.parquet")
-            
-            if process_params.create_visualizations:
-                result["outputs"].append("map_visualization.html")
-            
-            processing_results.append(result)
-        
-        # Simulate background processing
-        background_tasks.add_task(simulate_processing, processing_results)
+            })
         
         return {
             "status": "success",
             "message": f"Processing started for {len(process_params.scenario_ids)} scenarios",
             "processing_results": processing_results
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/status/{scenario_id}")
-async def get_processing_status(scenario_id: int):
-    """获取处理状态"""
+def get_processing_status(scenario_id: int):
+    """获取处理状态 (latest job submitted for this scenario)"""
     try:
-        # Simulate status check
-        status = {
-            "scenario_id": scenario_id,
-            "status": "completed",
-            "progress": 100,
-            "outputs": [
-                "cropped_video.mp4",
-                "trip_data.parquet",
-                "map_visualization.html"
-            ],
-            "completed_at": datetime.now().isoformat()
-        }
+        job = job_manager.latest_for_scenario(scenario_id)
+        if not job:
+            status = {
+                "scenario_id": scenario_id,
+                "status": "not_started",
+                "progress": 0,
+                "outputs": []
+            }
+        else:
+            status = {
+                "scenario_id": scenario_id,
+                "job_id": job["job_id"],
+                "kind": job["kind"],
+                "status": "completed" if job["status"] == "succeeded" else job["status"],
+                "stage": job["stage"],
+                "progress": job["progress"],
+                "outputs": job["outputs"],
+                "error": job["error"],
+                "completed_at": job["completed_at"]
+            }
         
         return {
             "status": "success",
@@ -556,35 +494,35 @@ async def list_scenarios():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/video-url/{scenario_id}")
-async def get_scenario_video_url(scenario_id: int):
+@offload("db")
+def get_scenario_video_url(scenario_id: int):
     """获取场景视频的S3预签名URL"""
     try:
         print(f"🔍 Requesting video URL for scenario {scenario_id}")
         
         # 从数据库获取场景信息和视频路径
-        conn = get_db_connection()
-        if not conn:
-            return {
-                "status": "error",
-                "message": "Database connection failed",
-                "scenario_id": scenario_id
-            }
+        with db_connection() as conn:
+            if not conn:
+                return {
+                    "status": "error",
+                    "message": "Database connection failed",
+                    "scenario_id": scenario_id
+                }
         
-        cursor = conn.cursor()
+            cursor = conn.cursor()
         
-        # 查询场景信息和视频路径
-        sql_query = """
-        SELECT id, data_links, created_at
-        FROM public.dmp
-        WHERE id = %s
-        """
+            # 查询场景信息和视频路径
+            sql_query = """
+            SELECT id, data_links, created_at
+            FROM public.dmp
+            WHERE id = %s
+            """
         
-        cursor.execute(sql_query, (scenario_id,))
-        row = cursor.fetchone()
+            cursor.execute(sql_query, (scenario_id,))
+            row = cursor.fetchone()
+            cursor.close()
         
         if not row:
-            cursor.close()
-            conn.close()
             return {
                 "status": "error",
                 "message": f"Scenario {scenario_id} not found in database",
@@ -592,8 +530,6 @@ async def get_scenario_video_url(scenario_id: int):
             }
         
         scenario_id_db, data_links, created_at = row
-        cursor.close()
-        conn.close()
         
         print(f"Found scenario {scenario_id} in database")
         print(f"Data links: {data_links}")
@@ -658,7 +594,8 @@ async def get_scenario_video_url(scenario_id: int):
         }
 
 @router.post("/download-video/{scenario_id}")
-async def download_scenario_video(scenario_id: int):
+@offload("io")
+def download_scenario_video(scenario_id: int):
     """下载指定场景的视频"""
     try:
         # 这里需要根据scenario_id从数据库获取实际的视频路径
@@ -686,13 +623,13 @@ async def download_scenario_video(scenario_id: int):
         }
 
 @router.get("/video-status/{scenario_id}")
-async def get_video_status(scenario_id: int):
+@offload("io")
+def get_video_status(scenario_id: int):
     """检查视频下载状态"""
     try:
-        local_filename = f"scenario_{scenario_id}.mp4"
-        local_path = os.path.join(DOWNLOAD_DIR, local_filename)
+        local_path = video_cache.peek_path(S3_BUCKET, f"scenarios/scenario_{scenario_id}.mp4")
         
-        if os.path.exists(local_path):
+        if local_path and os.path.exists(local_path):
             file_size = os.path.getsize(local_path)
             return {
                 "status": "downloaded",
@@ -709,28 +646,16 @@ async def get_video_status(scenario_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def simulate_processing(processing_results):
-    """模拟后台处理"""
-    import asyncio
-    
-    for result in processing_results:
-        # Simulate processing time
-        for i in range(10):
-            await asyncio.sleep(0.5)
-            result["progress"] = (i + 1) * 10
-        
-        result["status"] = "completed"
-        result["completed_at"] = datetime.now().isoformat() 
-
 @router.get("/test-s3-access")
-async def test_s3_access():
+@offload("io")
+def test_s3_access():
     """测试S3访问权限"""
     try:
         print("🔍 Testing S3 access...")
-        s3_client = boto3.client('s3')
+        s3 = s3_client()
         
         # 列出存储桶中的对象
-        response = s3_client.list_objects_v2(
+        response = s3.list_objects_v2(
             Bucket=S3_BUCKET,
             MaxKeys=10
         )
@@ -758,34 +683,34 @@ async def test_s3_access():
         } 
 
 @router.get("/debug/scenario/{scenario_id}")
-async def debug_scenario(scenario_id: int):
+@offload("db")
+def debug_scenario(scenario_id: int):
     """调试场景数据"""
     try:
         print(f"🔍 Debugging scenario {scenario_id}")
         
-        conn = get_db_connection()
-        if not conn:
-            return {
-                "status": "error",
-                "message": "Database connection failed",
-                "scenario_id": scenario_id
-            }
+        with db_connection() as conn:
+            if not conn:
+                return {
+                    "status": "error",
+                    "message": "Database connection failed",
+                    "scenario_id": scenario_id
+                }
         
-        cursor = conn.cursor()
+            cursor = conn.cursor()
         
-        # 查询场景信息
-        sql_query = """
-        SELECT id, data_links, created_at, dmp_status
-        FROM public.dmp
-        WHERE id = %s
-        """
+            # 查询场景信息
+            sql_query = """
+            SELECT id, data_links, created_at, dmp_status
+            FROM public.dmp
+            WHERE id = %s
+            """
         
-        cursor.execute(sql_query, (scenario_id,))
-        row = cursor.fetchone()
+            cursor.execute(sql_query, (scenario_id,))
+            row = cursor.fetchone()
+            cursor.close()
         
         if not row:
-            cursor.close()
-            conn.close()
             return {
                 "status": "error",
                 "message": f"Scenario {scenario_id} not found in database",
@@ -793,8 +718,6 @@ async def debug_scenario(scenario_id: int):
             }
         
         scenario_id_db, data_links, created_at, dmp_status = row
-        cursor.close()
-        conn.close()
         
         return {
             "status": "success",
@@ -815,31 +738,32 @@ async def debug_scenario(scenario_id: int):
         } 
 
 @router.get("/test-db-connection")
-async def test_db_connection():
+@offload("db")
+def test_db_connection():
     """测试数据库连接"""
     try:
         print("🔍 Testing database connection...")
         
-        conn = get_db_connection()
-        if not conn:
-            return {
-                "status": "error",
-                "message": "Database connection failed",
-                "config": {
-                    "host": DB_CONFIG["host"],
-                    "port": DB_CONFIG["port"],
-                    "database": DB_CONFIG["database"],
-                    "user": DB_CONFIG["user"],
-                    "password_length": len(DB_CONFIG["password"])
+        with db_connection() as conn:
+            if not conn:
+                return {
+                    "status": "error",
+                    "message": "Database connection failed",
+                    "config": {
+                        "host": DB_CONFIG["host"],
+                        "port": DB_CONFIG["port"],
+                        "database": DB_CONFIG["database"],
+                        "user": DB_CONFIG["user"],
+                        "password_length": len(DB_CONFIG["password"])
+                    },
+                    "pool": db_pool_stats()
                 }
-            }
-        
-        # 测试查询
-        cursor = conn.cursor()
-        cursor.execute("SELECT version()")
-        version = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            
+            # 测试查询
+            cursor = conn.cursor()
+            cursor.execute("SELECT version()")
+            version = cursor.fetchone()
+            cursor.close()
         
         return {
             "status": "success",
@@ -851,7 +775,8 @@ async def test_db_connection():
                 "database": DB_CONFIG["database"],
                 "user": DB_CONFIG["user"],
                 "password_length": len(DB_CONFIG["password"])
-            }
+            },
+            "pool": db_pool_stats()
         }
         
     except Exception as e:
@@ -869,34 +794,34 @@ async def test_db_connection():
         }
 
 @router.get("/activity-timeline/{scenario_id}")
-async def get_activity_timeline(scenario_id: int):
+@offload("db")
+def get_activity_timeline(scenario_id: int):
     """获取场景的activity时间节点"""
     try:
         print(f"🔍 Getting activity timeline for scenario {scenario_id}")
         
-        conn = get_db_connection()
-        if not conn:
-            return {
-                "status": "error",
-                "message": "Database connection failed",
-                "scenario_id": scenario_id
-            }
+        with db_connection() as conn:
+            if not conn:
+                return {
+                    "status": "error",
+                    "message": "Database connection failed",
+                    "scenario_id": scenario_id
+                }
         
-        cursor = conn.cursor()
+            cursor = conn.cursor()
         
-        # 查询场景信息和data_links
-        sql_query = """
-        SELECT id, data_links, created_at, start_time, end_time
-        FROM public.dmp
-        WHERE id = %s
-        """
+            # 查询场景信息和data_links
+            sql_query = """
+            SELECT id, data_links, created_at, start_time, end_time
+            FROM public.dmp
+            WHERE id = %s
+            """
         
-        cursor.execute(sql_query, (scenario_id,))
-        row = cursor.fetchone()
+            cursor.execute(sql_query, (scenario_id,))
+            row = cursor.fetchone()
+            cursor.close()
         
         if not row:
-            cursor.close()
-            conn.close()
             return {
                 "status": "error",
                 "message": f"Scenario {scenario_id} not found in database",
@@ -904,8 +829,6 @@ async def get_activity_timeline(scenario_id: int):
             }
         
         scenario_id_db, data_links, created_at, start_time, end_time = row
-        cursor.close()
-        conn.close()
         
         # 解析data_links中的activity时间节点
         activities = []
@@ -1081,20 +1004,22 @@ async def get_activity_timeline(scenario_id: int):
         } 
 
 @router.post("/imu/extract")
-async def extract_imu_data(request: dict):
+@offload("io")
+def extract_imu_data(request: dict):
     """提取IMU数据（gyro和accel）"""
     try:
         scenario_id = request.get('scenario_id')
         if not scenario_id:
             return {"status": "error", "message": "Missing scenario_id"}
         
-        conn = get_db_connection()
-        if not conn:
-            return {"status": "error", "message": "Database connection failed"}
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT data_links FROM public.dmp WHERE id = %s", (scenario_id,))
-        row = cursor.fetchone()
+        with db_connection() as conn:
+            if not conn:
+                return {"status": "error", "message": "Database connection failed"}
+            
+            cursor = conn.cursor()
+            cursor.execute("SELECT data_links FROM public.dmp WHERE id = %s", (scenario_id,))
+            row = cursor.fetchone()
+            cursor.close()
         
         if not row:
             return {"status": "error", "message": "Scenario not found"}
@@ -1120,7 +1045,7 @@ async def extract_imu_data(request: dict):
                         # 这里需要根据实际的IMU数据格式来解析
                         # 假设是parquet格式，包含timestamp, x, y, z列
                         # 实际实现需要根据您的数据格式调整
-                        gyro_data = load_imu_data_from_s3(gyro_url)
+                        gyro_data = imu_points(load_imu_arrays(gyro_url))
                         imu_data["gyro"] = gyro_data
                         print(f"✅ Loaded {len(gyro_data)} gyro data points")
                     except Exception as e:
@@ -1132,15 +1057,12 @@ async def extract_imu_data(request: dict):
                         accel_url = imu_links['accel']
                         print(f"📊 Loading accel data from: {accel_url}")
                         
-                        accel_data = load_imu_data_from_s3(accel_url)
+                        accel_data = imu_points(load_imu_arrays(accel_url))
                         imu_data["accel"] = accel_data
                         print(f"✅ Loaded {len(accel_data)} accel data points")
                     except Exception as e:
                         print(f"❌ Error loading accel data: {e}")
         
-        cursor.close()
-        conn.close()
-        
         return {
             "status": "success",
             "imu_data": imu_data,
@@ -1151,106 +1073,9 @@ async def extract_imu_data(request: dict):
         print(f"❌ Error extracting IMU data: {e}")
         return {"status": "error", "message": str(e)}
 
-def load_imu_data_from_s3(s3_url):
-    """从S3加载IMU数据"""
-    try:
-        # 解析S3 URL
-        if s3_url.startswith('s3://'):
-            parts = s3_url.split('/')
-            bucket = parts[2]
-            key = '/'.join(parts[3:])
-        else:
-            return []
-        
-        print(f"📊 Loading IMU data from S3: bucket={bucket}, key={key}")
-        
-        # 使用boto3从S3读取parquet文件
-        import boto3
-        import pandas as pd
-        from io import BytesIO
-        
-        s3_client = boto3.client('s3')
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-
-        # 读取parquet数据（更健壮：fastparquet -> pyarrow.parquet -> pyarrow 引擎）
-        raw = BytesIO(response['Body'].read())
-        try:
-            df = pd.read_parquet(raw, engine='fastparquet')
-        except Exception:
-            try:
-                raw.seek(0)
-                import pyarrow.parquet as pq  # 延迟导入
-                table = pq.read_table(raw)
-                df = table.to_pandas()
-            except Exception:
-                raw.seek(0)
-                df = pd.read_parquet(raw, engine='pyarrow')
-        
-        print(f"📊 IMU data shape: {df.shape}")
-        print(f"📊 IMU data columns: {list(df.columns)}")
-        print(f"📊 First few rows:")
-        print(df.head())
-        
-        # 查找可能的列名
-        timestamp_col = None
-        x_col = None
-        y_col = None
-        z_col = None
-        
-        # 查找时间戳列
-        for col in df.columns:
-            col_lower = col.lower()
-            if any(keyword in col_lower for keyword in ['timestamp', 'time', 'ts']):
-                timestamp_col = col
-                break
-        
-        # 查找x, y, z列 - 支持多种命名格式
-        for col in df.columns:
-            col_lower = col.lower()
-            # 标准格式
-            if col_lower in ['x', 'gyro_x', 'accel_x']:
-                x_col = col
-            elif col_lower in ['y', 'gyro_y', 'accel_y']:
-                y_col = col
-            elif col_lower in ['z', 'gyro_z', 'accel_z']:
-                z_col = col
-            # 车辆坐标系格式 (lr=left-right, bf=back-front, vert=vertical)
-            elif col_lower in ['lr_w', 'lr_acc', 'lr']:
-                x_col = col
-            elif col_lower in ['bf_w', 'bf_acc', 'bf']:
-                y_col = col
-            elif col_lower in ['vert_w', 'vert_acc', 'vert']:
-                z_col = col
-        
-        print(f"📊 Found columns: timestamp={timestamp_col}, x={x_col}, y={y_col}, z={z_col}")
-        
-        # 转换为前端需要的格式
-        data_points = []
-        for _, row in df.iterrows():
-            data_point = {
-                "timestamp": float(row.get(timestamp_col, 0)) if timestamp_col else 0,
-                "x": float(row.get(x_col, 0)) if x_col else 0,
-                "y": float(row.get(y_col, 0)) if y_col else 0,
-                "z": float(row.get(z_col, 0)) if z_col else 0
-            }
-            data_points.append(data_point)
-        
-        print(f"📊 Converted {len(data_points)} data points")
-        if data_points:
-            print(f"📊 Sample data point: {data_points[0]}")
-        
-        return data_points
-        
-    except Exception as e:
-        print(f"❌ Error loading IMU data from S3: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-
-
-
 @router.post("/gps/extract")
-async def extract_gps_data(request: dict):
+@offload("io")
+def extract_gps_data(request: dict):
     """从 console_trip 中提取 GPS 数据"""
     try:
         console_trip_url = request.get("console_trip_url")
@@ -1283,129 +1108,58 @@ async def extract_gps_data(request: dict):
         print(f"📦 Bucket: {bucket_name}")
         print(f"🔑 Key: {key}")
         
-        # 直接使用 boto3 + BytesIO 读取 parquet（与 IMU 同路径，避免 s3fs 差异）
+        # 可选时间窗口：只读取与 [start_time, end_time] 重叠的 row group
+        start_time = request.get("start_time")
+        end_time = request.get("end_time")
+        start_time = float(start_time) if start_time is not None else None
+        end_time = float(end_time) if end_time is not None else None
+        
         try:
-            s3 = boto3.client('s3')
-            obj = s3.get_object(Bucket=bucket_name, Key=key)
-            raw = BytesIO(obj['Body'].read())
-            try:
-                df = pd.read_parquet(raw, engine='fastparquet')
-            except Exception:
-                try:
-                    raw.seek(0)
-                    import pyarrow.parquet as pq
-                    table = pq.read_table(raw)
-                    df = table.to_pandas()
-                except Exception:
-                    raw.seek(0)
-                    df = pd.read_parquet(raw, engine='pyarrow')
-            print(f"✅ Successfully loaded parquet file with {len(df)} rows")
-            print(f"📊 Columns: {list(df.columns)}")
-            
-            # 查找GPS相关的列
-            gps_columns = []
-            for col in df.columns:
-                col_lower = col.lower()
-                if any(keyword in col_lower for keyword in ['lat', 'lon', 'lng', 'latitude', 'longitude', 'gps']):
-                    gps_columns.append(col)
-            
-            print(f"🎯 Found GPS columns: {gps_columns}")
-            
-            if not gps_columns:
+            picked = {}
+            def pick(schema):
+                # 查找GPS相关的列（与逐行版本相同的规则：最后一个匹配的 lat / lon 列）
+                gps_columns = [c for c in schema.names
+                               if any(k in c.lower() for k in ['lat', 'lon', 'lng', 'latitude', 'longitude', 'gps'])]
+                picked['gps'] = gps_columns
+                picked['lat'] = next((c for c in reversed(gps_columns) if 'lat' in c.lower()), None)
+                picked['lon'] = next((c for c in reversed(gps_columns)
+                                      if 'lat' not in c.lower() and ('lon' in c.lower() or 'lng' in c.lower())), None)
+                picked['speed'] = first_column(schema.names, ['speed'])
+                picked['heading'] = first_column(schema.names, ['heading', 'bearing', 'direction'])
+                return [picked['lat'], picked['lon'], picked['speed'], picked['heading']]
+            table, timestamp_col = read_window(console_trip_url, start_time, end_time, columns=pick)
+            print(f"✅ Loaded {table.num_rows} rows, columns: {table.column_names}")
+            print(f"🎯 Found GPS columns: {picked['gps']}")
+            
+            if not picked['gps']:
                 return {
                     "status": "error",
                     "message": "No GPS columns found in parquet file"
                 }
             
-            # 提取GPS数据
             points = []
-            for idx, row in df.iterrows():
-                point = {}
-                
-                # 查找经纬度列
-                lat_col = None
-                lon_col = None
-                
-                for col in gps_columns:
-                    col_lower = col.lower()
-                    if 'lat' in col_lower:
-                        lat_col = col
-                    elif 'lon' in col_lower or 'lng' in col_lower:
-                        lon_col = col
-                
-                if lat_col and lon_col:
-                    lat = row[lat_col]
-                    lon = row[lon_col]
-                    
-                    # 检查是否为有效坐标
-                    try:
-                        # 确保数据类型转换
-                        lat_val = float(lat) if pd.notna(lat) else None
-                        lon_val = float(lon) if pd.notna(lon) else None
-                        
-                        if lat_val is not None and lon_val is not None and -90 <= lat_val <= 90 and -180 <= lon_val <= 180:
-                            point["lat"] = lat_val
-                            point["lon"] = lon_val
-                            
-                            # 查找时间戳列
-                            timestamp_col = None
-                            for col in df.columns:
-                                col_lower = col.lower()
-                                if any(keyword in col_lower for keyword in ['timestamp', 'time', 'ts']):
-                                    timestamp_col = col
-                                    break
-                            
-                            if timestamp_col:
-                                timestamp = row[timestamp_col]
-                                if pd.notna(timestamp):
-                                    # 如果是datetime对象，转换为timestamp
-                                    if hasattr(timestamp, 'timestamp'):
-                                        point["timestamp"] = timestamp.timestamp()
-                                    else:
-                                        point["timestamp"] = float(timestamp)
-                                else:
-                                    point["timestamp"] = float(idx)  # 使用行索引作为时间戳
-                            else:
-                                point["timestamp"] = float(idx)
-                            
-                            # 查找速度列
-                            speed_col = None
-                            for col in df.columns:
-                                col_lower = col.lower()
-                                if 'speed' in col_lower:
-                                    speed_col = col
-                                    break
-                            
-                            if speed_col:
-                                speed = row[speed_col]
-                                if pd.notna(speed):
-                                    point["speed"] = float(speed)
-                                else:
-                                    point["speed"] = 0.0
-                            else:
-                                point["speed"] = 0.0
-                            
-                            # 查找方向列
-                            heading_col = None
-                            for col in df.columns:
-                                col_lower = col.lower()
-                                if any(keyword in col_lower for keyword in ['heading', 'bearing', 'direction']):
-                                    heading_col = col
-                                    break
-                            
-                            if heading_col:
-                                heading = row[heading_col]
-                                if pd.notna(heading):
-                                    point["heading"] = float(heading)
-                                else:
-                                    point["heading"] = 0.0
-                            else:
-                                point["heading"] = 0.0
-                            
-                            points.append(point)
-                    except (ValueError, TypeError) as e:
-                        # 跳过无效的坐标数据
-                        continue
+            if picked['lat'] and picked['lon'] and table.num_rows:
+                def numeric(col):
+                    return pd.to_numeric(table.column(col).to_pandas(), errors='coerce').to_numpy(dtype=float)
+                lat = numeric(picked['lat'])
+                lon = numeric(picked['lon'])
+                row_index = np.arange(table.num_rows, dtype=float)
+                if timestamp_col:
+                    ts = epoch_seconds(table.column(timestamp_col))
+                    # 缺失的时间戳使用行索引
+                    ts = np.where(np.isnan(ts), row_index, ts)
+                else:
+                    ts = row_index
+                zeros = np.zeros(table.num_rows)
+                speed = np.nan_to_num(numeric(picked['speed'])) if picked['speed'] else zeros
+                heading = np.nan_to_num(numeric(picked['heading'])) if picked['heading'] else zeros
+                # 只保留有效坐标
+                valid = ~np.isnan(lat) & ~np.isnan(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+                points = [
+                    {"lat": a, "lon": o, "timestamp": t, "speed": v, "heading": h}
+                    for a, o, t, v, h in zip(lat[valid].tolist(), lon[valid].tolist(), ts[valid].tolist(),
+                                             speed[valid].tolist(), heading[valid].tolist())
+                ]
             
             print(f"✅ Extracted {len(points)} GPS points")
             
@@ -1437,52 +1191,52 @@ async def extract_gps_data(request: dict):
         }
 
 @router.post("/annotations/write-back")
-async def write_annotations_to_db(annotations_data: AnnotationsData):
+@offload("db")
+def write_annotations_to_db(annotations_data: AnnotationsData):
     """将标注数据写回到dmp table"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            if not conn:
+                raise HTTPException(status_code=500, detail="Database connection failed")
         
-        # 首先检查annotations列是否存在，如果不存在则添加
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'dmp' AND column_name = 'annotations'
-        """)
+            cursor = conn.cursor()
         
-        if not cursor.fetchone():
-            print("Adding annotations column to dmp table...")
+            # 首先检查annotations列是否存在，如果不存在则添加
             cursor.execute("""
-                ALTER TABLE dmp 
-                ADD COLUMN annotations JSONB
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'dmp' AND column_name = 'annotations'
             """)
-            conn.commit()
-            print("✅ Annotations column added successfully")
         
-        # 更新每个scenario的annotations
-        updated_count = 0
-        for scenario_id, annotations_list in annotations_data.annotations.items():
-            if annotations_list:  # 只更新有标注的scenario
-                annotations_json = json.dumps(annotations_list)
-                
+            if not cursor.fetchone():
+                print("Adding annotations column to dmp table...")
                 cursor.execute("""
-                    UPDATE dmp 
-                    SET annotations = %s 
-                    WHERE id = %s
-                """, (annotations_json, int(scenario_id)))
+                    ALTER TABLE dmp 
+                    ADD COLUMN annotations JSONB
+                """)
+                conn.commit()
+                print("✅ Annotations column added successfully")
+        
+            # 更新每个scenario的annotations
+            updated_count = 0
+            for scenario_id, annotations_list in annotations_data.annotations.items():
+                if annotations_list:  # 只更新有标注的scenario
+                    annotations_json = json.dumps(annotations_list)
                 
-                if cursor.rowcount > 0:
-                    updated_count += 1
-                    print(f"✅ Updated scenario {scenario_id} with {len(annotations_list)} annotations")
-                else:
-                    print(f"⚠️  Scenario {scenario_id} not found in dmp table")
+                    cursor.execute("""
+                        UPDATE dmp 
+                        SET annotations = %s 
+                        WHERE id = %s
+                    """, (annotations_json, int(scenario_id)))
+                
+                    if cursor.rowcount > 0:
+                        updated_count += 1
+                        print(f"✅ Updated scenario {scenario_id} with {len(annotations_list)} annotations")
+                    else:
+                        print(f"⚠️  Scenario {scenario_id} not found in dmp table")
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            cursor.close()
         
         return {
             "status": "success",
@@ -1492,13 +1246,11 @@ async def write_annotations_to_db(annotations_data: AnnotationsData):
         
     except Exception as e:
         print(f"❌ Error writing annotations to database: {e}")
-        if 'conn' in locals() and conn:
-            conn.rollback()
-            conn.close()
         raise HTTPException(status_code=500, detail=f"Database update failed: {str(e)}")
 
 @router.post("/video/clip")
-async def clip_video(request: dict):
+@offload("media")
+def clip_video(request: dict):
     """基于时间戳裁剪视频"""
     try:
         scenario_id = request.get("scenario_id")
@@ -1517,30 +1269,27 @@ async def clip_video(request: dict):
             }
         
         # 获取场景的视频信息
-        conn = get_db_connection()
-        if not conn:
-            return {
-                "status": "error",
-                "message": "Database connection failed"
-            }
+        with db_connection() as conn:
+            if not conn:
+                return {
+                    "status": "error",
+                    "message": "Database connection failed"
+                }
         
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT data_links FROM public.dmp WHERE id = %s
-        """, (scenario_id,))
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT data_links FROM public.dmp WHERE id = %s
+            """, (scenario_id,))
         
-        row = cursor.fetchone()
-        if not row:
+            row = cursor.fetchone()
             cursor.close()
-            conn.close()
+        if not row:
             return {
                 "status": "error",
                 "message": f"Scenario {scenario_id} not found"
             }
         
         data_links = row[0]
-        cursor.close()
-        conn.close()
         
         print(f"📊 Data links keys: {list(data_links.keys()) if data_links else 'None'}")
         
@@ -1577,13 +1326,7 @@ async def clip_video(request: dict):
                         print(f"🔑 Video key: {video_key}")
                         
                         # 生成原始视频的presigned URL
-                        import boto3
-                        s3_client = boto3.client('s3')
-                        presigned_url = s3_client.generate_presigned_url(
-                            ClientMethod='get_object',
-                            Params={'Bucket': bucket_name, 'Key': video_key},
-                            ExpiresIn=3600
-                        )
+                        presigned_url = presign_get(bucket_name, video_key)
                         
                         print(f"🎬 Using ffmpeg to clip video directly from S3 URL")
                         print(f"⏰ Time range: {start_ts} - {end_ts} (duration: {duration}s)")
@@ -1617,7 +1360,7 @@ async def clip_video(request: dict):
                                 
                                 # 上传截取的视频到S3
                                 clip_key = f"clips/{scenario_id}_{start_ts}_{end_ts}.mp4"
-                                s3_client.upload_file(output_path, bucket_name, clip_key)
+                                s3_client().upload_file(output_path, bucket_name, clip_key)
                                 print(f"📤 Uploaded clipped video to: s3://{bucket_name}/{clip_key}")
                                 
                                 # 生成截取视频的presigned URL
@@ -1704,6 +1447,8 @@ class CropDataRequest(BaseModel):
     data_links: dict
     # Optional: absolute start time of the scenario/video timeline (epoch seconds)
     scenario_start_time: Optional[float] = None
+    # Run as a background job and return a job id instead of the zip info
+    async_job: bool = False
 
 # --- Multi-segment cropping support ---
 from typing import List
@@ -1718,6 +1463,8 @@ class CropSegmentsRequest(BaseModel):
     data_links: dict
     # Optional: absolute start time of the scenario/video timeline (epoch seconds)
     scenario_start_time: Optional[float] = None
+    # Run as a background job and return a job id instead of the zip info
+    async_job: bool = False
 
 
 # === VLM/Gemini description generation ===
@@ -1812,14 +1559,13 @@ def _sample_frames_from_video(local_path: str, start_s: float, end_s: float, max
 def _resolve_video_key_for_scenario(scenario_id: int) -> Optional[str]:
     """Best-effort: read data_links.video.front from DB, else default key."""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return None
-        cur = conn.cursor()
-        cur.execute("SELECT data_links FROM public.dmp WHERE id = %s", (scenario_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            if not conn:
+                return None
+            cur = conn.cursor()
+            cur.execute("SELECT data_links FROM public.dmp WHERE id = %s", (scenario_id,))
+            row = cur.fetchone()
+            cur.close()
         if not row:
             return None
         data_links = row[0]
@@ -1895,7 +1641,6 @@ def _describe_with_wisead_clip(req: "AutoDescribeRequest", base_prompt: str) ->
     import os
     import json
     import tempfile
-    import boto3
     import requests
 
     meta: dict = {"mode": "wisead"}
@@ -1905,12 +1650,7 @@ def _describe_with_wisead_clip(req: "AutoDescribeRequest", base_prompt: str) ->
     local_path = None
     try:
         if video_key:
-            ensure_download_dir()
-            local_filename = f"scenario_{req.scenario_id}.mp4"
-            local_path = os.path.join(DOWNLOAD_DIR, local_filename)
-            if not os.path.exists(local_path):
-                s3 = boto3.client('s3')
-                s3.download_file(S3_BUCKET, video_key, local_path)
+            local_path = video_cache.get_path(S3_BUCKET, video_key)
     except Exception:
         local_path = None
 
@@ -2000,7 +1740,8 @@ def _describe_with_wisead_clip(req: "AutoDescribeRequest", base_prompt: str) ->
             pass
 
 @router.post("/auto-describe", response_model=AutoDescribeResponse)
-async def auto_describe(req: AutoDescribeRequest) -> AutoDescribeResponse:
+@offload("media")
+def auto_describe(req: AutoDescribeRequest) -> AutoDescribeResponse:
     """Generate a short description for a selected time range.
 
     Default behavior (enhanced):
@@ -2025,48 +1766,34 @@ async def auto_describe(req: AutoDescribeRequest) -> AutoDescribeResponse:
         # Optional: enrich with telemetry (avg speed) by reading console_trip around the window
         telemetry_context = ""
         try:
-            conn = get_db_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("SELECT data_links, start_time FROM public.dmp WHERE id = %s", (req.scenario_id,))
-                row = cur.fetchone()
-                cur.close()
-                conn.close()
-                if row:
-                    data_links, scenario_start = row
-                    console_trip_url = None
-                    if isinstance(data_links, dict):
-                        console_trip_url = data_links.get("trip", {}).get("console_trip")
-                    if console_trip_url and scenario_start is not None:
-                        # Compute absolute timestamps for the selection window
-                        abs_start = float(scenario_start) + float(req.start_time)
-                        abs_end = float(scenario_start) + float(req.end_time)
-                        # Load parquet and compute average speed in window
-                        import s3fs
-                        import pandas as pd
-                        fs = s3fs.S3FileSystem()
-                        df = pd.read_parquet(console_trip_url, filesystem=fs)
-                        ts_col = None
-                        for col in df.columns:
-                            if str(col).lower() in ("timestamp",) or any(k in str(col).lower() for k in ["timestamp", "time", "ts"]):
-                                ts_col = col
-                                break
-                        if ts_col is not None:
-                            # ensure numeric
-                            if df[ts_col].dtype == object:
-                                df[ts_col] = pd.to_numeric(df[ts_col], errors='coerce')
-                            window = df[(df[ts_col] >= abs_start) & (df[ts_col] <= abs_end)].copy()
-                            speed_col = None
-                            for col in window.columns:
-                                if "speed" in str(col).lower():
-                                    speed_col = col
-                                    break
-                            if speed_col is not None and len(window) > 0:
-                                try:
-                                    avg_speed = float(window[speed_col].astype(float).mean())
-                                    telemetry_context = f"telemetry: avg_speed={avg_speed:.2f} (units as stored), samples={len(window)}"
-                                except Exception:
-                                    pass
+            row = None
+            with db_connection() as conn:
+                if conn:
+                    cur = conn.cursor()
+                    cur.execute("SELECT data_links, start_time FROM public.dmp WHERE id = %s", (req.scenario_id,))
+                    row = cur.fetchone()
+                    cur.close()
+            if row:
+                data_links, scenario_start = row
+                console_trip_url = None
+                if isinstance(data_links, dict):
+                    console_trip_url = data_links.get("trip", {}).get("console_trip")
+                if console_trip_url and scenario_start is not None:
+                    # Compute absolute timestamps for the selection window
+                    abs_start = float(scenario_start) + float(req.start_time)
+                    abs_end = float(scenario_start) + float(req.end_time)
+                    # Read timestamp + speed for the window only and compute the average speed
+                    window, ts_col = read_window(
+                        console_trip_url, abs_start, abs_end,
+                        columns=lambda schema: [first_column(schema.names, ["speed"])],
+                    )
+                    speed_col = first_column(window.column_names, ["speed"])
+                    if ts_col is not None and speed_col is not None and window.num_rows > 0:
+                        try:
+                            avg_speed = float(pd.to_numeric(window.column(speed_col).to_pandas(), errors='coerce').mean())
+                            telemetry_context = f"telemetry: avg_speed={avg_speed:.2f} (units as stored), samples={window.num_rows}"
+                        except Exception:
+                            pass
         except Exception:
             # Non-fatal; continue without telemetry
             pass
@@ -2106,15 +1833,10 @@ async def auto_describe(req: AutoDescribeRequest) -> AutoDescribeResponse:
                 video_key = _resolve_video_key_for_scenario(req.scenario_id)
                 local_path = None
                 if video_key:
-                    ensure_download_dir()
-                    local_filename = f"scenario_{req.scenario_id}.mp4"
-                    local_path = os.path.join(DOWNLOAD_DIR, local_filename)
-                    if not os.path.exists(local_path):
-                        try:
-                            s3 = boto3.client('s3')
-                            s3.download_file(S3_BUCKET, video_key, local_path)
-                        except Exception:
-                            local_path = None
+                    try:
+                        local_path = video_cache.get_path(S3_BUCKET, video_key)
+                    except Exception:
+                        local_path = None
 
                 images = []
                 frame_meta = {}
@@ -2260,7 +1982,8 @@ class SaveNpzRequest(BaseModel):
     data_links: dict
 
 @router.post("/save-npz")
-async def save_segment_as_npz(req: SaveNpzRequest):
+@offload("io")
+def save_segment_as_npz(req: SaveNpzRequest):
     """Create a NumPy .npz file with our schema.
 
     Arrays in the archive:
@@ -2273,18 +1996,17 @@ async def save_segment_as_npz(req: SaveNpzRequest):
     """
     try:
         # 1) Fetch basic identifiers (org_id, key_id, vin)
-        conn = get_db_connection()
         org_id = None
         key_id = None
         vin = None
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT org_id, key_id, vin FROM public.dmp WHERE id = %s", (req.scenario_id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
-            if row:
-                org_id, key_id, vin = row
+        with db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute("SELECT org_id, key_id, vin FROM public.dmp WHERE id = %s", (req.scenario_id,))
+                row = cur.fetchone()
+                cur.close()
+                if row:
+                    org_id, key_id, vin = row
 
         # 2) Resolve URIs from data_links
         imu_accel_uri = None
@@ -2318,40 +2040,25 @@ async def save_segment_as_npz(req: SaveNpzRequest):
         end_epoch = float(req.end_time)
         maneuver_type = (req.label or 'maneuver').strip().replace(' ', '-').lower()
 
-        # 4) Collect IMU arrays (best-effort; empty if unavailable)
+        # 4) Collect IMU arrays (best-effort; empty if unavailable), cropped to the window on read
         import numpy as np
-        def to_array(lst, key, dtype=float):
-            try:
-                return np.array([float(p.get(key, 0)) for p in lst], dtype=dtype)
-            except Exception:
-                return np.array([], dtype=dtype)
-
         lr_acc = np.array([]); bf_acc = np.array([]); vert_acc = np.array([])
         lr_w = np.array([]); bf_w = np.array([]); vert_w = np.array([])
         imu_ts = np.array([])
         try:
             if imu_accel_uri:
-                accel_points = load_imu_data_from_s3(imu_accel_uri)  # list of {timestamp,x,y,z}
-                # Crop by selected time window
-                accel_points = [p for p in accel_points if start_epoch <= float(p.get('timestamp', 0)) <= end_epoch]
-                if accel_points:
-                    imu_ts = to_array(accel_points, 'timestamp')
-                    lr_acc = to_array(accel_points, 'x')
-                    bf_acc = to_array(accel_points, 'y')
-                    vert_acc = to_array(accel_points, 'z')
+                accel = load_imu_arrays(imu_accel_uri, start_epoch, end_epoch)
+                if len(accel):
+                    imu_ts, lr_acc, bf_acc, vert_acc = accel
         except Exception:
             pass
         try:
             if imu_gyro_uri:
-                gyro_points = load_imu_data_from_s3(imu_gyro_uri)
-                # Crop by selected time window
-                gyro_points = [p for p in gyro_points if start_epoch <= float(p.get('timestamp', 0)) <= end_epoch]
-                if gyro_points and imu_ts.size == 0:
-                    imu_ts = to_array(gyro_points, 'timestamp')
-                if gyro_points:
-                    lr_w = to_array(gyro_points, 'x')
-                    bf_w = to_array(gyro_points, 'y')
-                    vert_w = to_array(gyro_points, 'z')
+                gyro = load_imu_arrays(imu_gyro_uri, start_epoch, end_epoch)
+                if len(gyro) and imu_ts.size == 0:
+                    imu_ts = gyro.timestamp
+                if len(gyro):
+                    lr_w, bf_w, vert_w = gyro.x, gyro.y, gyro.z
         except Exception:
             pass
 
@@ -2377,39 +2084,26 @@ async def save_segment_as_npz(req: SaveNpzRequest):
                     'speed': [],
                     'course': [] }
         try:
-            if gps_uri and gps_uri.startswith('s3://'):
-                # Use S3ParquetManager for convenience
-                from s3_utils import S3ParquetManager
-                parts = gps_uri.replace('s3://','').split('/',1)
-                if len(parts) == 2:
-                    bucket, key = parts
-                    s3mgr = S3ParquetManager(bucket)
-                    df = s3mgr.load_parquet(key)
-                    # Identify columns
-                    ts_col = None; lat_col=None; lon_col=None; spd_col=None; crs_col=None
-                    for c in df.columns:
-                        lc = str(c).lower()
-                        if ts_col is None and any(k in lc for k in ['timestamp','time','ts']): ts_col=c
-                        if lat_col is None and 'lat' in lc: lat_col=c
-                        if lon_col is None and ('lon' in lc or 'lng' in lc): lon_col=c
-                        if spd_col is None and 'speed' in lc: spd_col=c
-                        if crs_col is None and ('course' in lc or 'heading' in lc or 'yaw' in lc): crs_col=c
-                    if ts_col is not None:
-                        # Crop by selected time window
-                        ts_series = pd.to_numeric(df[ts_col], errors='coerce').astype(float)
-                        window = df[(ts_series >= start_epoch) & (ts_series <= end_epoch)].copy()
-                        ts_vals = ts_series[(ts_series >= start_epoch) & (ts_series <= end_epoch)].tolist()
-                        gps_obj['timestamp'] = ts_vals
-                    else:
-                        window = df
-                    if lat_col is not None:
-                        gps_obj['latitude'] = window[lat_col].astype(str).tolist()
-                    if lon_col is not None:
-                        gps_obj['longitude'] = window[lon_col].astype(str).tolist()
-                    if spd_col is not None:
-                        gps_obj['speed'] = pd.to_numeric(window[spd_col], errors='coerce').astype(float).tolist()
-                    if crs_col is not None:
-                        gps_obj['course'] = pd.to_numeric(window[crs_col], errors='coerce').astype(float).tolist()
+            if parse_s3_url(gps_uri or ''):
+                # Identify columns once from the schema and read only those, for the window only
+                picked = {}
+                def pick(schema):
+                    picked['lat'] = first_column(schema.names, ['lat'])
+                    picked['lon'] = first_column(schema.names, ['lon', 'lng'])
+                    picked['speed'] = first_column(schema.names, ['speed'])
+                    picked['course'] = first_column(schema.names, ['course', 'heading', 'yaw'])
+                    return list(picked.values())
+                window, ts_col = read_window(gps_uri, start_epoch, end_epoch, columns=pick)
+                if ts_col is not None:
+                    gps_obj['timestamp'] = epoch_seconds(window.column(ts_col)).tolist()
+                if picked['lat'] is not None:
+                    gps_obj['latitude'] = window.column(picked['lat']).to_pandas().astype(str).tolist()
+                if picked['lon'] is not None:
+                    gps_obj['longitude'] = window.column(picked['lon']).to_pandas().astype(str).tolist()
+                if picked['speed'] is not None:
+                    gps_obj['speed'] = pd.to_numeric(window.column(picked['speed']).to_pandas(), errors='coerce').astype(float).tolist()
+                if picked['course'] is not None:
+                    gps_obj['course'] = pd.to_numeric(window.column(picked['course']).to_pandas(), errors='coerce').astype(float).tolist()
         except Exception:
             pass
 
@@ -2455,8 +2149,7 @@ async def save_segment_as_npz(req: SaveNpzRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"save-npz failed: {e}")
 
-@router.post("/crop-data")
-async def crop_data_by_time_range(request: CropDataRequest):
+def _crop_data_by_time_range(request: CropDataRequest, progress=no_progress):
     """
     Crop video, GPS, and IMU data based on time range and package as zip file
     """
@@ -2495,10 +2188,11 @@ async def crop_data_by_time_range(request: CropDataRequest):
         
         try:
             # 1. Crop video files
+            progress("video", 5)
             if 'video' in request.data_links:
                 print("🎬 Processing video files...")
                 print(f"📹 Video links: {request.data_links['video']}")
-                video_results = await crop_video_files(
+                video_results = crop_video_files(
                     request.data_links['video'], 
                     request.start_time, 
                     request.end_time, 
@@ -2511,10 +2205,11 @@ async def crop_data_by_time_range(request: CropDataRequest):
                 print("⚠️ No video links found in data_links")
             
             # 2. Crop GPS data
+            progress("gps", 60)
             if 'trip' in request.data_links and request.data_links['trip'].get('console_trip'):
                 print("📍 Processing GPS data...")
                 print(f"📍 GPS console_trip: {request.data_links['trip']['console_trip']}")
-                gps_result = await crop_gps_data(
+                gps_result = crop_gps_data(
                     request.data_links['trip']['console_trip'],
                     request.start_time,
                     request.end_time,
@@ -2527,10 +2222,11 @@ async def crop_data_by_time_range(request: CropDataRequest):
                 print("⚠️ No GPS console_trip found in data_links")
             
             # 3. Crop IMU data
+            progress("imu", 75)
             if 'imu' in request.data_links:
                 print("📊 Processing IMU data...")
                 print(f"📊 IMU links: {request.data_links['imu']}")
-                imu_results = await crop_imu_data(
+                imu_results = crop_imu_data(
                     request.data_links['imu'],
                     request.start_time,
                     request.end_time,
@@ -2542,6 +2238,7 @@ async def crop_data_by_time_range(request: CropDataRequest):
                 print("⚠️ No IMU links found in data_links")
             
             # 4. Create zip file
+            progress("zip", 90)
             print("📦 Creating zip file...")
             print(f"📁 Files to add to zip: {results['files']}")
             print(f"📊 Total files count: {len(results['files'])}")
@@ -2584,6 +2281,7 @@ async def crop_data_by_time_range(request: CropDataRequest):
             # Return results with file info for download
             results["zip_filename"] = zip_filename
             results["zip_temp_dir"] = zip_temp_dir
+            results["download_url"] = f"/api/scenarios/download-cropped-data/{zip_filename}"
             
             return results
             
@@ -2606,8 +2304,7 @@ async def crop_data_by_time_range(request: CropDataRequest):
         print(f"❌ Error in crop_data_by_time_range: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to crop data: {str(e)}")
 
-@router.post("/crop-data-multi")
-async def crop_data_by_time_ranges(request: CropSegmentsRequest):
+def _crop_data_by_time_ranges(request: CropSegmentsRequest, progress=no_progress):
     """
     Crop multiple time ranges. For each segment, create a separate folder containing
     the cropped video/GPS/IMU files, then package all segment folders into a single zip.
@@ -2637,6 +2334,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
 
         # Process each segment into its own subdirectory
         for idx, seg in enumerate(request.segments):
+            progress(f"segment {idx + 1}/{len(request.segments)}", 90 * idx / len(request.segments))
             segment_dir = base_dir / f"segment_{idx + 1}_{int(seg.start_time)}_{int(seg.end_time)}"
             segment_dir.mkdir(exist_ok=True)
 
@@ -2651,7 +2349,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
             try:
                 # 1) Videos
                 if 'video' in request.data_links:
-                    video_results = await crop_video_files(
+                    video_results = crop_video_files(
                         request.data_links['video'],
                         seg.start_time,
                         seg.end_time,
@@ -2662,7 +2360,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
 
                 # 2) GPS
                 if 'trip' in request.data_links and request.data_links['trip'].get('console_trip'):
-                    gps_result = await crop_gps_data(
+                    gps_result = crop_gps_data(
                         request.data_links['trip']['console_trip'],
                         seg.start_time,
                         seg.end_time,
@@ -2673,7 +2371,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
 
                 # 3) IMU
                 if 'imu' in request.data_links:
-                    imu_results = await crop_imu_data(
+                    imu_results = crop_imu_data(
                         request.data_links['imu'],
                         seg.start_time,
                         seg.end_time,
@@ -2688,6 +2386,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
             overall_results["segment_results"].append(segment_result)
 
         # Create a single zip that keeps folder structure
+        progress("zip", 90)
         zip_path = base_dir.parent / (
             f"cropped_data_{request.scenario_id}_{len(request.segments)}segments.zip"
         )
@@ -2712,6 +2411,7 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
         overall_results["zip_path"] = str(zip_path)
         overall_results["zip_filename"] = zip_path.name
         overall_results["zip_temp_dir"] = zip_path.parent.name
+        overall_results["download_url"] = f"/api/scenarios/download-cropped-data/{zip_path.name}"
 
         # Cleanup segment directories but keep the zip for download
         try:
@@ -2727,7 +2427,68 @@ async def crop_data_by_time_ranges(request: CropSegmentsRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to crop data (multi): {str(e)}")
 
-async def crop_video_files(video_links: dict, start_time: float, end_time: float, output_dir: Path, scenario_start_time: Optional[float] = None):
+@router.post("/crop-data")
+async def crop_data_by_time_range(request: CropDataRequest):
+    """
+    Crop video, GPS, and IMU data based on time range and package as zip file.
+    With async_job=true the work is queued and a job id is returned immediately.
+    """
+    if request.async_job:
+        return submit_job("crop_data", request.dict(), scenario_id=request.scenario_id)
+    return await run_blocking("media", _crop_data_by_time_range, request)
+
+@router.post("/crop-data-multi")
+async def crop_data_by_time_ranges(request: CropSegmentsRequest):
+    """
+    Crop multiple time ranges into one zip (one folder per segment).
+    With async_job=true the work is queued and a job id is returned immediately.
+    """
+    if request.async_job:
+        return submit_job("crop_data_multi", request.dict(), scenario_id=request.scenario_id)
+    return await run_blocking("media", _crop_data_by_time_ranges, request)
+
+def run_crop_data_job(payload: dict, progress) -> dict:
+    return _crop_data_by_time_range(CropDataRequest(**payload), progress)
+
+def run_crop_data_multi_job(payload: dict, progress) -> dict:
+    return _crop_data_by_time_ranges(CropSegmentsRequest(**payload), progress)
+
+def run_process_scenario_job(payload: dict, progress) -> dict:
+    """Job behind /process: crop the scenario's whole time window into a downloadable zip."""
+    scenario_id = int(payload["scenario_id"])
+    progress("lookup", 1)
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        cur.execute("SELECT data_links, start_time, end_time FROM public.dmp WHERE id = %s", (scenario_id,))
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        raise RuntimeError(f"Scenario {scenario_id} not found")
+    data_links, start_time, end_time = row
+    if start_time is None or end_time is None:
+        raise RuntimeError(f"Scenario {scenario_id} has no start/end time")
+    data_links = dict(data_links or {})
+    if not payload.get("generate_videos", True):
+        data_links.pop("video", None)
+    if not payload.get("extract_data", True):
+        data_links.pop("trip", None)
+        data_links.pop("imu", None)
+    request = CropDataRequest(
+        scenario_id=scenario_id,
+        start_time=float(start_time),
+        end_time=float(end_time),
+        data_links=data_links,
+        scenario_start_time=float(start_time),
+    )
+    result = _crop_data_by_time_range(request, progress)
+    if payload.get("create_visualizations"):
+        # There is no backend map renderer yet; report it instead of pretending
+        result["skipped"] = ["create_visualizations"]
+    return result
+
+def crop_video_files(video_links: dict, start_time: float, end_time: float, output_dir: Path, scenario_start_time: Optional[float] = None):
     """Crop video files based on time range.
     If scenario_start_time is provided, treat start_time/end_time as absolute (e.g., GPS epoch seconds)
     and compute relative offsets against the actual video start extracted from filename when possible.
@@ -2750,12 +2511,8 @@ async def crop_video_files(video_links: dict, start_time: float, end_time: float
             else:
                 continue
             
-            # Download video to temp location
-            import boto3
-            s3_client = boto3.client('s3')
-            
-            temp_video = output_dir / f"temp_{video_type}.mp4"
-            s3_client.download_file(bucket, key, str(temp_video))
+            # Source video from the shared local cache (downloaded once per ETag)
+            temp_video = video_cache.get_path(bucket, key)
             
             # Get video duration first
             import subprocess
@@ -2813,9 +2570,6 @@ async def crop_video_files(video_links: dict, start_time: float, end_time: float
             result = subprocess.run(cmd, capture_output=True, text=True)
             
             if result.returncode == 0:
-                # Remove temp file
-                temp_video.unlink()
-                
                 results.append({
                     "type": "video",
                     "video_type": video_type,
@@ -2849,42 +2603,23 @@ async def crop_video_files(video_links: dict, start_time: float, end_time: float
     
     return results
 
-async def crop_gps_data(gps_s3_url: str, start_time: float, end_time: float, output_dir: Path):
+def crop_gps_data(gps_s3_url: str, start_time: float, end_time: float, output_dir: Path):
     """Crop GPS data based on time range"""
     try:
         print(f"📍 Cropping GPS data from {gps_s3_url}")
         
-        # Extract bucket and key from S3 URL
-        if gps_s3_url.startswith('s3://'):
-            parts = gps_s3_url.replace('s3://', '').split('/', 1)
-            bucket = parts[0]
-            key = parts[1]
-        else:
+        if parse_s3_url(gps_s3_url) is None:
             return None
         
-        # Load GPS data from S3
-        import boto3
-        import pandas as pd
-        import s3fs
-        
-        fs = s3fs.S3FileSystem()
-        df = pd.read_parquet(f"s3://{bucket}/{key}", filesystem=fs)
+        # Read only the row groups overlapping the window, then filter rows
+        cropped, ts_col = read_window(gps_s3_url, start_time, end_time)
         
-        # Filter data by timestamp range
-        if 'timestamp' in df.columns:
-            # Convert timestamp to numeric if needed
-            if df['timestamp'].dtype == 'object':
-                df['timestamp'] = pd.to_numeric(df['timestamp'], errors='coerce')
-            
-            # Filter by time range
-            mask = (df['timestamp'] >= start_time) & (df['timestamp'] <= end_time)
-            cropped_df = df[mask].copy()
-            
+        if ts_col:
             # Save cropped data
             output_file = output_dir / "gps_cropped.parquet"
-            cropped_df.to_parquet(output_file, index=False)
+            pq.write_table(cropped, output_file)
             
-            print(f"✅ GPS data cropped: {len(cropped_df)} points")
+            print(f"✅ GPS data cropped: {cropped.num_rows} points")
             
             return {
                 "type": "gps",
@@ -2892,7 +2627,7 @@ async def crop_gps_data(gps_s3_url: str, start_time: float, end_time: float, out
                 "local_path": str(output_file),
                 "start_time": start_time,
                 "end_time": end_time,
-                "points_count": len(cropped_df),
+                "points_count": cropped.num_rows,
                 "success": True
             }
         else:
@@ -2903,7 +2638,7 @@ async def crop_gps_data(gps_s3_url: str, start_time: float, end_time: float, out
         print(f"❌ Error cropping GPS data: {e}")
         return None
 
-async def crop_imu_data(imu_links: dict, start_time: float, end_time: float, output_dir: Path):
+def crop_imu_data(imu_links: dict, start_time: float, end_time: float, output_dir: Path):
     """Crop IMU data based on time range"""
     results = []
     
@@ -2914,37 +2649,18 @@ async def crop_imu_data(imu_links: dict, start_time: float, end_time: float, out
         try:
             print(f"📊 Cropping {imu_type} IMU data...")
             
-            # Extract bucket and key from S3 URL
-            if s3_url.startswith('s3://'):
-                parts = s3_url.replace('s3://', '').split('/', 1)
-                bucket = parts[0]
-                key = parts[1]
-            else:
+            if parse_s3_url(s3_url) is None:
                 continue
             
-            # Load IMU data from S3
-            import boto3
-            import pandas as pd
-            import s3fs
-            
-            fs = s3fs.S3FileSystem()
-            df = pd.read_parquet(f"s3://{bucket}/{key}", filesystem=fs)
+            # Load only the row groups overlapping the window, then filter rows
+            cropped, ts_col = read_imu_table(s3_url, start_time, end_time)
             
-            # Filter data by timestamp range
-            if 'timestamp' in df.columns:
-                # Convert timestamp to numeric if needed
-                if df['timestamp'].dtype == 'object':
-                    df['timestamp'] = pd.to_numeric(df['timestamp'], errors='coerce')
-                
-                # Filter by time range
-                mask = (df['timestamp'] >= start_time) & (df['timestamp'] <= end_time)
-                cropped_df = df[mask].copy()
-                
+            if ts_col:
                 # Save cropped data
                 output_file = output_dir / f"imu_{imu_type}_cropped.parquet"
-                cropped_df.to_parquet(output_file, index=False)
+                pq.write_table(cropped, output_file)
                 
-                print(f"✅ {imu_type} IMU data cropped: {len(cropped_df)} points")
+                print(f"✅ {imu_type} IMU data cropped: {cropped.num_rows} points")
                 
                 results.append({
                     "type": "imu",
@@ -2953,7 +2669,7 @@ async def crop_imu_data(imu_links: dict, start_time: float, end_time: float, out
                     "local_path": str(output_file),
                     "start_time": start_time,
                     "end_time": end_time,
-                    "points_count": len(cropped_df),
+                    "points_count": cropped.num_rows,
                     "success": True
                 })
             else:
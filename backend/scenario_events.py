@@ -0,0 +1,362 @@
+import os
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import psycopg2
+
+from db import DB_CONFIG, DB_CONNECT_TIMEOUT
+
+# Event types offered by scenario search, in UI order (comma-separated override)
+DEFAULT_EVENT_TYPES = (
+    "fcw", "harsh-brake", "lane-departure", "left-turn", "right-turn",
+    "u-turn", "pedestrian", "traffic-light", "stop-sign", "yield-sign",
+    "speed-limit", "construction-zone", "school-zone", "emergency-vehicle",
+    "weather-condition", "road-condition",
+)
+SCENARIO_EVENT_TYPES = tuple(
+    t.strip() for t in os.getenv("SCENARIO_EVENT_TYPES", ",".join(DEFAULT_EVENT_TYPES)).split(",") if t.strip()
+)
+# Writer endpoint for index maintenance (the API itself reads from the replica).
+# Unset disables refreshes: DB_HOST is the read-only endpoint.
+SCENARIO_INDEX_DB_HOST = os.getenv("SCENARIO_INDEX_DB_HOST", "")
+# Seconds between incremental refreshes in the API process (0, the default, disables the refresher)
+SCENARIO_INDEX_REFRESH_SECONDS = float(os.getenv("SCENARIO_INDEX_REFRESH_SECONDS", "0"))
+# Index refreshed longer ago than this (seconds) is ignored and /fetch scans instead: rows
+# changed since the last refresh are missing from it. Keep above the refresh interval.
+SCENARIO_INDEX_MAX_AGE = float(os.getenv("SCENARIO_INDEX_MAX_AGE", "900"))
+# Use the index for /api/scenarios/fetch when it exists and is fresh
+SCENARIO_INDEX_ENABLED = os.getenv("SCENARIO_INDEX_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# Event names of a dmp row, with the same semantics the jsonb_path_exists filters had
+_EVENTS_PATH = "$.coreml.*.event"
+_CONSOLE_TRIP_PATH = '$.trip.console_trip ? (@ != null && @ != "null")'
+# Arbitrary constant: only one refresher across all API replicas
+_ADVISORY_LOCK_ID = 0x5CE4E7
+# Rows updated this long before the watermark are re-indexed, covering transactions that committed late
+_WATERMARK_OVERLAP = "10 minutes"
+
+# One-off migration, applied with `python scenario_events.py migrate` (never by the API)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS public.scenario_events AS
+    SELECT id AS dmp_id, ''::text AS event, created_at FROM public.dmp WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS scenario_events_event_dmp ON public.scenario_events (event, dmp_id);
+CREATE INDEX IF NOT EXISTS scenario_events_event_created ON public.scenario_events (event, created_at, dmp_id);
+CREATE INDEX IF NOT EXISTS scenario_events_dmp ON public.scenario_events (dmp_id);
+CREATE TABLE IF NOT EXISTS public.scenario_events_state (
+    name TEXT PRIMARY KEY,
+    last_updated_at TIMESTAMPTZ,
+    max_dmp_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+_stats_lock = threading.Lock()
+_stats = {
+    "refreshes": 0,
+    "refresh_errors": 0,
+    "rows_indexed": 0,
+    "last_refresh_seconds": None,
+    "last_error": None,
+    "indexed_queries": 0,
+    "scan_queries": 0,
+    "stale_index": 0,
+}
+_available: Optional[bool] = None
+_checked_at = 0.0
+# A missing index is looked for again after this many seconds
+_RECHECK_SECONDS = 60.0
+_refresher: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _bump(name: str, delta=1) -> None:
+    with _stats_lock:
+        _stats[name] += delta
+
+
+def known_event_types(requested: Sequence[str]) -> List[str]:
+    """Requested event types that exist, deduplicated in request order (unknown ones are ignored)."""
+    known = set(SCENARIO_EVENT_TYPES)
+    return list(dict.fromkeys(t for t in requested if t in known))
+
+
+def _writer_connection():
+    if not SCENARIO_INDEX_DB_HOST:
+        raise RuntimeError("SCENARIO_INDEX_DB_HOST is not set; scenario_events maintenance is disabled")
+    config = dict(DB_CONFIG, host=SCENARIO_INDEX_DB_HOST)
+    return psycopg2.connect(connect_timeout=DB_CONNECT_TIMEOUT, application_name="annotation-platform-indexer",
+                            **config)
+
+
+def migrate() -> None:
+    """Create the scenario_events tables and indexes on the writer (idempotent)."""
+    conn = _writer_connection()
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute(_SCHEMA)
+            cur.close()
+    finally:
+        conn.close()
+    print("✅ scenario_events schema applied")
+
+
+def _save_watermark(cur, last_updated_at, max_dmp_id) -> None:
+    cur.execute("""
+        INSERT INTO public.scenario_events_state (name, last_updated_at, max_dmp_id, refreshed_at)
+        VALUES ('dmp', %s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET last_updated_at = EXCLUDED.last_updated_at,
+            max_dmp_id = EXCLUDED.max_dmp_id, refreshed_at = EXCLUDED.refreshed_at
+    """, (last_updated_at, max_dmp_id))
+
+
+def _insert_events_sql(table: str, changed: str) -> str:
+    return f"""
+        INSERT INTO {table} (dmp_id, event, created_at)
+        SELECT DISTINCT c.id, ev #>> '{{}}', c.created_at
+        FROM ({changed}) c, jsonb_path_query(c.data_links, %s) ev
+        WHERE c.dmp_status = 'SUCCESS'
+          AND jsonb_path_exists(c.data_links, %s)
+          AND jsonb_typeof(ev) = 'string'
+    """
+
+
+def _rebuild(conn) -> int:
+    """Full rebuild into a staging table, swapped in by rename.
+
+    The scan of dmp and the index builds run against the staging table, so
+    /fetch keeps reading the old index; only the final rename transaction
+    takes the ACCESS EXCLUSIVE lock, for milliseconds.
+    """
+    with conn:
+        cur = conn.cursor()
+        # New watermark taken first: anything updated after it is picked up by the next refresh
+        cur.execute("SELECT max(updated_at), coalesce(max(id), 0) FROM public.dmp")
+        last_updated_at, max_dmp_id = cur.fetchone()
+        cur.execute("DROP TABLE IF EXISTS public.scenario_events_build")
+        cur.execute("CREATE TABLE public.scenario_events_build (LIKE public.scenario_events INCLUDING DEFAULTS)")
+        # The build scans all of dmp; the pool's statement timeout would cut it off. Nothing reads this table yet.
+        cur.execute("SET LOCAL statement_timeout = 0")
+        cur.execute(_insert_events_sql("public.scenario_events_build",
+                                       "SELECT id, created_at, data_links, dmp_status FROM public.dmp"),
+                    (_EVENTS_PATH, _CONSOLE_TRIP_PATH))
+        inserted = cur.rowcount
+        cur.execute("""
+            CREATE UNIQUE INDEX scenario_events_build_event_dmp ON public.scenario_events_build (event, dmp_id);
+            CREATE INDEX scenario_events_build_event_created ON public.scenario_events_build (event, created_at, dmp_id);
+            CREATE INDEX scenario_events_build_dmp ON public.scenario_events_build (dmp_id);
+            ANALYZE public.scenario_events_build;
+        """)
+        cur.close()
+    with conn:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute("""
+            DROP TABLE public.scenario_events;
+            ALTER TABLE public.scenario_events_build RENAME TO scenario_events;
+            ALTER INDEX public.scenario_events_build_event_dmp RENAME TO scenario_events_event_dmp;
+            ALTER INDEX public.scenario_events_build_event_created RENAME TO scenario_events_event_created;
+            ALTER INDEX public.scenario_events_build_dmp RENAME TO scenario_events_dmp;
+        """)
+        _save_watermark(cur, last_updated_at, max_dmp_id)
+        cur.close()
+    return inserted
+
+
+def _refresh_changed(conn, since) -> int:
+    """Re-extract events of dmp rows updated since the watermark (row locks only)."""
+    with conn:
+        cur = conn.cursor()
+        cur.execute("SELECT max(updated_at), coalesce(max(id), 0) FROM public.dmp")
+        last_updated_at, max_dmp_id = cur.fetchone()
+        # Overlap rather than >: rows sharing or trailing the watermark are re-indexed, never missed
+        changed = ("SELECT id, created_at, data_links, dmp_status FROM public.dmp "
+                   f"WHERE updated_at >= %s - interval '{_WATERMARK_OVERLAP}'")
+        cur.execute(f"DELETE FROM public.scenario_events e USING ({changed}) c WHERE e.dmp_id = c.id", (since,))
+        cur.execute(_insert_events_sql("public.scenario_events", changed) + " ON CONFLICT DO NOTHING",
+                    (since, _EVENTS_PATH, _CONSOLE_TRIP_PATH))
+        inserted = cur.rowcount
+        _save_watermark(cur, last_updated_at, max_dmp_id)
+        cur.close()
+    return inserted
+
+
+def refresh_index(full: bool = False) -> dict:
+    """Bring public.scenario_events up to date with public.dmp.
+
+    Rows of dmp updated since the last refresh have their events deleted and
+    re-extracted; only SUCCESS rows with a console trip are indexed, so the
+    index answers exactly what the old jsonb filters matched. ``full`` (or a
+    never-built index) rebuilds into a staging table that is swapped in.
+    Runs on the writer endpoint (SCENARIO_INDEX_DB_HOST, required) under an
+    advisory lock so concurrent refreshers skip instead of doubling the work.
+    The schema must have been created with ``migrate()`` beforehand.
+    """
+    started = time.perf_counter()
+    conn = _writer_connection()
+    since = None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (_ADVISORY_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {"skipped": True, "reason": "another refresh is running"}
+        cur.execute("SELECT to_regclass('public.scenario_events_state') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            raise RuntimeError("scenario_events schema missing; run `python scenario_events.py migrate`")
+        cur.execute("SELECT last_updated_at FROM public.scenario_events_state WHERE name = 'dmp'")
+        row = cur.fetchone()
+        cur.close()
+        conn.commit()
+        since = None if full or row is None else row[0]
+        inserted = _rebuild(conn) if since is None else _refresh_changed(conn, since)
+    except Exception as e:
+        _bump("refresh_errors")
+        with _stats_lock:
+            _stats["last_error"] = str(e)
+        raise
+    finally:
+        # Closing the session also releases the advisory lock
+        conn.close()
+    seconds = round(time.perf_counter() - started, 3)
+    with _stats_lock:
+        _stats["refreshes"] += 1
+        _stats["rows_indexed"] += max(0, inserted)
+        _stats["last_refresh_seconds"] = seconds
+        _stats["last_error"] = None
+    print(f"✅ scenario_events refreshed ({'full' if since is None else 'incremental'}): "
+          f"{inserted} event rows in {seconds}s")
+    return {"skipped": False, "full": since is None, "inserted": inserted, "seconds": seconds}
+
+
+def run_refresh_job(payload: dict, progress) -> dict:
+    progress("refresh", 10)
+    return refresh_index(full=bool(payload.get("full")))
+
+
+def _refresh_loop() -> None:
+    while not _stop.wait(SCENARIO_INDEX_REFRESH_SECONDS):
+        try:
+            refresh_index()
+        except Exception as e:
+            print(f"⚠️ scenario_events refresh failed: {e}")
+
+
+def start_refresher() -> None:
+    """Periodic incremental refresh in a daemon thread (startup hook).
+
+    Opt-in: runs only with SCENARIO_INDEX_DB_HOST set and SCENARIO_INDEX_REFRESH_SECONDS > 0.
+    """
+    global _refresher
+    if not SCENARIO_INDEX_DB_HOST or SCENARIO_INDEX_REFRESH_SECONDS <= 0 or _refresher is not None:
+        return
+    _stop.clear()
+    _refresher = threading.Thread(target=_refresh_loop, name="scenario-events-refresh", daemon=True)
+    _refresher.start()
+
+
+def stop_refresher() -> None:
+    global _refresher
+    _stop.set()
+    _refresher = None
+
+
+def index_watermark(cur) -> Optional[int]:
+    """Highest dmp id covered by the index, or None when the index is missing/disabled.
+
+    An index not refreshed within SCENARIO_INDEX_MAX_AGE also gives None, so
+    searches fall back to the live jsonb filters instead of missing events of
+    rows changed after the last refresh (e.g. no refresher is configured).
+    """
+    global _available, _checked_at
+    if not SCENARIO_INDEX_ENABLED:
+        return None
+    if _available is False and time.monotonic() - _checked_at < _RECHECK_SECONDS:
+        return None
+    cur.execute("SELECT to_regclass('public.scenario_events_state') IS NOT NULL")
+    _available, _checked_at = bool(cur.fetchone()[0]), time.monotonic()
+    if not _available:
+        return None
+    cur.execute("SELECT max_dmp_id, extract(epoch FROM now() - refreshed_at) "
+                "FROM public.scenario_events_state WHERE name = 'dmp'")
+    row = cur.fetchone()
+    if not row:
+        return None
+    if float(row[1]) > SCENARIO_INDEX_MAX_AGE:
+        _bump("stale_index")
+        return None
+    return int(row[0])
+
+
+def _jsonb_events(alias: str, count: int) -> str:
+    return " AND ".join(
+        [f"jsonb_path_exists({alias}.data_links, '$.coreml.* ? (@.event == $e)', jsonb_build_object('e', %s::text))"]
+        * count
+    )
+
+
+def scenario_filter_sql(event_types: Sequence[str], watermark: Optional[int],
+                        date_sql: str = "", date_params: Sequence = ()) -> Tuple[str, list]:
+    """WHERE fragment (on public.dmp aliased d) requiring every event type, and its parameters.
+
+    ``date_sql`` is a created_at condition written against ``{col}``; it is
+    applied inside the index lookup too so each event type is an index range.
+    With an index watermark, rows up to it are matched through scenario_events;
+    newer rows not yet indexed fall back to the jsonb filters over the short
+    id tail. Without one, jsonb filters only.
+    """
+    if watermark is None:
+        _bump("scan_queries")
+        return f"({_jsonb_events('d', len(event_types))})", list(event_types)
+    _bump("indexed_queries")
+    # A semi-join on the id set keeps dmp access to primary-key lookups
+    sql = f"""d.id IN (
+        SELECT e.dmp_id FROM public.scenario_events e
+        WHERE e.event = ANY(%s) {date_sql.format(col="e.created_at")}
+        GROUP BY e.dmp_id HAVING count(DISTINCT e.event) = %s
+        UNION ALL
+        SELECT t.id FROM public.dmp t
+        WHERE t.id > %s AND {_jsonb_events('t', len(event_types))}
+    )"""
+    return sql, [list(event_types), *date_params, len(event_types), watermark, *event_types]
+
+
+def scenario_events_stats() -> dict:
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot.update({"available": _available, "maintenance_enabled": bool(SCENARIO_INDEX_DB_HOST),
+                     "refresh_seconds": SCENARIO_INDEX_REFRESH_SECONDS,
+                     "max_age_seconds": SCENARIO_INDEX_MAX_AGE,
+                     "event_types": len(SCENARIO_EVENT_TYPES)})
+    return snapshot
+
+
+def event_type_of(data_links) -> str:
+    """First known event type in a dmp row's coreml events (object or array format), else "unknown"."""
+    if not isinstance(data_links, dict):
+        return "unknown"
+    coreml_events = data_links.get("coreml", {})
+    if isinstance(coreml_events, dict):
+        events = coreml_events.values()
+    elif isinstance(coreml_events, list):
+        events = coreml_events
+    else:
+        return "unknown"
+    known = set(SCENARIO_EVENT_TYPES)
+    for event in events:
+        if isinstance(event, dict) and event.get("event") in known:
+            return event["event"]
+    return "unknown"
+
+
+if __name__ == "__main__":
+    # python scenario_events.py migrate | refresh | rebuild   (SCENARIO_INDEX_DB_HOST = writer endpoint)
+    import sys
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ("migrate", "refresh", "rebuild"):
+        sys.exit("usage: python scenario_events.py migrate|refresh|rebuild")
+    if sys.argv[1] == "migrate":
+        migrate()
+    else:
+        print(refresh_index(full=sys.argv[1] == "rebuild"))
@@ -0,0 +1,56 @@
+"""BlockingPool backlog accounting."""
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from executors import BlockingPool
+
+
+def test_cancel_before_start_releases_queue_slot():
+    pool = BlockingPool("test", workers=1, max_queue=2)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.ensure_future(pool.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(pool.run(lambda: "never"))
+        await asyncio.sleep(0.05)
+        assert pool.stats()["queued"] == 1
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        assert await blocker is True
+
+    try:
+        asyncio.run(scenario())
+        stats = pool.stats()
+        assert (stats["queued"], stats["active"]) == (0, 0)
+        assert stats["completed"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_full_backlog_rejects_and_recovers():
+    pool = BlockingPool("test", workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(pool.run(lambda: 1))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await pool.run(lambda: 2)
+        assert rejected.value.status_code == 503
+        release.set()
+        assert (await running, await waiting) == (True, 1)
+        assert await pool.run(lambda: 3) == 3
+
+    try:
+        asyncio.run(scenario())
+        assert pool.stats()["rejected"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,122 @@
+"""Placeholder/parameter agreement of the /api/scenarios/fetch SQL builders."""
+import re
+
+import pytest
+
+import scenario_events
+from scenario_analysis import SCENARIO_FETCH_MAX_LIMIT, ScenarioQuery, _fetch_sql
+from scenario_events import scenario_filter_sql
+
+TYPES = ["fcw", "harsh-brake"]
+DAYS_SQL = "AND {col} >= NOW() - %s * INTERVAL '1 day'"
+RANGE_SQL = "AND {col} >= %s AND {col} <= %s"
+
+
+def bindings(sql: str, params: list):
+    """(text just before each %s, the parameter bound to it), in order."""
+    positions = [m.start() for m in re.finditer(r"%s", sql)]
+    assert len(positions) == len(params), f"{len(positions)} placeholders, {len(params)} params"
+    return [(" ".join(sql[max(0, p - 60):p].split()), param) for p, param in zip(positions, params)]
+
+
+def assert_bound(sql: str, params: list, expected: list):
+    """``expected``: (regex the text before the placeholder must end with, parameter) per placeholder."""
+    got = bindings(sql, params)
+    assert len(got) == len(expected)
+    for (context, param), (pattern, value) in zip(got, expected):
+        assert re.search(pattern + r"\s*$", context), f"{value!r} bound after {context!r}"
+        assert param == value
+
+
+class FakeCursor:
+    """Answers index_watermark's two queries: index present, covering dmp ids up to ``watermark``,
+    last refreshed ``age`` seconds ago."""
+
+    def __init__(self, watermark, age=0.0):
+        self.watermark = watermark
+        self.age = age
+        self.last = ""
+
+    def execute(self, sql, params=None):
+        self.last = sql
+
+    def fetchone(self):
+        if "to_regclass" in self.last:
+            return (self.watermark is not None,)
+        return (self.watermark, self.age)
+
+
+@pytest.fixture(autouse=True)
+def fresh_index_state(monkeypatch):
+    monkeypatch.setattr(scenario_events, "SCENARIO_INDEX_ENABLED", True)
+    monkeypatch.setattr(scenario_events, "_available", None)
+
+
+def test_filter_without_index():
+    sql, params = scenario_filter_sql(TYPES, None, DAYS_SQL, [7])
+    assert_bound(sql, params, [(r"jsonb_build_object\('e',", "fcw"), (r"jsonb_build_object\('e',", "harsh-brake")])
+
+
+def test_filter_with_index_and_date_range():
+    sql, params = scenario_filter_sql(TYPES, 500, RANGE_SQL, ["2025-01-01", "2025-01-31 23:59:59"])
+    assert_bound(sql, params, [
+        (r"e\.event = ANY\(", TYPES),
+        (r"e\.created_at >=", "2025-01-01"),
+        (r"e\.created_at <=", "2025-01-31 23:59:59"),
+        (r"count\(DISTINCT e\.event\) =", 2),
+        (r"t\.id >", 500),
+        (r"jsonb_build_object\('e',", "fcw"),
+        (r"jsonb_build_object\('e',", "harsh-brake"),
+    ])
+
+
+def test_fetch_days_back_without_index():
+    sql, params = _fetch_sql(ScenarioQuery(event_types=TYPES, days_back=3, limit=20), FakeCursor(None))
+    assert_bound(sql, params, [
+        (r"jsonb_build_object\('e',", "fcw"),
+        (r"jsonb_build_object\('e',", "harsh-brake"),
+        (r"d\.created_at >= NOW\(\) -", 3),
+        (r"LIMIT", 20),
+    ])
+
+
+def test_fetch_ignores_stale_index():
+    query = ScenarioQuery(event_types=TYPES, days_back=3, limit=20)
+    sql, params = _fetch_sql(query, FakeCursor(800, age=scenario_events.SCENARIO_INDEX_MAX_AGE + 1))
+    assert "scenario_events" not in sql
+    assert params[:2] == TYPES
+
+
+def test_fetch_indexed_date_range_before_id():
+    query = ScenarioQuery(event_types=TYPES + ["not-an-event"], start_date="2025-01-01", end_date="2025-01-31",
+                          before_id=900, limit=50)
+    sql, params = _fetch_sql(query, FakeCursor(800))
+    assert_bound(sql, params, [
+        (r"e\.event = ANY\(", TYPES),
+        (r"e\.created_at >=", "2025-01-01"),
+        (r"e\.created_at <=", "2025-01-31 23:59:59"),
+        (r"count\(DISTINCT e\.event\) =", 2),
+        (r"t\.id >", 800),
+        (r"jsonb_build_object\('e',", "fcw"),
+        (r"jsonb_build_object\('e',", "harsh-brake"),
+        (r"d\.created_at >=", "2025-01-01"),
+        (r"d\.created_at <=", "2025-01-31 23:59:59"),
+        (r"d\.id <", 900),
+        (r"LIMIT", 50),
+    ])
+
+
+def test_fetch_single_bound_dates_and_no_events():
+    sql, params = _fetch_sql(ScenarioQuery(event_types=[], start_date="2025-02-01", limit=10**6), FakeCursor(800))
+    assert_bound(sql, params, [(r"d\.created_at >=", "2025-02-01"), (r"LIMIT", SCENARIO_FETCH_MAX_LIMIT)])
+    sql, params = _fetch_sql(ScenarioQuery(event_types=["fcw"], end_date="2025-02-01", before_id=5), FakeCursor(800))
+    assert_bound(sql, params, [
+        (r"e\.event = ANY\(", ["fcw"]),
+        (r"e\.created_at <=", "2025-02-01 23:59:59"),
+        (r"count\(DISTINCT e\.event\) =", 1),
+        (r"t\.id >", 800),
+        (r"jsonb_build_object\('e',", "fcw"),
+        (r"d\.created_at <=", "2025-02-01 23:59:59"),
+        (r"d\.id <", 5),
+        (r"LIMIT", 50),
+    ])
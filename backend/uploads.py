@@ -0,0 +1,184 @@
+import asyncio
+import os
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from executors import run_blocking
+
+# Upload bytes copied per read; the only part of a video upload held in memory
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 ** 2)))
+# Per-file size caps (bytes); larger uploads are rejected with 413
+UPLOAD_MAX_VIDEO_BYTES = int(os.getenv("UPLOAD_MAX_VIDEO_BYTES", str(2 * 1024 ** 3)))
+UPLOAD_MAX_PARQUET_BYTES = int(os.getenv("UPLOAD_MAX_PARQUET_BYTES", str(512 * 1024 ** 2)))
+UPLOAD_MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(32 * 1024 ** 2)))
+# Whole-request cap for multi-image uploads (bytes)
+UPLOAD_MAX_IMAGES_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_IMAGES_REQUEST_BYTES", str(512 * 1024 ** 2)))
+# Uploads copied to disk at once; further requests wait their turn instead of
+# piling up buffers and disk bandwidth
+UPLOAD_MAX_CONCURRENT = int(os.getenv("UPLOAD_MAX_CONCURRENT", "4"))
+
+_stats_lock = threading.Lock()
+_stats = {
+    "active": 0,
+    "waiting": 0,
+    "completed": 0,
+    "rejected_too_large": 0,
+    "bytes_written": 0,
+    "buffered_bytes": 0,
+    "buffered_bytes_peak": 0,
+}
+_slots: Optional[asyncio.Semaphore] = None
+
+# Multipart boundaries and form fields on top of the file itself
+_FORM_OVERHEAD_BYTES = 1024 ** 2
+# Request body caps of the upload routes, enforced while the body arrives (before multipart spooling)
+UPLOAD_ROUTE_LIMITS: Dict[str, int] = {
+    "/api/v2e/detect": UPLOAD_MAX_VIDEO_BYTES + _FORM_OVERHEAD_BYTES,
+    "/api/v2e/detect-images": UPLOAD_MAX_IMAGES_REQUEST_BYTES,
+    "/api/vlm/extract-frames": UPLOAD_MAX_VIDEO_BYTES + _FORM_OVERHEAD_BYTES,
+    "/api/local/load": UPLOAD_MAX_PARQUET_BYTES + _FORM_OVERHEAD_BYTES,
+}
+
+
+def _update(**deltas) -> None:
+    with _stats_lock:
+        for name, delta in deltas.items():
+            _stats[name] += delta
+        _stats["buffered_bytes_peak"] = max(_stats["buffered_bytes_peak"], _stats["buffered_bytes"])
+
+
+def _too_large(upload: UploadFile, max_bytes: int) -> HTTPException:
+    _update(rejected_too_large=1)
+    return HTTPException(status_code=413, detail=f"{upload.filename or 'upload'} exceeds {max_bytes} bytes")
+
+
+def _check_size(upload: UploadFile, max_bytes: int) -> None:
+    # Per-file cap on the spooled part; UploadLimitMiddleware already bounded the whole request
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(upload, max_bytes)
+
+
+@asynccontextmanager
+async def _upload_slot():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, UPLOAD_MAX_CONCURRENT))
+    _update(waiting=1)
+    try:
+        await _slots.acquire()
+    finally:
+        _update(waiting=-1)
+    _update(active=1)
+    try:
+        yield
+    finally:
+        _update(active=-1)
+        _slots.release()
+
+
+def _copy_to_path(upload: UploadFile, dst: str, max_bytes: int) -> int:
+    """Chunked copy of the spooled upload to ``dst`` (temp file + rename); returns bytes written."""
+    src = upload.file
+    src.seek(0)
+    tmp = f"{dst}.{uuid.uuid4().hex}.part"
+    written = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                _update(buffered_bytes=len(chunk))
+                try:
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise _too_large(upload, max_bytes)
+                    out.write(chunk)
+                finally:
+                    _update(buffered_bytes=-len(chunk))
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _update(completed=1, bytes_written=written)
+    return written
+
+
+async def save_upload(upload: UploadFile, dst: str, max_bytes: int = UPLOAD_MAX_VIDEO_BYTES) -> int:
+    """Stream an upload to ``dst`` in UPLOAD_CHUNK_BYTES chunks without reading it into memory.
+
+    Starlette spools multipart parts over 1 MiB to a temp file; this copies
+    that file on the io pool, enforcing ``max_bytes`` (413) and
+    UPLOAD_MAX_CONCURRENT. Accepted uploads are therefore written to disk
+    twice (spool, then ``dst``); the request as a whole is capped earlier,
+    while it arrives, by UploadLimitMiddleware.
+    """
+    _check_size(upload, max_bytes)
+    async with _upload_slot():
+        return await run_blocking("io", _copy_to_path, upload, dst, max_bytes)
+
+
+def open_upload(upload: UploadFile, max_bytes: int = UPLOAD_MAX_IMAGE_BYTES):
+    """The upload's spooled file rewound for direct reading (e.g. by PIL), after the size cap check."""
+    _check_size(upload, max_bytes)
+    upload.file.seek(0)
+    return upload.file
+
+
+class UploadLimitMiddleware:
+    """Reject oversize bodies of the UPLOAD_ROUTE_LIMITS routes with 413 as they arrive.
+
+    A declared Content-Length over the cap is refused before any of the body
+    is read; otherwise bytes are counted as the body is received and the
+    request is aborted once past the cap, so an oversize upload never gets
+    fully spooled to disk.
+    """
+
+    def __init__(self, app, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.limits = UPLOAD_ROUTE_LIMITS if limits is None else limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            _update(rejected_too_large=1)
+            await JSONResponse({"detail": f"request body exceeds {limit} bytes"}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    _update(rejected_too_large=1)
+                    # Raised inside form parsing; FastAPI passes HTTPException through as the response
+                    raise HTTPException(status_code=413, detail=f"request body exceeds {limit} bytes")
+            return message
+
+        await self.app(scope, counted_receive, send)
+
+
+def upload_stats() -> dict:
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot.update({
+        "chunk_bytes": UPLOAD_CHUNK_BYTES,
+        "max_concurrent": UPLOAD_MAX_CONCURRENT,
+        "max_video_bytes": UPLOAD_MAX_VIDEO_BYTES,
+    })
+    return snapshot
+
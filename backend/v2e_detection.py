@@ -1,12 +1,16 @@
 import os
 import uuid
-import subprocess
 from typing import List, Optional
-import io
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 
+from executors import run_blocking
+from jobs import no_progress, submit_job
+from model_registry import check_backend, get_detector
+from uploads import open_upload, save_upload
+from visualization.frame_pipeline import probe_video, render_batched
+
 
 STATIC_DIR = "/app/data/saved_video"
 
@@ -17,26 +21,94 @@ def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def _extract_frames(input_video: str, out_dir: str, fps: int) -> None:
-    _ensure_dir(out_dir)
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", input_video,
-        "-vf", f"fps={fps}",
-        os.path.join(out_dir, "frame_%05d.jpg"),
-    ]
-    subprocess.run(cmd, check=True)
+def _draw_boxes(image, r0) -> int:
+    """Draw one ultralytics result on a BGR frame in place; returns the number of boxes."""
+    import cv2
+
+    kept = 0
+    if hasattr(r0, 'boxes') and r0.boxes is not None:
+        for b in r0.boxes:
+            x1, y1, x2, y2 = [int(v) for v in b.xyxy[0].tolist()]
+            conf = float(b.conf[0].item()) if hasattr(b, 'conf') else 0.0
+            cls_id = int(b.cls[0].item()) if hasattr(b, 'cls') else -1
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 3)
+            label = f"{cls_id if cls_id>=0 else 'obj'} {conf:.2f}"
+            cv2.putText(image, label, (x1 + 4, y1 + 16), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            kept += 1
+    return kept
+
+
+def _check_backend(backend: Optional[str]) -> str:
+    try:
+        return check_backend(backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _load_detector(backend: Optional[str] = None):
+    """The shared detector for ``backend``, loaded; errors become HTTP errors."""
+    detector = get_detector(backend=_check_backend(backend))
+    try:
+        detector.load()
+    except ImportError as e:
+        raise HTTPException(status_code=500, detail=f"Missing dependencies for YOLO: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Load YOLO model failed: {e}")
+    return detector
+
+
+def _detect_on_video(input_path: str, work_dir: str, fps: int, score_threshold: float,
+                     previews: bool = True, progress=no_progress, backend: Optional[str] = None):
+    """Blocking part of /detect: decode sampled frames, run YOLO in batches and encode the results.
+
+    Frames stream from an ffmpeg decoder pipe through batched detection into
+    one ffmpeg encoder that writes the side-by-side video and, with
+    ``previews``, the original and detection halves cropped from it.
+    """
+    try:
+        import numpy as np
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Missing dependencies for YOLO: {e}")
+
+    # Process-wide CPU-friendly model, loaded once
+    progress("load", 5)
+    detector = _load_detector(backend)
+
+    orig_preview = os.path.join(work_dir, "orig_preview.mp4") if previews else None
+    det_preview = os.path.join(work_dir, "det_preview.mp4") if previews else None
+    side_by_side = os.path.join(work_dir, "side_by_side.mp4")
+    try:
+        info = probe_video(input_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ffprobe failed: {e}")
+    width, height = info.width, info.height
+    outputs = [(side_by_side, None)]
+    if previews:
+        outputs += [(orig_preview, f"crop={width}:{height}:0:0"), (det_preview, f"crop={width}:{height}:{width}:0")]
 
+    kept = 0
+
+    def draw_batch(first, frames):
+        nonlocal kept
+        # ultralytics takes numpy frames as BGR, as decoded
+        results = detector.predict(frames, score_threshold)
+        outs = []
+        for frame, r0 in zip(frames, results):
+            out = np.empty((height, 2 * width, 3), dtype=np.uint8)
+            out[:, :width] = frame
+            out[:, width:] = frame
+            kept += _draw_boxes(out[:, width:], r0)
+            outs.append(out)
+        return outs
 
-def _frames_to_video(frames_dir: str, out_path: str, fps: int) -> None:
-    cmd = [
-        "ffmpeg", "-y",
-        "-framerate", str(fps),
-        "-i", os.path.join(frames_dir, "frame_%05d.jpg"),
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        out_path,
-    ]
-    subprocess.run(cmd, check=True)
+    try:
+        stats = render_batched(input_path, outputs, max(1, int(fps)), draw_batch, detector.batch_size,
+                               out_size=(2 * width, height), progress=progress, start=10, span=85)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ffmpeg detect pipeline failed: {e}")
+    return stats.frames, kept, orig_preview, det_preview, side_by_side
 
 
 @router.post("/detect")
@@ -45,110 +117,122 @@ async def detect_yolov8(
     queries: Optional[str] = Form(None),  # kept for API compatibility, unused by YOLO
     fps: int = Form(1),
     score_threshold: float = Form(0.3),
+    async_job: bool = Form(False),
+    previews: bool = Form(True),
+    backend: Optional[str] = Form(None),
 ):
     """Demo endpoint: run YOLOv8 detection on sampled frames (CPU-friendly).
 
-    Returns URLs of the original-preview, detection-preview, and a side-by-side video.
+    Returns URLs of the original-preview, detection-preview, and a side-by-side video,
+    or a job id to poll at /api/jobs/status/{job_id} when async_job is set.
+    With previews=false only the side-by-side video is encoded and the
+    preview URLs are null. backend=torch|onnx overrides YOLO_BACKEND.
     """
+    backend = _check_backend(backend)
     session = str(uuid.uuid4())
     work_dir = os.path.join(STATIC_DIR, "detections", session)
-    frames_dir = os.path.join(work_dir, "frames")
-    out_frames_dir = os.path.join(work_dir, "det_frames")
     _ensure_dir(work_dir)
-    _ensure_dir(frames_dir)
-    _ensure_dir(out_frames_dir)
 
     # Save upload
     input_path = os.path.join(work_dir, "input.mp4")
-    with open(input_path, "wb") as f:
-        f.write(await video.read())
-
-    # Extract frames
-    try:
-        _extract_frames(input_path, frames_dir, max(1, int(fps)))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg extract failed: {e}")
-
-    # Run OWL-ViT detection per frame
-    try:
-        from PIL import Image
-        import numpy as np
-        from ultralytics import YOLO
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Missing dependencies for YOLO: {e}")
+    await save_upload(video, input_path)
+
+    if async_job:
+        payload = {
+            "input_path": input_path,
+            "work_dir": work_dir,
+            "fps": fps,
+            "score_threshold": score_threshold,
+            "queries": queries,
+            "previews": previews,
+            "backend": backend,
+        }
+        return submit_job("v2e_detect", payload)
 
-    # Load a small CPU-friendly model
-    try:
-        yolo = YOLO("yolov8n.pt")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Load YOLO model failed: {e}")
+    result = await run_blocking(
+        "media", _detect_and_describe, input_path, work_dir, fps, score_threshold, queries, previews,
+        backend=backend
+    )
+    return JSONResponse(result)
 
-    frame_files = sorted([f for f in os.listdir(frames_dir) if f.lower().endswith('.jpg')])
-    kept = 0
-    for fname in frame_files:
-        in_path = os.path.join(frames_dir, fname)
-        image = Image.open(in_path).convert("RGB")
-        # Run YOLO (results[0] corresponds to this image)
-        res = yolo.predict(np.array(image), verbose=False, conf=float(score_threshold))
-        r0 = res[0]
-        # Draw boxes
-        from PIL import ImageDraw
-        draw = ImageDraw.Draw(image)
-        if hasattr(r0, 'boxes') and r0.boxes is not None:
-            for b in r0.boxes:
-                x1, y1, x2, y2 = [int(v) for v in b.xyxy[0].tolist()]
-                conf = float(b.conf[0].item()) if hasattr(b, 'conf') else 0.0
-                cls_id = int(b.cls[0].item()) if hasattr(b, 'cls') else -1
-                draw.rectangle([x1, y1, x2, y2], outline=(0,255,0), width=3)
-                label = f"{cls_id if cls_id>=0 else 'obj'} {conf:.2f}"
-                draw.text((x1+4, y1+4), label, fill=(0,255,0))
-                kept += 1
-        image.save(os.path.join(out_frames_dir, fname))
-
-    # Build preview videos from frames (same fps used at extraction time)
-    orig_preview = os.path.join(work_dir, "orig_preview.mp4")
-    det_preview = os.path.join(work_dir, "det_preview.mp4")
-    side_by_side = os.path.join(work_dir, "side_by_side.mp4")
-    try:
-        _frames_to_video(frames_dir, orig_preview, max(1, int(fps)))
-        _frames_to_video(out_frames_dir, det_preview, max(1, int(fps)))
-        # hstack two previews
-        cmd = [
-            "ffmpeg", "-y", "-i", orig_preview, "-i", det_preview,
-            "-filter_complex", "hstack=inputs=2",
-            side_by_side,
-        ]
-        subprocess.run(cmd, check=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg compose failed: {e}")
 
-    rel = lambda p: p.replace(STATIC_DIR, "/static")
+def _detect_and_describe(input_path: str, work_dir: str, fps: int, score_threshold: float,
+                         queries: Optional[str], previews: bool = True, progress=no_progress,
+                         backend: Optional[str] = None) -> dict:
+    frame_count, kept, orig_preview, det_preview, side_by_side = _detect_on_video(
+        input_path, work_dir, fps, score_threshold, previews, progress, backend
+    )
+    rel = lambda p: p.replace(STATIC_DIR, "/static") if p else None
     # Echo back user queries (optional, YOLO ignores them)
     queries_out: List[str] = []
     if queries:
         queries_out = [s.strip() for s in str(queries).split(',') if s.strip()]
-    return JSONResponse(
-        {
-            "success": True,
-            "queries": queries_out,
-            "frames": len(frame_files),
-            "detections": kept,
-            "original_preview": rel(orig_preview),
-            "detected_preview": rel(det_preview),
-            "side_by_side": rel(side_by_side),
-        }
+    return {
+        "success": True,
+        "queries": queries_out,
+        "frames": frame_count,
+        "detections": kept,
+        "original_preview": rel(orig_preview),
+        "detected_preview": rel(det_preview),
+        "side_by_side": rel(side_by_side),
+    }
+
+
+def run_detect_job(payload: dict, progress) -> dict:
+    return _detect_and_describe(
+        payload["input_path"], payload["work_dir"], payload["fps"], payload["score_threshold"],
+        payload.get("queries"), payload.get("previews", True), progress, payload.get("backend")
     )
 
 
+def _detect_on_image_bytes(uploads, score_threshold: float, backend: Optional[str] = None):
+    """Blocking part of /detect-images: decode the uploads and run YOLO on them in batches."""
+    try:
+        from PIL import Image
+        import numpy as np
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Missing dependencies for YOLO: {e}")
+
+    detector = _load_detector(backend)
+
+    results_out = []
+    # Decode one batch at a time so only batch_size full-resolution images are resident
+    for first in range(0, len(uploads), detector.batch_size):
+        names, arrays = [], []
+        for name, fileobj in uploads[first:first + detector.batch_size]:
+            try:
+                img = Image.open(fileobj).convert("RGB")
+            except Exception:
+                # Skip non-image
+                continue
+            names.append(name)
+            # Detectors take BGR frames, as decoded by ffmpeg/OpenCV
+            arrays.append(np.ascontiguousarray(np.array(img)[:, :, ::-1]))
+        if not arrays:
+            continue
+        for name, r0 in zip(names, detector.predict(arrays, score_threshold)):
+            boxes = []
+            if hasattr(r0, 'boxes') and r0.boxes is not None:
+                for b in r0.boxes:
+                    x1, y1, x2, y2 = [int(v) for v in b.xyxy[0].tolist()]
+                    conf = float(b.conf[0].item()) if hasattr(b, 'conf') else 0.0
+                    cls_id = int(b.cls[0].item()) if hasattr(b, 'cls') else -1
+                    boxes.append({"x": x1, "y": y1, "w": x2 - x1, "h": y2 - y1, "conf": conf, "cls": cls_id})
+            results_out.append({"filename": name, "boxes": boxes})
+    return results_out
+
 
 # New: Run YOLO detection on uploaded images (local folder semi-auto)
 @router.post("/detect-images")
 async def detect_on_images(
     files: list[UploadFile] = File(...),
     score_threshold: float = Form(0.3),
+    backend: Optional[str] = Form(None),
 ):
     """Accept multiple image files, run YOLO and return detections per image.
 
+    backend=torch|onnx overrides YOLO_BACKEND; the response is the same for both.
+
     Response format:
       {
         "results": [
@@ -156,37 +240,9 @@ async def detect_on_images(
         ]
       }
     """
-    try:
-        from PIL import Image
-        import numpy as np
-        from ultralytics import YOLO
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Missing dependencies for YOLO: {e}")
-
-    try:
-        yolo = YOLO("yolov8n.pt")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Load YOLO model failed: {e}")
-
-    results_out = []
-    for f in files:
-        name = f.filename or "image.jpg"
-        data = await f.read()
-        try:
-            img = Image.open(io.BytesIO(data)).convert("RGB")
-        except Exception:
-            # Skip non-image
-            continue
-        import numpy as np  # ensure available in scope if not imported above
-        res = yolo.predict(np.array(img), verbose=False, conf=float(score_threshold))
-        r0 = res[0]
-        boxes = []
-        if hasattr(r0, 'boxes') and r0.boxes is not None:
-            for b in r0.boxes:
-                x1, y1, x2, y2 = [int(v) for v in b.xyxy[0].tolist()]
-                conf = float(b.conf[0].item()) if hasattr(b, 'conf') else 0.0
-                cls_id = int(b.cls[0].item()) if hasattr(b, 'cls') else -1
-                boxes.append({"x": x1, "y": y1, "w": x2 - x1, "h": y2 - y1, "conf": conf, "cls": cls_id})
-        results_out.append({"filename": name, "boxes": boxes})
+    # PIL reads the spooled upload files directly; nothing is copied into bytes first
+    backend = _check_backend(backend)
+    uploads = [(f.filename or "image.jpg", open_upload(f)) for f in files]
 
+    results_out = await run_blocking("media", _detect_on_image_bytes, uploads, score_threshold, backend)
     return {"results": results_out}
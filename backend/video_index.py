@@ -0,0 +1,113 @@
+import bisect
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from s3_catalog import get_catalog
+
+# Footage is recorded as back-to-back 60 s files named <YYYY-mm-dd_HH-MM-SS>-front.mp4
+SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "60"))
+# Largest gap between one file's end and the next file's start still treated as continuous
+SEGMENT_GAP_TOLERANCE = float(os.getenv("VIDEO_SEGMENT_GAP_TOLERANCE", "2"))
+# Upper bound on files stitched together for a single clip
+MAX_SPAN_SEGMENTS = int(os.getenv("VIDEO_MAX_SPAN_SEGMENTS", "2"))
+
+_FRONT_RE = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})-front\.mp4$")
+
+
+def parse_segment_start(filename: str) -> Optional[float]:
+    """Epoch seconds (UTC) encoded in a front-camera filename, or None."""
+    match = _FRONT_RE.search(filename)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y-%m-%d_%H-%M-%S").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+class VideoSegmentIndex:
+    """Sorted interval index of the front-camera segments under one org/key prefix."""
+
+    def __init__(self):
+        self.starts: List[float] = []
+        self.keys: List[str] = []
+        self._lock = threading.Lock()
+        # Identity/length of the catalog rows last indexed, for incremental updates
+        self._rows_id = None
+        self._rows_seen = 0
+        self._last_row_key = None
+
+    def sync(self, rows: List[list]) -> None:
+        """Bring the index in line with the catalog rows for this prefix."""
+        with self._lock:
+            if id(rows) == self._rows_id and len(rows) == self._rows_seen:
+                return
+            appended = (
+                self._rows_seen
+                and len(rows) >= self._rows_seen
+                and rows[self._rows_seen - 1][0] == self._last_row_key
+            )
+            if not appended:
+                self.starts, self.keys = [], []
+                self._rows_seen = 0
+            for key, _size, _modified in rows[self._rows_seen:]:
+                start = parse_segment_start(key.rsplit("/", 1)[-1])
+                if start is None:
+                    continue
+                i = bisect.bisect_right(self.starts, start)
+                self.starts.insert(i, start)
+                self.keys.insert(i, key)
+            self._rows_id = id(rows)
+            self._rows_seen = len(rows)
+            self._last_row_key = rows[-1][0] if rows else None
+
+    @property
+    def latest_end(self) -> Optional[float]:
+        return self.starts[-1] + SEGMENT_SECONDS if self.starts else None
+
+    def covering(self, t0: float, t1: float) -> Optional[List[dict]]:
+        """Segments that together cover [t0, t1], in order, or None.
+
+        Binary-searches the segment containing t0 and then walks forward through
+        adjacent segments (gap <= SEGMENT_GAP_TOLERANCE) until t1 is covered.
+        """
+        with self._lock:
+            i = bisect.bisect_right(self.starts, t0) - 1
+            if i < 0 or self.starts[i] + SEGMENT_SECONDS < t0:
+                return None
+            segments = [{"key": self.keys[i], "start": self.starts[i], "end": self.starts[i] + SEGMENT_SECONDS}]
+            while segments[-1]["end"] < t1:
+                j = i + len(segments)
+                if len(segments) >= MAX_SPAN_SEGMENTS or j >= len(self.starts):
+                    return None
+                if self.starts[j] - segments[-1]["end"] > SEGMENT_GAP_TOLERANCE:
+                    return None
+                segments.append({"key": self.keys[j], "start": self.starts[j], "end": self.starts[j] + SEGMENT_SECONDS})
+            return segments
+
+
+_indexes: Dict[tuple, VideoSegmentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def find_segments(s3_client, bucket: str, org_id: str, key_id: str, t0: float, t1: float) -> Optional[List[dict]]:
+    """Look up the footage segment(s) covering [t0, t1] for a vehicle.
+
+    The index is built once per org/key from the cached S3 catalog and only
+    re-parses newly listed files afterwards. If the range ends after the newest
+    indexed file, the listing is refreshed once in case the footage just landed
+    (at most once per S3_CATALOG_MIN_REFRESH seconds per prefix).
+    """
+    prefix = f"{org_id}/{key_id}/"
+    with _indexes_lock:
+        index = _indexes.setdefault((bucket, prefix), VideoSegmentIndex())
+    catalog = get_catalog(bucket, s3_client)
+    index.sync(catalog.object_rows(prefix))
+    segments = index.covering(t0, t1)
+    if segments is None and (index.latest_end is None or t1 > index.latest_end):
+        index.sync(catalog.refresh_objects(prefix))
+        segments = index.covering(t0, t1)
+    return segments
@@ -1,16 +1,23 @@
 from fastapi import APIRouter, HTTPException
 import os
-import uuid
-import boto3
-import subprocess
 import shutil
+from contextlib import ExitStack
+
+from aws_clients import s3_client
+from executors import run_blocking
+from jobs import no_progress, submit_job
+from s3_object_cache import video_cache
+from visualization.frame_pipeline import render_overlay, render_workers
+from visualization.mask_source import open_npy_zip
+from visualization.render_cache import cached_render, render_key
 
 router = APIRouter()
 
 STATIC_DIR = "/app/data/saved_video"
+# Bump when the drawing changes so cached renders are not reused
+RENDERER_VERSION = 2
 
-@router.post("/api/viz/render-depth")
-async def render_depth(req: dict):
+def _render_depth(req: dict, progress=no_progress):
     video_path = req.get("video_path")
     zip_path = req.get("result_zip_path") or req.get("zip_path") or req.get("result_dir_path")
     fps = int(req.get("fps") or 3)
@@ -20,14 +27,8 @@ async def render_depth(req: dict):
     if not video_path or not zip_path:
         raise HTTPException(status_code=400, detail="missing video_path or result_zip_path")
 
-    session_id = str(uuid.uuid4())
-    work_dir = os.path.join(STATIC_DIR, "viz", session_id)
-    images_dir = os.path.join(work_dir, "images")
-    ann_dir = os.path.join(work_dir, "annotated")
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(ann_dir, exist_ok=True)
-
-    s3 = boto3.client("s3")
+    progress("download", 2)
+    s3 = s3_client()
     try:
         # Normalize s3 paths
         def norm(p: str, default_bucket: str):
@@ -56,97 +57,82 @@ async def render_depth(req: dict):
                 raise HTTPException(status_code=404, detail=f"zip not found under {rb}/{rk}")
             rk = found
 
-        local_video = os.path.join(work_dir, os.path.basename(vk))
-        s3.download_file(vb, vk, local_video)
-        local_zip = os.path.join(work_dir, "depth_anything.zip")
-        s3.download_file(rb, rk, local_zip)
+        # Content identity of both inputs: a re-uploaded video or zip renders afresh
+        inputs = {
+            "video": [vb, vk, video_cache.etag(vb, vk)],
+            "result": [rb, rk, s3.head_object(Bucket=rb, Key=rk)["ETag"]],
+            "fps": fps,
+        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"s3 download failed: {e}")
+        raise HTTPException(status_code=500, detail=f"s3 lookup failed: {e}")
 
-    # extract frames
-    try:
-        cmd = ["ffmpeg", "-y", "-i", local_video, "-vf", f"fps={fps}", os.path.join(images_dir, "%d.jpg")]
-        subprocess.run(cmd, check=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg extract failed: {e}")
+    workers = render_workers(req.get("workers"))
+    key = render_key("depth", RENDERER_VERSION, inputs)
+    return cached_render(key, lambda work_dir: _draw_depth(work_dir, vb, vk, rb, rk, fps, workers, progress))
 
-    # unzip and render
-    try:
-        import zipfile, numpy as np, cv2
-        npy_root = os.path.join(work_dir, "npy")
-        os.makedirs(npy_root, exist_ok=True)
-        with zipfile.ZipFile(local_zip, 'r') as zf:
-            zf.extractall(npy_root)
-
-        # collect npy recursively
-        def npy_key(name: str) -> int:
+
+def _draw_depth(work_dir: str, vb: str, vk: str, rb: str, rk: str, fps: int, workers: int,
+                progress=no_progress) -> dict:
+    with ExitStack() as stack:
+        try:
+            local_video = video_cache.get_path(vb, vk)
+            # depth maps are read member by member straight from the ZIP on S3 (no extractall)
+            masks = stack.enter_context(open_npy_zip(rb, rk))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"s3 download failed: {e}")
+        try:
+            _blend_depth(masks, local_video, work_dir, fps, workers, progress)
+        except Exception as e:
             try:
-                base = os.path.splitext(os.path.basename(name))[0]
-                return int(base)
+                shutil.rmtree(work_dir)
             except Exception:
-                return 0
-        npy_files = []
-        for r, _d, files in os.walk(npy_root):
-            for f in files:
-                if f.lower().endswith('.npy'):
-                    npy_files.append(os.path.join(r, f))
-        npy_files.sort(key=npy_key)
-
-        extracted = sorted([f for f in os.listdir(images_dir) if f.endswith('.jpg')], key=lambda x: int(os.path.splitext(x)[0]))
-        if len(npy_files) == 0 or len(extracted) == 0:
-            raise HTTPException(status_code=500, detail=f"no depth masks or frames (npy={len(npy_files)}, frames={len(extracted)})")
-
-        # simple colormap (inferno-like) and normalization per-frame
-        def colorize(depth: np.ndarray) -> np.ndarray:
-            d = depth.astype('float32')
-            # robust min/max to mitigate outliers
-            lo = float(np.percentile(d, 1.0))
-            hi = float(np.percentile(d, 99.0))
-            if hi <= lo:
-                lo, hi = float(np.min(d)), float(np.max(d))
-            d = np.clip((d - lo) / max(1e-6, (hi - lo)), 0, 1)
-            d8 = (d * 255).astype('uint8')
-            return cv2.applyColorMap(d8, cv2.COLORMAP_MAGMA)
-
-        written = 0
-        alpha = 0.6
-        for i, img_name in enumerate(extracted, start=1):
-            if len(extracted) == 1:
-                mi = 1
-            else:
-                mi = int(round((i - 1) * (len(npy_files) - 1) / (len(extracted) - 1))) + 1
-            mi = max(1, min(len(npy_files), mi))
-            mask_path = npy_files[mi - 1]
-            img_path = os.path.join(images_dir, img_name)
-            img = cv2.imread(img_path)
-            depth = np.load(mask_path)
-            color = colorize(depth)
-            color = cv2.resize(color, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
-            out = (img * (1 - alpha) + color * alpha).astype(img.dtype)
-            cv2.imwrite(os.path.join(ann_dir, img_name), out)
-            written += 1
-    except Exception as e:
-        try:
-            shutil.rmtree(work_dir)
-        except Exception:
-            pass
-        raise HTTPException(status_code=500, detail=f"render failed: {e}")
+                pass
+            raise HTTPException(status_code=500, detail=f"render failed: {e}")
 
-    # encode video
     out_video = os.path.join(work_dir, "depth_annotated.mp4")
-    try:
-        annotated = sorted([f for f in os.listdir(ann_dir) if f.endswith('.jpg')], key=lambda x: int(os.path.splitext(x)[0]))
-        if not annotated:
-            raise HTTPException(status_code=500, detail="no annotated frames")
-        start_num = int(os.path.splitext(annotated[0])[0])
-        pattern = os.path.join(ann_dir, "%d.jpg").replace("\\", "/")
-        cmd = ["ffmpeg", "-y", "-framerate", str(fps), "-start_number", str(start_num), "-i", pattern, "-c:v", "libx264", "-pix_fmt", "yuv420p", out_video]
-        subprocess.run(cmd, check=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg encode failed: {e}")
-
     rel = os.path.relpath(out_video, STATIC_DIR).replace("\\", "/")
     return {"success": True, "video_url": f"/static/{rel}"}
 
 
+def _blend_depth(masks, local_video: str, work_dir: str, fps: int, workers: int, progress=no_progress) -> None:
+    import numpy as np, cv2
+    if len(masks) == 0:
+        raise HTTPException(status_code=500, detail=f"no depth masks (npy={len(masks)})")
+
+    # simple colormap (inferno-like) and normalization per-frame
+    def colorize(depth: np.ndarray) -> np.ndarray:
+        d = depth.astype('float32')
+        # robust min/max to mitigate outliers (one partition for both percentiles)
+        lo, hi = (float(v) for v in np.percentile(d, [1.0, 99.0]))
+        if hi <= lo:
+            lo, hi = float(np.min(d)), float(np.max(d))
+        d = np.clip((d - lo) / max(1e-6, (hi - lo)), 0, 1)
+        d8 = (d * 255).astype('uint8')
+        return cv2.applyColorMap(d8, cv2.COLORMAP_MAGMA)
+
+    alpha = 0.6
+
+    def draw(index, img, n_img):
+        mi = int(round(index * (len(masks) - 1) / (n_img - 1))) if n_img > 1 else 0
+        depth = masks[max(0, min(len(masks) - 1, mi))]
+        color = colorize(depth)
+        color = cv2.resize(color, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+        return cv2.addWeighted(img, 1 - alpha, color, alpha, 0)
+
+    # decode -> blend -> encode in one streaming pass
+    out_video = os.path.join(work_dir, "depth_annotated.mp4")
+    stats = render_overlay(local_video, out_video, fps, draw, progress, workers=workers)
+    if stats.frames == 0:
+        raise HTTPException(status_code=500, detail="no annotated frames")
 
+
+def run_render_job(payload: dict, progress) -> dict:
+    return _render_depth(payload, progress)
+
+
+@router.post("/api/viz/render-depth")
+async def render_depth(req: dict):
+    """Render synchronously, or with {"async_job": true} return a job id to poll at /api/jobs/status/{job_id}."""
+    if req.get("async_job"):
+        return submit_job("render_depth", req)
+    return await run_blocking("media", _render_depth, req)
@@ -1,16 +1,26 @@
 from fastapi import APIRouter, HTTPException
 import os
-import uuid
-import boto3
 import json
-import subprocess
 import shutil
+import tempfile
+from contextlib import ExitStack
 from typing import Tuple
 
+from aws_clients import s3_client
+from executors import run_blocking
+from jobs import no_progress, submit_job
+from parquet_window import filesystem
+from s3_object_cache import video_cache
+from visualization.frame_pipeline import render_overlay, render_workers
+from visualization.mask_source import SOURCE_ETAG_METADATA, bitmask_key, convert_npy_zip, open_masks, resolve_mask_key
+from visualization.render_cache import cached_render, render_key
+
 router = APIRouter()
 
 # Paths shared with main
 STATIC_DIR = "/app/data/saved_video"
+# Bump when the drawing changes so cached renders are not reused
+RENDERER_VERSION = 2
 
 
 def _normalize_s3_path(s3_path: str, default_bucket: str = None) -> Tuple[str, str]:
@@ -67,8 +77,7 @@ def _decode_any_mask(det: dict):
     return None
 
 
-@router.post("/api/viz/render-ego-lane")
-async def render_ego_lane(req: dict):
+def _render_ego_lane(req: dict, progress=no_progress):
     video_path = req.get("video_path") or req.get("video_key") or req.get("video_s3")
     # ZIP directory/file containing per-frame NPY masks (single source of truth)
     zip_path = req.get("result_zip_path") or req.get("zip_path") or req.get("result_dir_path")
@@ -81,15 +90,8 @@ async def render_ego_lane(req: dict):
     if not video_path:
         raise HTTPException(status_code=400, detail="missing video_path")
 
-    session_id = str(uuid.uuid4())
-    work_dir = os.path.join(STATIC_DIR, "viz", session_id)
-    images_dir = os.path.join(work_dir, "images")
-    ann_dir = os.path.join(work_dir, "annotated")
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(ann_dir, exist_ok=True)
-
-    s3 = boto3.client("s3")
-    debug_meta = {}
+    progress("download", 2)
+    s3 = s3_client()
     try:
         vb, vk = _normalize_s3_path(video_path, default_bucket=VIDEO_BUCKET)
         if not zip_path:
@@ -99,169 +101,118 @@ async def render_ego_lane(req: dict):
         result_key = rk
         if not vb or not vk or not rb or not rk:
             raise HTTPException(status_code=400, detail="failed to normalize s3 paths")
-        local_video = os.path.join(work_dir, os.path.basename(vk))
-        s3.download_file(vb, vk, local_video)
-
-        debug_meta.update({"video_bucket": vb, "video_key": vk})
-
-        # Resolve ZIP (file or inside a folder)
-        key_candidate = result_key
-        if not result_key.lower().endswith('.zip'):
-            prefix = result_key.rstrip('/') + '/'
-            resp = s3.list_objects_v2(Bucket=result_bucket, Prefix=prefix)
-            found = None
-            for it in resp.get('Contents', []):
-                k = it.get('Key') or ''
-                if k.lower().endswith('.zip'):
-                    found = k
-                    break
-            if not found:
-                raise HTTPException(status_code=404, detail=f"zip not found under {result_bucket}/{result_key}")
-            key_candidate = found
-
-        # Download and extract zip containing NPY masks
-        local_zip = os.path.join(work_dir, "ego_lane_plus.zip")
-        s3.download_file(result_bucket, key_candidate, local_zip)
-        import zipfile
-        npy_dir = os.path.join(work_dir, "npy")
-        os.makedirs(npy_dir, exist_ok=True)
-        with zipfile.ZipFile(local_zip, 'r') as zf:
-            zf.extractall(npy_dir)
-        debug_meta.update({"zip_bucket": result_bucket, "zip_key": key_candidate})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"s3 download failed: {e}")
 
-    try:
-        cmd = [
-            "ffmpeg", "-y", "-i", local_video, "-vf", f"fps={fps}",
-            os.path.join(images_dir, "%d.jpg")
-        ]
-        subprocess.run(cmd, check=True)
+        # Resolve the mask file: a .bitmask (preferred when converted) or ZIP of NPY, or a folder holding one
+        key_candidate, mask_etag = resolve_mask_key(s3, result_bucket, result_key)
+
+        # Content identity of both inputs: a re-uploaded video or mask file renders afresh
+        inputs = {
+            "video": [vb, vk, video_cache.etag(vb, vk)],
+            "result": [result_bucket, key_candidate, mask_etag],
+            "fps": fps,
+        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg extract failed: {e}")
+        raise HTTPException(status_code=500, detail=f"s3 lookup failed: {e}")
+
+    workers = render_workers(req.get("workers"))
+    key = render_key("ego_lane", RENDERER_VERSION, inputs)
+    return cached_render(key, lambda work_dir: _draw_ego_lane(
+        work_dir, vb, vk, result_bucket, key_candidate, fps, workers, progress))
+
 
+def _draw_ego_lane(work_dir: str, vb: str, vk: str, result_bucket: str, key_candidate: str,
+                   fps: int, workers: int, progress=no_progress) -> dict:
     try:
         import cv2  # noqa
         import numpy as np  # noqa
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"opencv/numpy missing: {e}")
 
-    try:
-        def parse_frames(obj):
-            frames = []
-            if not obj:
-                return frames
-            if isinstance(obj, list):
-                for idx, item in enumerate(obj):
-                    if isinstance(item, dict):
-                        # Expect keys: frame_index, detections(list of {mask: RLE})
-                        item = dict(item)
-                        item.setdefault("frame_index", item.get("frame", idx))
-                        frames.append(item)
-                return frames
-            if isinstance(obj, dict):
-                # Support {frames:[...]} or {index: {...}}
-                if "frames" in obj:
-                    return parse_frames(obj.get("frames"))
-                for k, v in obj.items():
-                    if isinstance(v, dict):
-                        fr = dict(v)
-                        fr.setdefault("frame_index", int(k) if str(k).isdigit() else 0)
-                        frames.append(fr)
-                frames.sort(key=lambda x: x.get("frame_index", 0))
-                return frames
-            return frames
-
-        # Build mapping from extracted frames to npy files.
-        if npy_dir is not None:
-            # Build list of npy files sorted by natural order
-            def npy_key(name: str) -> int:
-                try:
-                    base = os.path.splitext(os.path.basename(name))[0]
-                    return int(base)
-                except Exception:
-                    return 0
-            # Collect .npy files recursively; some zips contain nested folders
-            npy_files = []
-            for r, _d, files in os.walk(npy_dir):
-                for f in files:
-                    if f.lower().endswith('.npy'):
-                        npy_files.append(os.path.join(r, f))
-            npy_files.sort(key=npy_key)
-            extracted_files = sorted([f for f in os.listdir(images_dir) if f.endswith('.jpg')], key=lambda x: int(os.path.splitext(x)[0]))
-            n_mask = len(npy_files)
-            n_img = len(extracted_files)
-            debug_meta.update({"npy_count": n_mask, "extracted_count": n_img})
-            if n_mask == 0 or n_img == 0:
-                raise HTTPException(status_code=500, detail=f"no masks or frames to render (npy={n_mask}, frames={n_img})")
-
-            written = 0
-            import numpy as np
-            color = (0, 165, 255)  # orange
-            alpha = 0.5
-            for i, img_name in enumerate(extracted_files, start=1):
-                # Map current image index to mask index (1-based)
-                if n_img == 1:
-                    mi = 1
-                else:
-                    mi = int(round((i - 1) * (n_mask - 1) / (n_img - 1))) + 1
-                mi = max(1, min(n_mask, mi))
-                mask_path = npy_files[mi - 1]
-                img_path = os.path.join(images_dir, img_name)
-                img = cv2.imread(img_path)
-                mask = np.load(mask_path)
-                # Resize mask to image size and binarize (>0 treated as lane)
-                mask_resized = cv2.resize(mask.astype('uint8'), (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
-                m = mask_resized > 0
-                out = img.copy()
-                out[m] = (out[m] * (1 - alpha) + np.array(color, dtype=out.dtype) * alpha).astype(out.dtype)
-                out_path = os.path.join(ann_dir, img_name)
-                cv2.imwrite(out_path, out)
-                written += 1
-
-        else:
-            raise HTTPException(status_code=500, detail="internal error: npy_dir not prepared")
-
-        # JSON legacy branch removed per user request
-
-    except Exception as e:
+    debug_meta = {"video_bucket": vb, "video_key": vk}
+    with ExitStack() as stack:
         try:
-            shutil.rmtree(work_dir)
-        except Exception:
-            pass
-        print(f"render failed: {e}")
-        raise HTTPException(status_code=500, detail=f"render failed: {e}")
-
-    # Fallback: if nothing annotated (e.g., empty detections), copy raw frames so we can still encode
-    if written == 0:
+            local_video = video_cache.get_path(vb, vk)
+            # Masks are read frame by frame straight from S3 (no extractall)
+            masks = stack.enter_context(open_masks(result_bucket, key_candidate))
+            debug_meta.update({"zip_bucket": result_bucket, "zip_key": key_candidate})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"s3 download failed: {e}")
+
+        n_mask = len(masks)
+        debug_meta.update({"npy_count": n_mask})
+        if n_mask == 0:
+            raise HTTPException(status_code=500, detail=f"no masks to render (npy={n_mask})")
+
+        color = (0, 165, 255)  # orange
+        alpha = 0.5
+
+        def draw(index, img, n_img):
+            # Map current frame index to mask index (0-based)
+            mi = int(round(index * (n_mask - 1) / (n_img - 1))) if n_img > 1 else 0
+            mask = masks[max(0, min(n_mask - 1, mi))]
+            # Resize mask to image size and binarize (>0 treated as lane)
+            mask_resized = cv2.resize((mask > 0).astype('uint8'), (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+            # OpenCV kernels (GIL released) so frames blend in parallel across render workers
+            tinted = cv2.addWeighted(img, 1 - alpha, np.full_like(img, color), alpha, 0)
+            return cv2.copyTo(tinted, mask_resized, img)
+
+        # Decode -> overlay -> encode in one streaming pass, no intermediate JPEGs
+        out_video = os.path.join(work_dir, "ego_lane_annotated.mp4")
         try:
-            for fname in sorted(os.listdir(images_dir)):
-                if fname.endswith('.jpg'):
-                    src = os.path.join(images_dir, fname)
-                    dst = os.path.join(ann_dir, fname)
-                    shutil.copyfile(src, dst)
-            written = len([f for f in os.listdir(ann_dir) if f.endswith('.jpg')])
-        except Exception:
-            written = 0
-        if written == 0:
-            raise HTTPException(status_code=500, detail="no annotated frames generated (npy)")
-
-    out_video = os.path.join(work_dir, "ego_lane_annotated.mp4")
-    try:
-        annotated_files = sorted([f for f in os.listdir(ann_dir) if f.endswith('.jpg')], key=lambda x: int(os.path.splitext(x)[0]))
-        if not annotated_files:
-            raise HTTPException(status_code=500, detail="no annotated frames to encode")
-        start_num = int(os.path.splitext(annotated_files[0])[0])
-        pattern = os.path.join(ann_dir, "%d.jpg").replace("\\", "/")
-        cmd = [
-            "ffmpeg", "-y", "-framerate", str(fps), "-start_number", str(start_num), "-i", pattern,
-            "-c:v", "libx264", "-pix_fmt", "yuv420p", out_video
-        ]
-        subprocess.run(cmd, check=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ffmpeg encode failed: {e}")
+            stats = render_overlay(local_video, out_video, fps, draw, progress, workers=workers)
+        except Exception as e:
+            try:
+                shutil.rmtree(work_dir)
+            except Exception:
+                pass
+            print(f"render failed: {e}")
+            raise HTTPException(status_code=500, detail=f"render failed: {e}")
+    written = stats.frames
+    debug_meta.update({"extracted_count": written, "workers": workers})
+    if written == 0:
+        raise HTTPException(status_code=500, detail="no annotated frames generated (npy)")
 
     rel = os.path.relpath(out_video, STATIC_DIR).replace("\\", "/")
     return {"success": True, "video_url": f"/static/{rel}", "written": written, "fps": fps, "debug": debug_meta}
 
 
+def run_render_job(payload: dict, progress) -> dict:
+    return _render_ego_lane(payload, progress)
+
+
+@router.post("/api/viz/render-ego-lane")
+async def render_ego_lane(req: dict):
+    """Render synchronously, or with {"async_job": true} return a job id to poll at /api/jobs/status/{job_id}."""
+    if req.get("async_job"):
+        return submit_job("render_ego_lane", req)
+    return await run_blocking("media", _render_ego_lane, req)
+
+
+def _convert_masks(req: dict) -> dict:
+    zip_path = req.get("result_zip_path") or req.get("zip_path") or req.get("result_dir_path")
+    if not zip_path:
+        raise HTTPException(status_code=400, detail="missing result_zip_path")
+    RESULT_BUCKET = os.getenv("RESULT_BUCKET", "matt3r-ce-inference-output")
+    rb, rk = _normalize_s3_path(zip_path, default_bucket=RESULT_BUCKET)
+    s3 = s3_client()
+    try:
+        zip_key, _ = resolve_mask_key(s3, rb, rk, prefer_compact=False)
+        out_key = bitmask_key(zip_key)
+        with filesystem().open(f"{rb}/{zip_key}", "rb") as src, tempfile.TemporaryFile() as dst:
+            # The ETag of the version actually read; renders only prefer the bitmask while it matches
+            head = src.details if src.details.get("ETag") else s3.head_object(Bucket=rb, Key=zip_key)
+            source_etag = head["ETag"]
+            source_bytes = src.size
+            stats = convert_npy_zip(src, dst, source_etag=source_etag)
+            dst.seek(0)
+            s3.upload_fileobj(dst, rb, out_key,
+                              ExtraArgs={"Metadata": {SOURCE_ETAG_METADATA: source_etag.strip('"')}})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"mask conversion failed: {e}")
+    return {"success": True, "bitmask_path": f"s3://{rb}/{out_key}", "source_bytes": source_bytes, **stats}
+
+
+@router.post("/api/viz/ego-lane/convert-masks")
+async def convert_ego_lane_masks(req: dict):
+    """Write a compact .bitmask next to an ego_lane_plus ZIP of NPY masks; later renders read it instead."""
+    return await run_blocking("media", _convert_masks, req)
@@ -0,0 +1,279 @@
+import json
+import os
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from jobs import no_progress
+
+# x264 preset for rendered overlays; "veryfast" keeps quality close to the default at a fraction of the CPU
+RENDER_X264_PRESET = "veryfast"
+# Default overlay threads per render; OpenCV/NumPy kernels release the GIL so frames draw in parallel
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Upper bound on per-request worker counts (each worker also keeps two decoded frames in flight)
+RENDER_WORKERS_MAX = int(os.getenv("RENDER_WORKERS_MAX", str(os.cpu_count() or 1)))
+
+# draw(index, frame, expected_total) -> frame to encode (None = the input frame, possibly edited in place)
+DrawFn = Callable[[int, np.ndarray, int], Optional[np.ndarray]]
+# draw_batch(first_index, frames) -> one output frame per input frame, all of the render's output size
+BatchFn = Callable[[int, List[np.ndarray]], List[np.ndarray]]
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    duration: float
+
+
+class RenderStats(NamedTuple):
+    frames: int
+    width: int
+    height: int
+
+
+def probe_video(path: str) -> VideoInfo:
+    """Display size (rotation applied, as ffmpeg decodes it) and duration of the first video stream."""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,duration:stream_tags=rotate:stream_side_data=rotation:format=duration",
+        "-of", "json", path,
+    ]
+    info = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout or "{}")
+    streams = info.get("streams") or []
+    if not streams:
+        raise ValueError(f"no video stream in {path}")
+    stream = streams[0]
+    width, height = int(stream["width"]), int(stream["height"])
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list") or []:
+        rotation = side_data.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    duration = stream.get("duration") or (info.get("format") or {}).get("duration") or 0
+    return VideoInfo(width, height, float(duration))
+
+
+def expected_frame_count(info: VideoInfo, fps: float) -> int:
+    """Frames the fps filter will emit; may be off by one, callers clamp their index maps."""
+    return max(1, int(round(info.duration * fps)))
+
+
+def _read_frame(stream, frame: np.ndarray) -> bool:
+    view = memoryview(frame).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            if filled:
+                raise ValueError("truncated frame from decoder")
+            return False
+        filled += n
+    return True
+
+
+def _apply(draw: DrawFn, index: int, frame: np.ndarray, total: int) -> np.ndarray:
+    out = draw(index, frame, total)
+    out = frame if out is None else out
+    if out.shape != frame.shape or out.dtype != np.uint8:
+        raise ValueError(f"draw returned {out.dtype}{out.shape}, expected uint8{frame.shape}")
+    return np.ascontiguousarray(out)
+
+
+def render_workers(requested=None) -> int:
+    """Overlay thread count from a request value, capped at RENDER_WORKERS_MAX.
+
+    Missing, invalid or non-positive values fall back to RENDER_WORKERS.
+    """
+    try:
+        workers = int(requested) if requested is not None else RENDER_WORKERS
+    except (TypeError, ValueError):
+        workers = RENDER_WORKERS
+    if workers <= 0:
+        workers = RENDER_WORKERS
+    return max(1, min(workers, RENDER_WORKERS_MAX))
+
+
+def render_overlay(src: str, dst: str, fps: float, draw: DrawFn, progress=no_progress,
+                   start: float = 15, span: float = 75, workers: int = 1) -> RenderStats:
+    """Decode ``src`` at ``fps``, pass each BGR frame through ``draw``, encode to H.264 ``dst``.
+
+    Frames travel as rawvideo over pipes between an ffmpeg decoder and an
+    ffmpeg encoder, so nothing is written to disk but the output video and each
+    frame is compressed once (the old path wrote and re-read two JPEGs per frame).
+    Progress is reported as stage "render" from ``start`` to ``start + span``.
+
+    With ``workers`` > 1, ``draw`` runs on a thread pool over a bounded window
+    of decoded frames and results are encoded in frame order; ``draw`` must
+    then be safe to call concurrently and only touch the frame it is given.
+    """
+    info = probe_video(src)
+    width, height = info.width, info.height
+    total = expected_frame_count(info, fps)
+
+    decode_cmd = [
+        "ffmpeg", "-v", "error", "-i", src,
+        "-vf", f"fps={fps}", "-f", "rawvideo", "-pix_fmt", "bgr24", "-",
+    ]
+    encode_cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-framerate", str(fps), "-i", "-",
+        # yuv420p needs even dimensions
+        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+        "-c:v", "libx264", "-preset", RENDER_X264_PRESET, "-pix_fmt", "yuv420p", dst,
+    ]
+    # stderr to temp files so a chatty ffmpeg can never block on a full pipe
+    with tempfile.TemporaryFile() as decode_err, tempfile.TemporaryFile() as encode_err:
+        decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=decode_err, bufsize=0)
+        encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=encode_err)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render") if workers > 1 else None
+        pending = deque()
+        decoded = frames = 0
+
+        def emit(out: np.ndarray) -> bool:
+            nonlocal frames
+            try:
+                encoder.stdin.write(out.data)
+            except BrokenPipeError:
+                # Encoder died; stop decoding and report its stderr below
+                decoder.kill()
+                return False
+            frames += 1
+            progress("render", start + span * min(1.0, frames / total))
+            return True
+
+        try:
+            alive = True
+            frame = None
+            while alive:
+                # Serial renders reuse one buffer; parallel ones need a buffer per in-flight frame
+                if frame is None or pool is not None:
+                    frame = np.empty((height, width, 3), dtype=np.uint8)
+                if not _read_frame(decoder.stdout, frame):
+                    break
+                if pool is None:
+                    alive = emit(_apply(draw, decoded, frame, total))
+                else:
+                    pending.append(pool.submit(_apply, draw, decoded, frame, total))
+                    # Bounded window keeps memory at ~2 frames per worker
+                    while alive and len(pending) >= 2 * workers:
+                        alive = emit(pending.popleft().result())
+                decoded += 1
+            while alive and pending:
+                alive = emit(pending.popleft().result())
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            encoder_rc = encoder.wait()
+            decoder_rc = decoder.wait()
+        except BaseException:
+            decoder.kill()
+            encoder.kill()
+            decoder.wait()
+            encoder.wait()
+            raise
+        finally:
+            decoder.stdout.close()
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        _check_ffmpeg(encoder_rc, encode_err, decoder_rc, decode_err)
+    return RenderStats(frames, width, height)
+
+
+def _check_ffmpeg(encoder_rc: int, encode_err, decoder_rc: int, decode_err) -> None:
+    # Encoder first: when it dies the decoder is killed and its status says nothing
+    for rc, err, what in ((encoder_rc, encode_err, "encode"), (decoder_rc, decode_err, "decode")):
+        if rc != 0:
+            err.seek(0)
+            raise RuntimeError(f"ffmpeg {what} failed ({rc}): {err.read().decode(errors='replace').strip()}")
+
+
+def _multi_encode_cmd(width: int, height: int, fps: float, outputs: Sequence[Tuple[str, Optional[str]]]) -> List[str]:
+    """One ffmpeg encoder reading rawvideo on stdin and writing every (path, filter) output."""
+    graph = [f"[0:v]split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs)))]
+    for i, (_dst, vf) in enumerate(outputs):
+        # yuv420p needs even dimensions
+        graph.append(f"[s{i}]" + (f"{vf}," if vf else "") + f"pad=ceil(iw/2)*2:ceil(ih/2)*2[o{i}]")
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-framerate", str(fps), "-i", "-",
+        "-filter_complex", ";".join(graph),
+    ]
+    for i, (dst, _vf) in enumerate(outputs):
+        cmd += ["-map", f"[o{i}]", "-c:v", "libx264", "-preset", RENDER_X264_PRESET, "-pix_fmt", "yuv420p", dst]
+    return cmd
+
+
+def render_batched(src: str, outputs: Sequence[Tuple[str, Optional[str]]], fps: float, draw_batch: BatchFn,
+                   batch_size: int, out_size: Optional[Tuple[int, int]] = None, progress=no_progress,
+                   start: float = 15, span: float = 75) -> RenderStats:
+    """Decode ``src`` at ``fps`` and pass BGR frames to ``draw_batch`` ``batch_size`` at a time.
+
+    For models that want whole batches (detection) rather than one frame at a
+    time. ``draw_batch`` returns frames of ``out_size`` (width, height; default
+    the input size), which a single ffmpeg encoder writes to every
+    ``(path, filter)`` in ``outputs`` — e.g. a crop filter to split a
+    side-by-side frame into its halves. Returns the decoded frame count and
+    input size.
+    """
+    info = probe_video(src)
+    width, height = info.width, info.height
+    out_width, out_height = out_size or (width, height)
+    total = expected_frame_count(info, fps)
+    batch_size = max(1, batch_size)
+
+    decode_cmd = [
+        "ffmpeg", "-v", "error", "-i", src,
+        "-vf", f"fps={fps}", "-f", "rawvideo", "-pix_fmt", "bgr24", "-",
+    ]
+    encode_cmd = _multi_encode_cmd(out_width, out_height, fps, outputs)
+    with tempfile.TemporaryFile() as decode_err, tempfile.TemporaryFile() as encode_err:
+        decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=decode_err, bufsize=0)
+        encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=encode_err)
+        frames = 0
+        try:
+            alive = True
+            while alive:
+                batch = []
+                while len(batch) < batch_size:
+                    frame = np.empty((height, width, 3), dtype=np.uint8)
+                    if not _read_frame(decoder.stdout, frame):
+                        break
+                    batch.append(frame)
+                if not batch:
+                    break
+                outs = draw_batch(frames, batch)
+                if len(outs) != len(batch):
+                    raise ValueError(f"draw_batch returned {len(outs)} frames for a batch of {len(batch)}")
+                for out in outs:
+                    if out.shape != (out_height, out_width, 3) or out.dtype != np.uint8:
+                        raise ValueError(f"draw_batch returned {out.dtype}{out.shape}, "
+                                         f"expected uint8{(out_height, out_width, 3)}")
+                    try:
+                        encoder.stdin.write(np.ascontiguousarray(out).data)
+                    except BrokenPipeError:
+                        decoder.kill()
+                        alive = False
+                        break
+                frames += len(batch)
+                progress("render", start + span * min(1.0, frames / total))
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            encoder_rc = encoder.wait()
+            decoder_rc = decoder.wait()
+        except BaseException:
+            decoder.kill()
+            encoder.kill()
+            decoder.wait()
+            encoder.wait()
+            raise
+        finally:
+            decoder.stdout.close()
+        _check_ffmpeg(encoder_rc, encode_err, decoder_rc, decode_err)
+    return RenderStats(frames, width, height)
@@ -0,0 +1,235 @@
+import io
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import zipfile
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from parquet_window import filesystem
+
+# s3fs read-ahead block for mask ZIPs: one ranged GET covers many consecutive members
+MASK_ZIP_BLOCK_SIZE = int(os.getenv("MASK_ZIP_BLOCK_SIZE", str(8 * 1024 ** 2)))
+
+# Compact binary-mask container (.bitmask):
+#   magic | uint32 LE header length | JSON header | frame payloads
+# header = {"frames", "height", "width", "codec": "zlib"|"raw", "offsets": [n + 1 payload offsets],
+#           "source_etag": ETag of the ZIP it was converted from (optional)}
+# Each payload is one frame bit-packed along the width (np.packbits), optionally
+# zlib-compressed, so any frame is a single ranged read and ~1/8 of a uint8 mask
+# before compression.
+BITMASK_SUFFIX = ".bitmask"
+BITMASK_MAGIC = b"BITMASK1"
+# S3 user metadata on a converted .bitmask: the source ZIP's ETag, checked before the sibling is preferred
+SOURCE_ETAG_METADATA = "source-etag"
+
+
+def natural_key(name: str):
+    """Sort key for "2.npy" < "10.npy": by basename with digit runs compared as numbers, then path."""
+    base = os.path.basename(name)
+    parts = re.split(r"(\d+)", base)
+    return [int(p) if p.isdigit() else p.lower() for p in parts], name
+
+
+class NpyZipMasks:
+    """The .npy members of a ZIP as a lazily loaded, naturally ordered sequence.
+
+    Only the central directory is read up front; ``masks[i]`` decompresses one
+    member. Nested folders are flattened as before. Safe to index from several
+    render threads.
+    """
+
+    def __init__(self, fileobj):
+        self._zip = zipfile.ZipFile(fileobj)
+        self._lock = threading.Lock()
+        self.names: List[str] = sorted(
+            (info.filename for info in self._zip.infolist()
+             if not info.is_dir() and info.filename.lower().endswith(".npy")),
+            key=natural_key,
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        with self._lock:
+            data = self._zip.read(self.names[index])
+        return np.load(io.BytesIO(data), allow_pickle=False)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+class BitmaskMasks:
+    """Frames of a .bitmask container as a lazily loaded sequence of 0/1 uint8 arrays."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._f = fileobj
+        self._lock = threading.Lock()
+        magic = fileobj.read(len(BITMASK_MAGIC))
+        if magic != BITMASK_MAGIC:
+            raise ValueError("not a bitmask container")
+        (header_len,) = struct.unpack("<I", fileobj.read(4))
+        header = json.loads(fileobj.read(header_len))
+        self.height, self.width = int(header["height"]), int(header["width"])
+        self.codec = header.get("codec", "zlib")
+        self.offsets = header["offsets"]
+        self._data_start = len(BITMASK_MAGIC) + 4 + header_len
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        with self._lock:
+            self._f.seek(self._data_start + start)
+            payload = self._f.read(end - start)
+        if self.codec == "zlib":
+            payload = zlib.decompress(payload)
+        packed = np.frombuffer(payload, dtype=np.uint8).reshape(self.height, -1)
+        return np.unpackbits(packed, axis=-1, count=self.width)
+
+    def close(self) -> None:
+        pass
+
+
+def write_bitmask(masks: Iterable[np.ndarray], out: BinaryIO, codec: str = "zlib",
+                  source_etag: Optional[str] = None) -> dict:
+    """Write 2-D masks (non-zero = set) as a .bitmask container; all frames must share one shape."""
+    payloads, shape = [], None
+    for mask in masks:
+        mask = np.squeeze(np.asarray(mask))
+        if mask.ndim != 2:
+            raise ValueError(f"expected a 2-D mask, got shape {mask.shape}")
+        if shape is None:
+            shape = mask.shape
+        elif mask.shape != shape:
+            raise ValueError(f"mask shape {mask.shape} differs from first frame {shape}")
+        payload = np.packbits(mask > 0, axis=-1).tobytes()
+        payloads.append(zlib.compress(payload, 6) if codec == "zlib" else payload)
+    height, width = shape or (0, 0)
+    offsets = [0]
+    for payload in payloads:
+        offsets.append(offsets[-1] + len(payload))
+    fields = {"frames": len(payloads), "height": height, "width": width, "codec": codec, "offsets": offsets}
+    if source_etag:
+        fields["source_etag"] = source_etag
+    header = json.dumps(fields).encode()
+    out.write(BITMASK_MAGIC + struct.pack("<I", len(header)) + header)
+    for payload in payloads:
+        out.write(payload)
+    return {"frames": len(payloads), "height": height, "width": width,
+            "bytes": len(BITMASK_MAGIC) + 4 + len(header) + offsets[-1]}
+
+
+def convert_npy_zip(src: BinaryIO, out: BinaryIO, codec: str = "zlib", source_etag: Optional[str] = None) -> dict:
+    """Convert a ZIP of per-frame .npy masks into a .bitmask container, in natural frame order.
+
+    ``source_etag`` (the ZIP's ETag) is recorded in the header.
+    """
+    masks = NpyZipMasks(src)
+    try:
+        return write_bitmask((masks[i] for i in range(len(masks))), out, codec, source_etag)
+    finally:
+        masks.close()
+
+
+def bitmask_key(zip_key: str) -> str:
+    """Key of the compact sibling written next to a ZIP-of-NPY result."""
+    base = zip_key[:-4] if zip_key.lower().endswith(".zip") else zip_key.rstrip("/")
+    return base + BITMASK_SUFFIX
+
+
+def _same_etag(a: Optional[str], b: Optional[str]) -> bool:
+    return bool(a) and bool(b) and a.strip('"') == b.strip('"')
+
+
+def _current_sibling(s3, bucket: str, zip_key: str, zip_etag: str) -> Optional[Tuple[str, str]]:
+    """(key, ETag) of the .bitmask converted from this exact ZIP version, else None.
+
+    A sibling converted from an older upload of the ZIP (or without a recorded
+    source ETag) is stale and ignored.
+    """
+    compact = bitmask_key(zip_key)
+    try:
+        head = s3.head_object(Bucket=bucket, Key=compact)
+    except Exception:
+        return None
+    if not _same_etag((head.get("Metadata") or {}).get(SOURCE_ETAG_METADATA), zip_etag):
+        return None
+    return compact, head["ETag"]
+
+
+def resolve_mask_key(s3, bucket: str, key: str, prefer_compact: bool = True) -> Tuple[str, str]:
+    """(key, ETag) of the mask file to read for a result path.
+
+    Accepts a .bitmask or .zip key, or a folder holding one. With
+    ``prefer_compact`` a .bitmask sibling of a ZIP is used when it was
+    converted from the ZIP's current version.
+    """
+    if key.lower().endswith(BITMASK_SUFFIX):
+        return key, s3.head_object(Bucket=bucket, Key=key)["ETag"]
+    if key.lower().endswith(".zip"):
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+        return (prefer_compact and _current_sibling(s3, bucket, key, etag)) or (key, etag)
+    prefix = key.rstrip("/") + "/"
+    resp = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
+    zip_item: Optional[dict] = None
+    compact_item: Optional[dict] = None
+    for item in resp.get("Contents", []):
+        k = (item.get("Key") or "").lower()
+        if k.endswith(BITMASK_SUFFIX) and compact_item is None:
+            compact_item = item
+        if k.endswith(".zip") and zip_item is None:
+            zip_item = item
+    if zip_item is not None:
+        if prefer_compact:
+            sibling = _current_sibling(s3, bucket, zip_item["Key"], zip_item["ETag"])
+            if sibling is not None:
+                return sibling
+        return zip_item["Key"], zip_item["ETag"]
+    if prefer_compact and compact_item is not None:
+        # A standalone .bitmask (no ZIP to go stale against)
+        return compact_item["Key"], compact_item["ETag"]
+    raise FileNotFoundError(f"no mask zip under {bucket}/{key}")
+
+
+@contextmanager
+def open_masks(bucket: str, key: str):
+    """Lazily loaded masks of s3://bucket/key, a .bitmask container or a ZIP of .npy files."""
+    if not key.lower().endswith(BITMASK_SUFFIX):
+        with open_npy_zip(bucket, key) as masks:
+            yield masks
+        return
+    # Ranged reads: each frame is one small read, the read-ahead block covers its neighbours
+    with filesystem().open(f"{bucket}/{key}", "rb", block_size=MASK_ZIP_BLOCK_SIZE, cache_type="readahead") as f:
+        yield BitmaskMasks(f)
+
+
+@contextmanager
+def open_npy_zip(bucket: str, key: str):
+    """NpyZipMasks over s3://bucket/key, fetched with ranged reads as members are used.
+
+    Rendering starts once the central directory is in; masks are never
+    written to disk and at most one read-ahead block is held in memory.
+    """
+    with filesystem().open(f"{bucket}/{key}", "rb", block_size=MASK_ZIP_BLOCK_SIZE, cache_type="readahead") as f:
+        masks = NpyZipMasks(f)
+        try:
+            yield masks
+        finally:
+            masks.close()
+
+
+if __name__ == "__main__":
+    # python -m visualization.mask_source masks.zip masks.bitmask
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m visualization.mask_source SRC.zip DST.bitmask")
+    with open(sys.argv[1], "rb") as src, open(sys.argv[2], "wb") as dst:
+        print(convert_npy_zip(src, dst))
@@ -0,0 +1,205 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Rendered overlays live under the static mount so cached results are served as-is
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "/app/data/saved_video/viz")
+# Renders not requested for this long are deleted (seconds)
+RENDER_CACHE_MAX_AGE = float(os.getenv("RENDER_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# Oldest renders are deleted beyond this many bytes
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(10 * 1024 ** 3)))
+# Per-key lock files, kept outside the static mount
+RENDER_CACHE_LOCK_DIR = os.getenv("RENDER_CACHE_LOCK_DIR", "/app/data/cache/render-locks")
+
+RESULT_FILE = "result.json"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+
+def _bump(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def render_key(renderer: str, version: int, inputs: dict) -> str:
+    """Stable id for a render: renderer + version + everything that changes the output."""
+    text = json.dumps({"renderer": renderer, "version": version, **inputs}, sort_keys=True, default=str)
+    return f"{renderer}-{hashlib.sha1(text.encode()).hexdigest()[:24]}"
+
+
+def _load_result(work_dir: str) -> Optional[dict]:
+    path = os.path.join(work_dir, RESULT_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)["result"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    try:
+        # mtime of the result file is the entry's last use, for age/LRU eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return result
+
+
+@contextmanager
+def _key_lock(lock_dir: str, key: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+    """flock on ``lock_dir/key.lock``; yields False when ``blocking`` is off and the lock is busy.
+
+    ``shared`` locks are for readers of a finished entry: any number can hold
+    one, and they keep out renders and evictions (which lock exclusively).
+
+    Lock files are unlinked when their entry goes away, so after locking the
+    file is checked to still be the one at the path; a waiter that locked an
+    unlinked file retries on the new one instead of rendering alongside it.
+    """
+    path = os.path.join(lock_dir, f"{key}.lock")
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        mode |= fcntl.LOCK_NB
+    while True:
+        with open(path, "a") as lock:
+            try:
+                fcntl.flock(lock, mode)
+            except OSError:
+                yield False
+                return
+            try:
+                current = os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                yield True
+                return
+
+
+def _unlink_lock(lock_dir: str, key: str) -> None:
+    """Remove a key's lock file; call while holding it."""
+    try:
+        os.remove(os.path.join(lock_dir, f"{key}.lock"))
+    except OSError:
+        pass
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _d, files in os.walk(path) for f in files)
+
+
+def _write_result(work_dir: str, result: dict) -> None:
+    record = {"result": result, "bytes": _dir_bytes(work_dir), "rendered_at": time.time()}
+    path = os.path.join(work_dir, RESULT_FILE)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, default=str)
+    # The result file appears last and atomically: its presence marks a complete render
+    os.replace(tmp, path)
+
+
+def evict(root: str = RENDER_CACHE_DIR, max_age: float = RENDER_CACHE_MAX_AGE,
+          disk_bytes: int = RENDER_CACHE_DISK_BYTES, keep: Optional[str] = None,
+          lock_dir: str = RENDER_CACHE_LOCK_DIR) -> int:
+    """Delete renders older than ``max_age``, then least recently used ones beyond ``disk_bytes``.
+
+    Each entry goes together with its lock file.
+    """
+    entries = []
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if name == keep:
+            continue
+        if name.endswith(".lock"):
+            # Lock files used to live next to the entries, under the static mount
+            with _key_lock(root, name[:-len(".lock")], blocking=False) as locked:
+                if locked:
+                    _unlink_lock(root, name[:-len(".lock")])
+            continue
+        path = os.path.join(root, name, RESULT_FILE)
+        try:
+            used_at = os.stat(path).st_mtime
+            with open(path, "r", encoding="utf-8") as f:
+                size = int(json.load(f).get("bytes") or 0)
+        except (OSError, ValueError):
+            continue
+        entries.append((used_at, name, size))
+    entries.sort()
+    total = sum(size for _, _, size in entries)
+    if keep is not None:
+        total += _dir_bytes(os.path.join(root, keep))
+    now = time.time()
+    removed = 0
+    for used_at, name, size in entries:
+        if now - used_at <= max_age and total <= disk_bytes:
+            break
+        with _key_lock(lock_dir, name, blocking=False) as locked:
+            # Skip entries another request is rendering or reading right now
+            if not locked:
+                continue
+            try:
+                # ...or has used since the listing above
+                if os.stat(os.path.join(root, name, RESULT_FILE)).st_mtime != used_at:
+                    continue
+            except OSError:
+                pass
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            _unlink_lock(lock_dir, name)
+        total -= size
+        removed += 1
+        _bump("evictions")
+    return removed
+
+
+def cached_render(key: str, render: Callable[[str], dict], root: str = RENDER_CACHE_DIR,
+                  lock_dir: str = RENDER_CACHE_LOCK_DIR) -> dict:
+    """Return the stored result for ``key``, rendering into ``root/key`` on a miss.
+
+    ``render(work_dir)`` writes its output under work_dir and returns the JSON
+    result (URLs included). Identical concurrent requests, in this process or
+    in job workers, wait on a per-key file lock and reuse the first render.
+    Cached results carry ``"cached": true``.
+    """
+    work_dir = os.path.join(root, key)
+    if os.path.exists(os.path.join(work_dir, RESULT_FILE)):
+        os.makedirs(lock_dir, exist_ok=True)
+        # Shared lock: evict() cannot delete the entry while it is read and touched
+        with _key_lock(lock_dir, key, shared=True):
+            result = _load_result(work_dir)
+        if result is not None:
+            _bump("hits")
+            return dict(result, cached=True)
+
+    os.makedirs(root, exist_ok=True)
+    os.makedirs(lock_dir, exist_ok=True)
+    with _key_lock(lock_dir, key):
+        result = _load_result(work_dir)
+        if result is not None:
+            _bump("coalesced")
+            return dict(result, cached=True)
+        _bump("misses")
+        # Leftovers of a crashed render have no result file; start clean
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        try:
+            result = render(work_dir)
+            _write_result(work_dir, result)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            _unlink_lock(lock_dir, key)
+            raise
+    evict(root, keep=key, lock_dir=lock_dir)
+    return result
+
+
+def render_cache_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
@@ -6,6 +6,9 @@ from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 
+from executors import run_blocking
+from uploads import save_upload
+
 
 STATIC_DIR = "/app/data/saved_video"
 
@@ -27,15 +30,16 @@ async def extract_frames(
     _ensure_dir(frames_dir)
 
     input_path = os.path.join(work_dir, "input.mp4")
-    with open(input_path, "wb") as f:
-        f.write(await video.read())
+    await save_upload(video, input_path)
 
     cmd = [
         "ffmpeg", "-y", "-i", input_path, "-vf", f"fps={max(1,int(fps))}",
         os.path.join(frames_dir, "frame_%05d.jpg"),
     ]
     try:
-        subprocess.run(cmd, check=True)
+        await run_blocking("media", subprocess.run, cmd, check=True)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ffmpeg failed: {e}")
 
@@ -116,23 +116,25 @@ export const fetchJsonFromS3 = async ({ s3_path, bucket, key }) => {
   }
 };
 
-// Download any S3 object via backend proxy (binary response)
+// Download any S3 object via backend proxy (streamed; the browser downloads it directly and can resume)
 export const downloadS3Object = async ({ bucket, key, filename }) => {
+  const name = filename || (key.split('/').pop()) || 'download.bin';
+  const params = new URLSearchParams({ bucket, key, filename: name });
+  const url = `${API_BASE_URL}/api/s3/download-object?${params.toString()}`;
   try {
-    const response = await axios.post(`${API_BASE_URL}/api/s3/download-object`, { bucket, key, filename }, { responseType: 'blob' });
-    const url = window.URL.createObjectURL(new Blob([response.data]));
-    const link = document.createElement('a');
-    link.href = url;
-    link.setAttribute('download', filename || (key.split('/').pop()) || 'download.bin');
-    document.body.appendChild(link);
-    link.click();
-    link.remove();
-    window.URL.revokeObjectURL(url);
-    return { success: true };
+    // Check first: a failed link click would save the error body under the filename instead of throwing
+    await axios.head(url);
   } catch (error) {
     console.error('Error downloading S3 object:', error);
     throw error;
   }
+  const link = document.createElement('a');
+  link.href = url;
+  link.setAttribute('download', name);
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+  return { success: true };
 };
 
 // Render server-side overlaid video given S3 video and yolov10.json